@@ -0,0 +1,72 @@
+"""
+Vectorized Reducing Balance amortization.
+
+Array counterpart of `calculate_dynamic_emi` in app.py: every argument may be a
+scalar or an array and the result is a dict of NumPy columns, so a whole page of
+loans (or every paid EMI in the fund) is priced in a single call.
+
+Formula (per loan, per month):
+    Principal Constant = Loan Amount / Total Months
+    Remaining Principal (start of month) = Loan Amount - Principal Constant * (Month No - 1)
+    Interest for Month = Remaining Principal * Interest Rate / 100
+    Total EMI = Principal Constant + Interest for Month
+"""
+import numpy as np
+
+
+def _columns(*values):
+    return [np.asarray(v, dtype=float) for v in values]
+
+
+def amortize(loan_amount, total_months, interest_rate_percent, month_no, principal_constant=None):
+    """
+    Prices one month for each loan.
+
+    `principal_constant` overrides Loan Amount / Total Months, for callers that
+    work with the stored (rounded) `loans.principal_portion` instead.
+    Months past the end of the term come back as zeros with `active` False,
+    where the scalar function returns None.
+    """
+    loan_amount, total_months, interest_rate_percent, month_no = _columns(
+        loan_amount, total_months, interest_rate_percent, month_no)
+    if principal_constant is None:
+        principal_constant = loan_amount / total_months
+    else:
+        principal_constant = np.asarray(principal_constant, dtype=float)
+
+    active = month_no <= total_months
+    remaining_principal_start = np.maximum(loan_amount - principal_constant * (month_no - 1), 0)
+    interest_amount = remaining_principal_start * interest_rate_percent / 100
+    total_emi = principal_constant + interest_amount
+
+    return {
+        "month": month_no,
+        "active": active,
+        "principal_component": np.where(active, principal_constant, 0.0),
+        "interest_component": np.where(active, interest_amount, 0.0),
+        "total_emi": np.where(active, total_emi, 0.0),
+        "remaining_principal_start": np.where(active, remaining_principal_start, 0.0),
+    }
+
+
+def schedules(loan_amount, total_months, interest_rate_percent):
+    """
+    Generates the full month-by-month schedule for many loans at once.
+
+    Returns flat columns with one entry per (loan, month); `loan_index` points
+    back into the input arrays. Rows are grouped by loan, months ascending.
+    """
+    loan_amount, interest_rate_percent = _columns(loan_amount, interest_rate_percent)
+    total_months = np.asarray(total_months, dtype=np.int64)
+
+    loan_index = np.repeat(np.arange(total_months.size), total_months)
+    # 1..n within each loan: global position minus the offset where the loan starts
+    starts = np.cumsum(total_months) - total_months
+    month_no = np.arange(loan_index.size) - np.repeat(starts, total_months) + 1
+
+    columns = amortize(loan_amount[loan_index], total_months[loan_index],
+                       interest_rate_percent[loan_index], month_no)
+    columns["loan_index"] = loan_index
+    columns["remaining_principal_end"] = np.maximum(
+        columns["remaining_principal_start"] - columns["principal_component"], 0)
+    return columns
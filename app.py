@@ -1,14 +1,58 @@
-import sqlite3
-import pandas as pd
-from flask import Flask, render_template, request, redirect, session, url_for, g, flash
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, date
+from flask import Flask, render_template, request, redirect, session, url_for, g, flash, jsonify, has_request_context
+from datetime import datetime, date, timedelta
+import functools
+import hmac
+import json
 import os
-from werkzeug.utils import secure_filename
+import queue
+import fund_ledger
+import forecast
+import amortization
+import backup_db
+import bulk_import
+import migrate
+import storage
+import pagination
+import jobs
+import journal
+import loan_schedule
+import sync_manager
+import proofs
+import tasks  # registers the background job handlers
+import uploads
+import cache
+import chat_broker
+import contribution_masks
+import data_versions
+import instrumentation
+import auth
+import tenants
 
 app = Flask(__name__)
 app.secret_key = "super_secret_key"
 DATABASE = 'database.db'
+# SQLite file path or postgresql:// URL, see storage.py
+app.config['DATABASE_URL'] = os.environ.get('DATABASE_URL', DATABASE)
+# Background job worker threads in this process (0: run `python jobs.py work` separately)
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+# Run queued jobs before the request returns (used by the verify scripts)
+app.config['JOBS_INLINE'] = False
+# Seconds between incremental SQLite snapshots taken on the job queue (0: off, see backup_db.py)
+app.config['BACKUP_INTERVAL'] = int(os.environ.get('BACKUP_INTERVAL', 900))
+# Seconds between checks for a new month to snapshot in the money journal (0: off, see journal.py)
+app.config['SNAPSHOT_INTERVAL'] = int(os.environ.get('SNAPSHOT_INTERVAL', 3600))
+# Seconds between spreadsheet syncs of the changed rows on the job queue (0: off, see sync_manager.py)
+app.config['SHEET_SYNC_INTERVAL'] = int(os.environ.get('SHEET_SYNC_INTERVAL', 60))
+# Per-route and per-query timing for /admin/metrics (see instrumentation.py); INSTRUMENTATION=0 turns it off
+app.config['INSTRUMENTATION'] = os.environ.get('INSTRUMENTATION', '1') != '0'
+# Lets a Prometheus scraper read /admin/metrics with "Authorization: Bearer <token>" instead of an admin login
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Adds a Server-Timing header (database time and query count) to every response, read by benchmark.py
+app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING') == '1'
+# Serve many groups, one database each, picked by subdomain or path prefix (see tenants.py); unset: DATABASE_URL only
+app.config['TENANT_MODE'] = tenants.MODE
+# Job worker threads per open group in TENANT_MODE (JOB_WORKERS applies to a single-group deployment)
+app.config['TENANT_JOB_WORKERS'] = int(os.environ.get('TENANT_JOB_WORKERS', 1))
 
 # File Upload Configuration
 UPLOAD_FOLDER = 'static/uploads/payment_proofs'
@@ -22,30 +66,166 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
+if app.config['TENANT_MODE']:
+    app.wsgi_app = tenants.TenantMiddleware(app.wsgi_app, app.config['TENANT_MODE'])
+    app.session_interface = tenants.SessionInterface()
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def current_tenant():
+    return tenants.current() if has_request_context() else None
+
+def database_url():
+    """The database of the current request: its group's in TENANT_MODE, else DATABASE_URL."""
+    tenant = current_tenant()
+    return tenant.database_url if tenant else app.config['DATABASE_URL']
+
+def get_backend():
+    return storage.get_backend(database_url())
+
 def get_db():
-    db = getattr(g, '_database', None)
+    db = getattr(g, '_db', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        # Connections are pooled and reused across requests (see storage.py / db_pool.py)
+        g._backend, conn = storage.checkout(database_url())
+        g._database = conn
+        trace = getattr(g, '_trace', None)
+        db = g._db = instrumentation.InstrumentedConnection(conn, trace) if trace else conn
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
     db = getattr(g, '_database', None)
     if db is not None:
-        db.close()
+        g._backend.checkin(db)
+
+@app.before_request
+def open_tenant():
+    tenant = current_tenant()
+    if tenant is not None:
+        tenants.open_tenant(tenant, lambda tenant: start_job_workers())
+
+@app.before_request
+def start_trace():
+    if app.config['INSTRUMENTATION']:
+        g._trace = instrumentation.RequestTrace()
+
+@app.after_request
+def record_status(response):
+    if app.config['INSTRUMENTATION']:
+        g._status = response.status_code
+        if app.config['SERVER_TIMING'] and getattr(g, '_trace', None):
+            response.headers["Server-Timing"] = instrumentation.server_timing(g._trace)
+    return response
+
+@app.teardown_request
+def finish_trace(exception):
+    trace = getattr(g, '_trace', None)
+    if trace is not None:
+        route = request.url_rule.rule if request.url_rule else "(unmatched)"
+        instrumentation.registry.finish(trace, route, request.method, getattr(g, '_status', 500))
 
 def init_db():
     with app.app_context():
         db = get_db()
-        with open('schema.sql', mode='r') as f:
-            db.cursor().executescript(f.read())
+        with open(storage.schema_file(db), mode='r') as f:
+            db.executescript(f.read())
         db.commit()
+        # schema.sql is already current: record the migrations as applied, none of them runs
+        migrate.stamp_current(db)
     print("Initialized the database.")
 
+def migrate_database():
+    # Bring an existing database up to date on startup (see migrate.py)
+    url = app.config['DATABASE_URL']
+    if storage.is_postgres_url(url) or os.path.exists(storage.sqlite_path(url)):
+        with app.app_context():
+            for version in migrate.apply_migrations(get_db()):
+                print(f"Applied migration {version}")
+
+migrate_database()
+
+def start_job_workers():
+    url = database_url()
+    tenant = current_tenant()
+    jobs.start_workers(url, app.config['TENANT_JOB_WORKERS'] if tenant else app.config['JOB_WORKERS'])
+    if app.config['BACKUP_INTERVAL'] and not storage.is_postgres_url(url):
+        jobs.schedule(url, "backup", app.config['BACKUP_INTERVAL'], backup_payload())
+    if app.config['SNAPSHOT_INTERVAL']:
+        jobs.schedule(url, "journal_snapshots", app.config['SNAPSHOT_INTERVAL'])
+    if app.config['SHEET_SYNC_INTERVAL']:
+        jobs.schedule(url, "sheet_sync", app.config['SHEET_SYNC_INTERVAL'], sheet_sync_payload())
+
+def backup_payload():
+    tenant = current_tenant()
+    return {"dir": tenants.data_dir(backup_db.BACKUP_DIR, tenant)} if tenant else {}
+
+def sheet_sync_payload():
+    # Each group gets its own workbook; a Google Sheet target is shared config, so groups keep a local one
+    tenant = current_tenant()
+    if tenant:
+        return {"target": os.path.join(tenants.data_dir(tasks.EXPORT_DIR, tenant), sync_manager.LOCAL_EXCEL_FILE)}
+    return {}
+
+def dispatch(kind, payload=None, idempotency_key=None):
+    """Queues a background job (see jobs.py and tasks.py) and returns it."""
+    db = get_db()
+    job = jobs.enqueue(db, kind, payload, idempotency_key)
+    if app.config['JOBS_INLINE']:
+        jobs.run_pending(db)
+        return jobs.get_job(db, job['id'])
+    start_job_workers()
+    return job
+
+# Resume jobs left queued by a previous run (a group's resume when it is next opened)
+if not app.config['TENANT_MODE'] and (os.path.exists(storage.sqlite_path(app.config['DATABASE_URL'])) or storage.is_postgres_url(app.config['DATABASE_URL'])):
+    start_job_workers()
+
+def page_cache():
+    """Cache of rendered read-heavy pages for this database (see cache.py)."""
+    return cache.for_db(get_db())
+
+def current_user():
+    """
+    The logged-in member (auth.Principal) or None. Read through the page cache
+    once per request; a session whose member was removed or deactivated ends here.
+    """
+    if "_user" not in g:
+        member_id = session.get("user_id")
+        tenant = current_tenant()
+        if member_id is not None and session.get("tenant") != (tenant.slug if tenant else None):
+            member_id = None  # signed in to another group on this host
+        user = auth.load_principal(get_db(), member_id) if member_id is not None else None
+        if member_id is not None and (user is None or not user.active):
+            session.clear()
+            user = None
+        g._user = user
+    return g._user
+
+def denied(status):
+    # /api/ routes answer in JSON, pages send the browser to the login form
+    if request.path.startswith("/api/"):
+        return jsonify({"error": "login required" if status == 401 else "admin only"}), status
+    return redirect(url_for("login"))
+
+def login_required(view):
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        if current_user() is None:
+            return denied(401)
+        return view(*args, **kwargs)
+    return wrapped
+
+def admin_required(view):
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        user = current_user()
+        if user is None or not user.is_admin:
+            return denied(401 if user is None else 403)
+        return view(*args, **kwargs)
+    return wrapped
+
 def format_currency(value):
     return f"₹{value:,.2f}"
 
@@ -79,6 +259,66 @@ def calculate_dynamic_emi(loan_amount, total_months, interest_rate_percent, mont
         "remaining_principal_start": remaining_principal_start
     }
 
+def fetch_loans_with_progress(db, where="1=1", params=(), order_by="l.loan_id"):
+    """
+    Loads loans (with member name) and their paid-month count in one query.
+    `where` / `order_by` are SQL fragments over the `l` (loans) and `m` (members) aliases.
+    """
+    query = f"""
+        SELECT l.*, m.name, COALESCE(pc.paid_months, 0) AS paid_months
+        FROM loans l
+        JOIN members m ON l.member_id = m.member_id
+        LEFT JOIN (
+            SELECT p.loan_id, COUNT(*) AS paid_months
+            FROM interest_payments p
+            JOIN loans l ON p.loan_id = l.loan_id
+            JOIN members m ON l.member_id = m.member_id
+            WHERE p.status = 'paid' AND {where}
+            GROUP BY p.loan_id
+        ) pc ON pc.loan_id = l.loan_id
+        WHERE {where}
+        ORDER BY {order_by}
+    """
+    return db.execute(query, tuple(params) * 2).fetchall()
+
+def repayment_progress(loans):
+    """
+    Derives repayment progress for rows returned by fetch_loans_with_progress.
+    Returns a list of loan dicts plus months_paid, dynamic_remaining_balance,
+    next_payment_month, next_emi_amount and current_interest_portion.
+    All loans are priced in one vectorized amortization call.
+    """
+    if not loans:
+        return []
+
+    paid_months = [loan['paid_months'] for loan in loans]
+    next_month = [paid + 1 for paid in paid_months]
+    emi_calc = amortization.amortize([loan["amount"] for loan in loans],
+                                     [loan["total_months"] for loan in loans],
+                                     [loan["interest_rate_percent"] for loan in loans],
+                                     next_month)
+
+    loans_display = []
+    for i, loan in enumerate(loans):
+        l_dict = dict(loan)
+        l_dict['months_paid'] = paid_months[i]
+
+        current_balance = loan['amount'] - (loan['principal_portion'] * paid_months[i])
+        if current_balance < 0: current_balance = 0
+        l_dict['dynamic_remaining_balance'] = current_balance
+
+        l_dict['next_payment_month'] = next_month[i]
+        if loan['status'] == 'approved' and loan['repayment_status'] == 'open':
+            l_dict['next_emi_amount'] = float(emi_calc["total_emi"][i])
+            l_dict['current_interest_portion'] = float(emi_calc["interest_component"][i])
+        else:
+            l_dict['next_emi_amount'] = 0
+            l_dict['current_interest_portion'] = 0
+
+        l_dict['current_emi_amount'] = l_dict['next_emi_amount']
+        loans_display.append(l_dict)
+    return loans_display
+
 # --- ROUTES ---
 
 @app.route("/")
@@ -90,15 +330,15 @@ def init():
     init_db()
     # Create Admin if not exists
     db = get_db()
-    cur = db.cursor()
     try:
-        cur.execute("INSERT INTO members (name, username, password, role, join_date) VALUES (?, ?, ?, ?, ?)",
-                    ("Super Admin", "admin", "admin123", "admin", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        db.execute("INSERT INTO members (name, username, password, role, join_date) VALUES (?, ?, ?, ?, ?)",
+                   ("Super Admin", "admin", auth.hash_password("admin123"), "admin", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
         # Initialize Fund
-        cur.execute("INSERT INTO fund (id, total_balance) VALUES (1, 20000)")
+        fund_ledger.record_starting_fund(db, 20000)
         db.commit()
         return "Database initialized. Admin user created (admin/admin123)."
-    except sqlite3.IntegrityError:
+    except db.IntegrityError:
+        db.rollback()
         return "Database already initialized."
 
 @app.route("/login", methods=["GET", "POST"])
@@ -108,12 +348,18 @@ def login():
         password = request.form["password"]
         
         db = get_db()
-        user = db.execute("SELECT * FROM members WHERE username = ?", (username,)).fetchone()
+        try:
+            user = auth.authenticate(db, username, password)
+        except auth.Busy:
+            return render_template("login.html", error="Too many logins right now, please try again in a moment."), 503
         
-        if user and user["password"] == password:
-            session["user_id"] = user["member_id"]
-            session["role"] = user["role"]
-            session["name"] = user["name"]
+        if user:
+            db.commit()  # keeps the hash when a plaintext or outdated one was just replaced
+            session.clear()
+            session["user_id"] = user.member_id
+            if current_tenant():
+                session["tenant"] = current_tenant().slug
+            g._user = user
             return redirect(url_for("dashboard"))
         else:
             return render_template("login.html", error="Invalid credentials")
@@ -127,62 +373,21 @@ def logout():
 
 
 @app.route("/dashboard")
+@login_required
 def dashboard():
-    if "user_id" not in session:
-        return redirect(url_for("login"))
-    
     db = get_db()
     
-    # Global Stats
-    fund_row = db.execute("SELECT total_balance FROM fund WHERE id = 1").fetchone()
-    starting_fund = fund_row['total_balance'] if fund_row else 0
-    
-    total_collections = db.execute("SELECT SUM(amount) FROM monthly_contributions WHERE status = 'paid'").fetchone()[0] or 0
-    total_repayments_received = db.execute("SELECT SUM(amount) FROM interest_payments WHERE status = 'paid'").fetchone()[0] or 0
-    total_loans_issued = db.execute("SELECT SUM(amount) FROM loans WHERE status IN ('approved', 'paid')").fetchone()[0] or 0
-    
-    fund = starting_fund + total_collections + total_repayments_received - total_loans_issued
-    
-    # Real Interest Logic (re-calculating from raw payments for accuracy)
-    # Using SQL join for efficiency
-    real_interest_earned_query = """
-        SELECT 
-            p.amount as payment_amount, 
-            p.month_no,
-            l.amount as loan_amount,
-            l.total_months,
-            l.principal_portion,
-            l.interest_rate_percent
-        FROM interest_payments p
-        JOIN loans l ON p.loan_id = l.loan_id
-        WHERE p.status = 'paid'
-    """
-    payments = db.execute(real_interest_earned_query).fetchall()
-    
-    real_interest_earned = 0
-    for p in payments:
-        principal_constant = p['principal_portion']
-        month_no = p['month_no']
-        loan_amt = p['loan_amount']
-        
-        remaining_principal = loan_amt - (principal_constant * (month_no - 1))
-        if remaining_principal < 0: remaining_principal = 0
-        
-        interest_component = (remaining_principal * p['interest_rate_percent']) / 100
-        real_interest_earned += interest_component
+    # Global Stats (materialized in fund_summary, see fund_ledger.py)
+    summary = fund_ledger.get_fund_summary(db)
+    fund = summary["balance"]
+    total_collections = summary["total_collections"]
+    total_loans_issued = summary["total_loans_issued"]
+    real_interest_earned = summary["total_interest_earned"]
 
-    # Pending Principal
-    active_loans_query = "SELECT * FROM loans WHERE status = 'approved' AND repayment_status='open'"
-    active_loans = db.execute(active_loans_query).fetchall()
-    
-    total_pending_principal = 0
-    for loan in active_loans:
-        paid_months = db.execute("SELECT COUNT(*) FROM interest_payments WHERE loan_id = ? AND status = 'paid'", (loan['loan_id'],)).fetchone()[0]
-        current_balance = loan['amount'] - (loan['principal_portion'] * paid_months)
-        if current_balance < 0: current_balance = 0
-        total_pending_principal += current_balance
-
-    if session["role"] == "admin":
+    if current_user().is_admin:
+        # Pending Principal
+        active_loans = fetch_loans_with_progress(db, "l.status = 'approved' AND l.repayment_status = 'open'")
+        total_pending_principal = sum(loan['dynamic_remaining_balance'] for loan in repayment_progress(active_loans))
         active_loans_count = len(active_loans)
         closed_loans_count = db.execute("SELECT COUNT(*) FROM loans WHERE repayment_status='closed'").fetchone()[0]
         
@@ -194,9 +399,8 @@ def dashboard():
         pending_contributions_count = total_members_count - paid_members_this_month
         if pending_contributions_count < 0: pending_contributions_count = 0
         
-        # Tables Data
-        loans = db.execute("SELECT l.*, m.name FROM loans l JOIN members m ON l.member_id = m.member_id ORDER BY request_time DESC").fetchall()
-        contributions = db.execute("SELECT c.*, m.name FROM monthly_contributions c JOIN members m ON c.member_id = m.member_id ORDER BY year DESC, month DESC").fetchall()
+        # Tables Data (first page, the rest loads from /dashboard/contributions)
+        contributions, contributions_cursor = pagination.contributions_page(db)
         
         return render_template("dashboard_admin.html", 
                              balance=fund, 
@@ -207,61 +411,123 @@ def dashboard():
                              active_loans_count=active_loans_count,
                              closed_loans_count=closed_loans_count,
                              pending_contributions_count=pending_contributions_count,
-                             members=db.execute("SELECT * FROM members WHERE role='member'").fetchall(), 
-                             loans=loans, 
-                             contributions=contributions)
+                             contributions=contributions,
+                             contributions_cursor=contributions_cursor)
     else:
-        user_id = session["user_id"]
+        user_id = current_user().member_id
         
-        my_loans = db.execute("SELECT * FROM loans WHERE member_id = ?", (user_id,)).fetchall()
-        my_contributions = db.execute("SELECT * FROM monthly_contributions WHERE member_id = ? ORDER BY year DESC, month DESC", (user_id,)).fetchall()
-        
-        my_total_savings = sum(c['amount'] for c in my_contributions if c['status'] == 'paid')
-        my_active_loans_amount = sum(l['amount'] for l in my_loans if l['status'] == 'approved' and l['repayment_status'] == 'open')
+        def member_view():
+            my_loans = fetch_loans_with_progress(db, "l.member_id = ?", (user_id,))
+            my_contributions = db.execute("SELECT * FROM monthly_contributions WHERE member_id = ? ORDER BY year DESC, month DESC", (user_id,)).fetchall()
+            
+            my_total_savings = sum(c['amount'] for c in my_contributions if c['status'] == 'paid')
+            my_active_loans_amount = sum(l['amount'] for l in my_loans if l['status'] == 'approved' and l['repayment_status'] == 'open')
+            
+            # Loan Display Logic
+            loans_display = repayment_progress(my_loans)
+            return {"my_total_savings": my_total_savings, "my_active_loans_amount": my_active_loans_amount,
+                    "loans": loans_display, "contributions": my_contributions}
         
-        # Loan Display Logic
-        loans_display = []
-        for loan in my_loans:
-            loan_dict = dict(loan)
-            if loan["status"] == 'approved' and loan["repayment_status"] == 'open':
-                paid_months = db.execute("SELECT COUNT(*) FROM interest_payments WHERE loan_id=? AND status='paid'", (loan['loan_id'],)).fetchone()[0]
-                next_month = paid_months + 1
-                
-                emi_calc = calculate_dynamic_emi(loan["amount"], loan["total_months"], loan["interest_rate_percent"], next_month)
-                if emi_calc:
-                    loan_dict["next_emi_amount"] = emi_calc["total_emi"]
-                    loan_dict["next_payment_month"] = next_month
-                else:
-                    loan_dict["next_emi_amount"] = 0
-            else:
-                loan_dict["next_emi_amount"] = 0
-            loans_display.append(loan_dict)
+        # The member's own figures are cached; the fund balance is always read fresh
+        view = page_cache().cached(("dashboard", user_id), [cache.member_tag(user_id)], member_view)
             
         return render_template("dashboard_member.html", 
                              balance=fund, 
-                             my_total_savings=my_total_savings,
                              alerts=[], # Can be added back if needed
-                             my_active_loans_amount=my_active_loans_amount,
-                             loans=loans_display, 
-                             contributions=my_contributions,
-                             user_name=session["name"])
+                             user_name=current_user().name,
+                             **view)
+
+
+def page_fragment(template, rows, next_cursor, **context):
+    """Rows of a "load more" slice; the cursor of the following slice travels in X-Next-Cursor."""
+    response = app.make_response(render_template(template, rows=rows, **context))
+    response.headers["X-Next-Cursor"] = next_cursor or ""
+    return response
+
+@app.route("/dashboard/contributions")
+@admin_required
+def dashboard_contributions():
+    try:
+        rows, next_cursor = pagination.contributions_page(get_db(), request.args.get("cursor"), pagination.page_size(request.args))
+    except ValueError:
+        return "Invalid cursor", 400
+    return page_fragment("partials/dashboard_contribution_rows.html", rows, next_cursor)
+
+
+@app.route("/admin/db_pool")
+@admin_required
+def db_pool_stats():
+    return jsonify(get_backend().stats())
+
+@app.route("/admin/cache")
+@admin_required
+def cache_stats():
+    return jsonify(page_cache().stats())
+
+def metrics_gauges():
+    """Current pool, cache, chat and job queue figures for /admin/metrics, {name: {labels: value}}."""
+    gauges = {}
+    sources = (("finance_db_pool_", get_backend().stats()), ("finance_cache_", page_cache().stats()),
+               ("finance_chat_", chat_broker.get_broker(database_url()).stats()))
+    if app.config['TENANT_MODE']:
+        sources += (("finance_tenants_", tenants.stats()),)
+    for prefix, stats in sources:
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                gauges[prefix + key] = {(): value}
+    db = get_db()
+    gauges["finance_jobs"] = {(("status", status),): db.execute("SELECT COUNT(*) FROM jobs WHERE status=?", (status,)).fetchone()[0]
+                              for status in ("queued", "running")}
+    return gauges
+
+@app.route("/admin/metrics")
+def prometheus_metrics():
+    """Prometheus text format: per-route latency, per-statement database time, slow query / N+1 flags, pool and cache figures."""
+    token = app.config['METRICS_TOKEN']
+    bearer = request.headers.get("Authorization", "")
+    if not (token and hmac.compare_digest(bearer, f"Bearer {token}")) and not (current_user() and current_user().is_admin):
+        return redirect(url_for("login"))
+    return app.response_class(instrumentation.registry.prometheus(metrics_gauges()),
+                              mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/metrics/queries")
+@admin_required
+def query_metrics():
+    """The statements that took the most database time, with their SQL, and the N+1 patterns seen."""
+    return jsonify(instrumentation.registry.top_statements(request.args.get("limit", 50, type=int)))
 
+@app.route("/admin/profile")
+@admin_required
+def sampled_profile():
+    """
+    Samples every thread's stack for ?seconds= (default 5) and returns the
+    collapsed stacks (flamegraph.pl / speedscope). This request waits meanwhile.
+    """
+    seconds = request.args.get("seconds", 5, type=float)
+    interval = request.args.get("interval_ms", 5, type=float) / 1000
+    profile = instrumentation.sample_profile(seconds, max(interval, 0.001))
+    if profile is None:
+        return jsonify({"error": "a profile is already running"}), 409
+    text, samples = profile
+    return app.response_class(text, mimetype="text/plain", headers={"X-Profile-Samples": str(samples)})
 
 @app.route("/admin/update_fund_balance", methods=["POST"])
+@admin_required
 def update_fund_balance():
-    if session.get("role") != "admin": return redirect(url_for("login"))
     try:
         amount = float(request.form.get("amount", 0))
         db = get_db()
-        db.execute("UPDATE fund SET total_balance = ? WHERE id = 1", (amount,))
+        fund_ledger.record_starting_fund(db, amount)
+        data_versions.bump(db, cache.FUND)
         db.commit()
-    except Exception as e:
-        print(e)
+    except Exception:
+        app.logger.exception("Updating the fund balance failed")
+        flash("❌ Could not update the fund balance.")
     return redirect(url_for("dashboard"))
 
 @app.route("/add_member", methods=["POST"])
+@admin_required
 def add_member():
-    if session.get("role") != "admin": return redirect(url_for("login"))
     
     name = request.form["name"]
     username = request.form["username"]
@@ -270,16 +536,20 @@ def add_member():
     db = get_db()
     try:
         db.execute("INSERT INTO members (name, username, password, role, join_date) VALUES (?, ?, ?, ?, ?)",
-                   (name, username, password, 'member', datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                   (name, username, auth.hash_password(password), 'member', datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        data_versions.bump(db, cache.MEMBERS)
         db.commit()
-    except:
-        pass # Duplicate user?
+        page_cache().invalidate(cache.MEMBERS)
+    except db.Error:
+        db.rollback()
+        app.logger.warning("Could not add member %r (username taken?)", username, exc_info=True)
+        flash("❌ Could not add the member, the username may already be taken.")
         
     return redirect(url_for("dashboard"))
 
 @app.route("/update_contribution_status", methods=["POST"])
+@admin_required
 def update_contribution_status():
-    if session.get("role") != "admin": return redirect(url_for("login"))
     
     member_id = request.form["member_id"]
     month = int(request.form["month"])
@@ -289,27 +559,41 @@ def update_contribution_status():
     
     db = get_db()
     
-    existing = db.execute("SELECT id, status FROM monthly_contributions WHERE member_id=? AND month=? AND year=?", 
+    existing = db.execute("SELECT id, status, amount FROM monthly_contributions WHERE member_id=? AND month=? AND year=?", 
                           (member_id, month, year)).fetchone()
                           
     if action == "pay":
         if not existing:
-             db.execute("INSERT INTO monthly_contributions (member_id, month, year, amount, status, paid_date) VALUES (?,?,?,?,?,?)",
-                        (member_id, month, year, amount, 'paid', datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+             contribution_id = db.execute("""INSERT INTO monthly_contributions (member_id, month, year, amount, status, paid_date)
+                                             VALUES (?,?,?,?,?,?) RETURNING id""",
+                                          (member_id, month, year, amount, 'paid', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))).fetchone()[0]
+             fund_ledger.record_contribution(db, amount, member_id, contribution_id)
+             contribution_masks.record_paid(db, member_id, year, month)
+             sync_manager.record_change(db, sync_manager.CONTRIBUTIONS, contribution_id)
         elif existing['status'] == 'pending':
              db.execute("UPDATE monthly_contributions SET status='paid', paid_date=? WHERE id=?", 
                         (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), existing['id']))
+             fund_ledger.record_contribution(db, existing['amount'], member_id, existing['id'])
+             contribution_masks.record_paid(db, member_id, year, month)
+             sync_manager.record_change(db, sync_manager.CONTRIBUTIONS, existing['id'])
     elif action == "unpay":
          if existing:
              db.execute("UPDATE monthly_contributions SET status='pending', paid_date=NULL WHERE id=?", 
                         (existing['id'],))
+             sync_manager.record_change(db, sync_manager.CONTRIBUTIONS, existing['id'])
+             if existing['status'] == 'paid':
+                 fund_ledger.record_contribution(db, -existing['amount'], member_id, existing['id'])
+                 contribution_masks.record_unpaid(db, member_id, year, month)
                          
+    tags = (cache.contributions_tag(year), cache.member_tag(member_id), cache.FUND)
+    data_versions.bump(db, *tags)
     db.commit()
+    page_cache().invalidate(*tags)
     return redirect(url_for("contribution_tracking", year=year))
 
 @app.route("/request_loan", methods=["GET", "POST"])
+@login_required
 def request_loan():
-    if "user_id" not in session: return redirect(url_for("login"))
     
     if request.method == "POST":
         amount = int(request.form["amount"])
@@ -324,71 +608,81 @@ def request_loan():
         db.execute("""INSERT INTO loans (member_id, amount, interest_rate_percent, interest_per_month, total_months, 
                                       status, repayment_status, request_time, emi_amount, principal_portion, interest_portion, remaining_balance)
                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                   (session["user_id"], amount, interest_rate, interest_portion, months, 'pending', 'open', 
+                   (current_user().member_id, amount, interest_rate, interest_portion, months, 'pending', 'open', 
                     datetime.now().strftime("%Y-%m-%d %H:%M:%S"), emi_amount, principal_portion, interest_portion, amount))
+        tags = (cache.LOANS, cache.member_tag(current_user().member_id))
+        data_versions.bump(db, *tags)
         db.commit()
+        page_cache().invalidate(*tags)
         return redirect(url_for("dashboard"))
         
-    return render_template("request_loan.html", user_name=session["name"])
+    return render_template("request_loan.html", user_name=current_user().name)
 
 @app.route("/admin/loans")
+@admin_required
 def admin_loans():
-    if session.get("role") != "admin": return redirect(url_for("login"))
     db = get_db()
     
     pending_loans = db.execute("SELECT l.*, m.name FROM loans l JOIN members m ON l.member_id = m.member_id WHERE l.status='pending' ORDER BY request_time").fetchall()
     
-    active_loans_raw = db.execute("SELECT l.*, m.name FROM loans l JOIN members m ON l.member_id = m.member_id WHERE l.status='approved' AND l.repayment_status='open' ORDER BY approved_time DESC").fetchall()
-    
-    active_loans = []
-    total_active_principal = 0
+    active_loans_raw = fetch_loans_with_progress(db, "l.status='approved' AND l.repayment_status='open'",
+                                                 order_by="l.approved_time DESC")
     
-    for loan in active_loans_raw:
-        l_dict = dict(loan)
-        total_active_principal += loan['amount']
-        
-        paid_count = db.execute("SELECT COUNT(*) FROM interest_payments WHERE loan_id=? AND status='paid'", (loan['loan_id'],)).fetchone()[0]
-        next_month = paid_count + 1
-        l_dict['next_payment_month'] = next_month
-        
-        emi_calc = calculate_dynamic_emi(loan["amount"], loan["total_months"], loan["interest_rate_percent"], next_month)
-        if emi_calc:
-            l_dict["next_emi_amount"] = emi_calc["total_emi"]
-        else:
-            l_dict["next_emi_amount"] = 0
-            
-        active_loans.append(l_dict)
+    active_loans = repayment_progress(active_loans_raw)
+    total_active_principal = sum(loan['amount'] for loan in active_loans)
         
     interest_collected_month = 0 
     # Skipping exact month calc for brevity, can be re-added
+
+    # Liquidity forecast (and each pending request's what-if), recomputed after loan / fund / member writes
+    scenario = forecast.scenario(request.args)
+    projection = page_cache().cached(("forecast", date.today().isoformat()) + tuple(sorted(scenario.items())),
+                                     [cache.LOANS, cache.FUND, cache.MEMBERS],
+                                     lambda: forecast.project(db, **scenario))
     
     return render_template("admin_loans.html",
                          pending_count=len(pending_loans),
                          total_active_principal=total_active_principal,
                          interest_collected_month=interest_collected_month,
                          pending_loans=pending_loans,
-                         active_loans=active_loans)
+                         active_loans=active_loans,
+                         scenario=scenario,
+                         forecast=projection)
 
 @app.route("/approve_loan/<int:loan_id>")
+@admin_required
 def approve_loan(loan_id):
-    if session.get("role") != "admin": return redirect(url_for("login"))
     db = get_db()
+    loan = db.execute("SELECT member_id, amount, status FROM loans WHERE loan_id=?", (loan_id,)).fetchone()
     db.execute("UPDATE loans SET status='approved', repayment_status='open', approved_time=? WHERE loan_id=?", 
                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), loan_id))
+    if loan and loan['status'] not in ('approved', 'paid'):
+        fund_ledger.record_loan_issued(db, loan['amount'], loan_id, loan['member_id'])
+        loan_schedule.generate(db, loan_id)
+    tags = (cache.LOANS, cache.member_tag(loan['member_id']), cache.FUND) if loan else ()
+    data_versions.bump(db, *tags)
     db.commit()
+    page_cache().invalidate(*tags)
     return redirect(url_for("admin_loans"))
 
 @app.route("/reject_loan/<int:loan_id>")
+@admin_required
 def reject_loan(loan_id):
-    if session.get("role") != "admin": return redirect(url_for("login"))
     db = get_db()
+    loan = db.execute("SELECT member_id, amount, status FROM loans WHERE loan_id=?", (loan_id,)).fetchone()
     db.execute("UPDATE loans SET status='rejected' WHERE loan_id=?", (loan_id,))
+    if loan and loan['status'] in ('approved', 'paid'):
+        fund_ledger.record_loan_issued(db, -loan['amount'], loan_id, loan['member_id'])
+        loan_schedule.remove(db, loan_id)
+    tags = (cache.LOANS, cache.member_tag(loan['member_id']), cache.FUND) if loan else ()
+    data_versions.bump(db, *tags)
     db.commit()
+    page_cache().invalidate(*tags)
     return redirect(url_for("admin_loans"))
 
 @app.route("/update_interest", methods=["POST"])
+@admin_required
 def update_interest():
-    if session.get("role") != "admin": return redirect(url_for("login"))
     
     loan_id = request.form["loan_id"]
     month_no = request.form["month_no"]
@@ -416,89 +710,141 @@ def update_interest():
         status_update = "closed"
         
     # Record the payment
-    db.execute("INSERT INTO interest_payments (loan_id, month_no, amount, status, paid_date) VALUES (?, ?, ?, ?, ?)",
-               (loan_id, month_no, amount, 'paid', datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    payment_id = db.execute("INSERT INTO interest_payments (loan_id, month_no, amount, status, paid_date) VALUES (?, ?, ?, ?, ?) RETURNING id",
+                            (loan_id, month_no, amount, 'paid', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))).fetchone()[0]
+    fund_ledger.record_repayment(db, loan, month_no, amount, payment_id=payment_id, balance=new_balance)
+    loan_schedule.record_payment(db, loan, month_no)
+    sync_manager.record_change(db, sync_manager.PAYMENTS, payment_id)
                
     # Update Loan Balance and Status
     if status_update == "closed":
         db.execute("UPDATE loans SET remaining_balance=?, repayment_status='closed', closed_time=? WHERE loan_id=?", 
                    (new_balance, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), loan_id))
+        loan_schedule.close(db, loan_id)
     else:
         db.execute("UPDATE loans SET remaining_balance=? WHERE loan_id=?", 
                    (new_balance, loan_id))
         
+    tags = (cache.LOANS, cache.member_tag(loan['member_id']), cache.FUND)
+    data_versions.bump(db, *tags)
     db.commit()
+    page_cache().invalidate(*tags)
     
     return redirect(url_for("admin_loans"))
 
 @app.route("/loan_tracking")
+@login_required
 def loan_tracking():
-    if "user_id" not in session: return redirect(url_for("login"))
     db = get_db()
     
-    loans = db.execute("SELECT l.*, m.name FROM loans l JOIN members m ON l.member_id = m.member_id WHERE l.status='approved' ORDER BY l.repayment_status DESC, l.approved_time DESC").fetchall()
+    today = date.today().isoformat()
     
-    loans_display = []
-    for loan in loans:
-        l_dict = dict(loan)
-        
-        paid_count = db.execute("SELECT COUNT(*) FROM interest_payments WHERE loan_id=? AND status='paid'", (loan['loan_id'],)).fetchone()[0]
-        l_dict['months_paid'] = paid_count
+    def render():
+        loans = fetch_loans_with_progress(db, "l.status='approved'",
+                                          order_by="l.repayment_status DESC, l.approved_time DESC")
         
-        current_balance = loan["amount"] - (loan["principal_portion"] * paid_count)
-        if current_balance < 0: current_balance = 0
-        l_dict['dynamic_remaining_balance'] = current_balance
+        loans_display = repayment_progress(loans)
+        # Only the month each loan is at (see loan_schedule.py): its oldest overdue EMI, else the one due
+        # within a month (a month from today included). The full schedules load per loan, from
+        # /loan_tracking/<id>/schedule
+        overdue = {}
+        for row in loan_schedule.overdue(db, date.fromisoformat(today)):
+            overdue.setdefault(row['loan_id'], []).append(row)
+        upcoming = {}
+        month_end = loan_schedule.due_date(date.fromisoformat(today), 1) + timedelta(days=1)
+        for row in loan_schedule.due_between(db, today, month_end.isoformat()):
+            upcoming.setdefault(row['loan_id'], row)
+        for loan in loans_display:
+            late = overdue.get(loan['loan_id'], [])
+            loan['next_due'] = late[0] if late else upcoming.get(loan['loan_id'])
+            loan['overdue_count'] = len(late)
         
-        if loan["repayment_status"] == 'open':
-            next_month = paid_count + 1
-            emi_calc = calculate_dynamic_emi(loan["amount"], loan["total_months"], loan["interest_rate_percent"], next_month)
-            if emi_calc:
-                l_dict["current_emi_amount"] = emi_calc["total_emi"]
-                l_dict["current_interest_portion"] = emi_calc["interest_component"]
-            else:
-                l_dict["current_emi_amount"] = 0
-                l_dict["current_interest_portion"] = 0
-        else:
-             l_dict["current_emi_amount"] = 0
-             l_dict["current_interest_portion"] = 0
-             
-        loans_display.append(l_dict)
-        
-    return render_template("loan_tracking.html", loans=loans_display)
+        return render_template("loan_tracking.html", loans=loans_display, today=today)
+    
+    # Same page for every viewer, so the rendered HTML is cached (per day, for the overdue marks)
+    return page_cache().cached(("loan_tracking", today), [cache.LOANS], render)
+
+@app.route("/loan_tracking/<int:loan_id>/schedule")
+@login_required
+def loan_tracking_schedule(loan_id):
+    """One approved loan's EMI schedule rows for the Loan Tracker, loaded when its schedule is opened."""
+    db = get_db()
+    today = date.today().isoformat()
+    schedule = loan_schedule.by_loan(db, "l.loan_id = ? AND l.status='approved'", [loan_id]).get(loan_id, [])
+    return page_fragment("partials/loan_schedule_rows.html", schedule, None, today=today)
+
+@app.route("/admin/loans/due")
+@admin_required
+def loans_due():
+    """EMIs due in ?month=YYYY-MM (default: this month) and every EMI overdue today (see loan_schedule.py)."""
+    try:
+        start = datetime.strptime(request.args.get("month", date.today().strftime("%Y-%m")), "%Y-%m").date()
+    except ValueError:
+        return jsonify({"error": "month must be YYYY-MM"}), 400
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    db = get_db()
+    due = loan_schedule.due_between(db, start.isoformat(), end.isoformat())
+    overdue = loan_schedule.overdue(db)
+    return jsonify({"month": start.strftime("%Y-%m"), "today": date.today().isoformat(),
+                    "due": [dict(row) for row in due], "due_total": sum(row['emi'] for row in due),
+                    "overdue": [dict(row) for row in overdue], "overdue_total": sum(row['emi'] for row in overdue)})
 
 @app.route("/contribution_tracking")
+@admin_required
 def contribution_tracking():
-    if session.get("role") != "admin": return redirect(url_for("login"))
     year = int(request.args.get("year", datetime.now().year))
     
     db = get_db()
-    members = db.execute("SELECT * FROM members WHERE role='member'").fetchall()
     
-    contributions = db.execute("SELECT * FROM monthly_contributions WHERE year=?", (year,)).fetchall()
+    def render():
+        # One paid-months mask per member (see contribution_masks.py)
+        tracking_data = []
+        for m in contribution_masks.year_matrix(db, year):
+            row = {'id': m['member_id'], 'name': m['name'], 'status_by_month': {}}
+            for month in range(1, 13):
+                row['status_by_month'][month] = 'paid' if m['paid_mask'] & contribution_masks.bit(month) else 'pending'
+            tracking_data.append(row)
+            
+        return render_template("contribution_tracking.html", 
+                             tracking_data=tracking_data, 
+                             selected_year=year,
+                             current_year=datetime.now().year)
     
-    # Transform for matrix
-    # Format: {member_id: {month: status}}
-    status_map = {}
-    for c in contributions:
-        if c['member_id'] not in status_map: status_map[c['member_id']] = {}
-        status_map[c['member_id']][c['month']] = c['status']
-        
-    tracking_data = []
-    for m in members:
-        row = {'id': m['member_id'], 'name': m['name'], 'status_by_month': {}}
-        for month in range(1, 13):
-            status = status_map.get(m['member_id'], {}).get(month, 'pending')
-            row['status_by_month'][month] = status
-        tracking_data.append(row)
-        
-    return render_template("contribution_tracking.html", 
-                         tracking_data=tracking_data, 
-                         selected_year=year,
-                         current_year=datetime.now().year)
+    return page_cache().cached(("contribution_tracking", year), [cache.contributions_tag(year), cache.MEMBERS], render)
+
+@app.route("/admin/contributions/history")
+@admin_required
+def contribution_history():
+    """Paid months of every member per year, ?from=<year>&to=<year> (default: the current year)."""
+    try:
+        last_year = int(request.args.get("to", datetime.now().year))
+        first_year = int(request.args.get("from", last_year))
+    except ValueError:
+        return jsonify({"error": "from and to must be years"}), 400
+    if not 0 <= last_year - first_year < 50:
+        return jsonify({"error": "from must be at most 50 years before to"}), 400
+    return jsonify({"from": first_year, "to": last_year,
+                    "members": contribution_masks.history(get_db(), first_year, last_year)})
+
+@app.route("/admin/contributions/arrears")
+@admin_required
+def contribution_arrears():
+    """Members with at least ?min_unpaid= (default 3) unpaid months since January of ?from= (default: this year)."""
+    until = contribution_masks.last_closed_month()
+    try:
+        min_unpaid = int(request.args.get("min_unpaid", 3))
+        first_year = int(request.args.get("from", until[0]))
+    except ValueError:
+        return jsonify({"error": "min_unpaid and from must be integers"}), 400
+    if not 0 <= until[0] - first_year < 50:
+        return jsonify({"error": "from must be a year within the last 50"}), 400
+    members = contribution_masks.arrears(get_db(), min_unpaid, first_year, until)
+    return jsonify({"from": f"{first_year}-01", "until": f"{until[0]}-{until[1]:02d}",
+                    "min_unpaid": min_unpaid, "count": len(members), "members": members})
 
 @app.route("/submit_payment_proof", methods=["GET", "POST"])
+@login_required
 def submit_payment_proof():
-    if "user_id" not in session: return redirect(url_for("login"))
     db = get_db()
     
     if request.method == "POST":
@@ -519,222 +865,519 @@ def submit_payment_proof():
             
         file = request.files['screenshot']
         if file and allowed_file(file.filename):
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = secure_filename(f"{session['user_id']}_{proof_type}_{timestamp}_{file.filename}")
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            # Streamed to disk and stored by content hash, identical screenshots are kept once (uploads.py)
+            upload = uploads.save_upload(db, file, app.config['UPLOAD_FOLDER'])
+            filepath = upload['path']
             
             db.execute("""INSERT INTO payment_proofs (proof_type, loan_id, member_id, month_no, month, year, amount, screenshot_path, status, submission_date) 
                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                       (proof_type, loan_id, session["user_id"], month_no, month, year, amount, filepath, 'pending', datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                       (proof_type, loan_id, current_user().member_id, month_no, month, year, amount, filepath, 'pending', datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            data_versions.bump(db, cache.PROOFS)
             db.commit()
+            if uploads.Image is not None:
+                dispatch("thumbnail", {"sha256": upload['sha256']}, f"thumbnail-{upload['sha256']}")
             flash("Proof submitted successfully!")
             return redirect(url_for("dashboard"))
             
     # GET
-    active_loans = db.execute("SELECT * FROM loans WHERE member_id=? AND status='approved' AND repayment_status='open'", (session['user_id'],)).fetchall()
-    loans_display = []
-    for loan in active_loans:
-        l = dict(loan)
-        paid_count = db.execute("SELECT COUNT(*) FROM interest_payments WHERE loan_id=? AND status='paid'", (loan['loan_id'],)).fetchone()[0]
-        next = paid_count + 1
-        emi = calculate_dynamic_emi(loan['amount'], loan['total_months'], loan['interest_rate_percent'], next)
-        l['next_emi_amount'] = emi['total_emi'] if emi else 0
-        loans_display.append(l)
+    active_loans = fetch_loans_with_progress(db, "l.member_id=? AND l.status='approved' AND l.repayment_status='open'",
+                                            (current_user().member_id,))
+    loans_display = repayment_progress(active_loans)
 
-    return render_template("submit_payment_proof.html", loans=loans_display, user_name=session["name"])
+    return render_template("submit_payment_proof.html", loans=loans_display, user_name=current_user().name)
 
 @app.route("/admin/payment_proofs")
+@admin_required
 def admin_payment_proofs():
-    if session.get("role") != "admin": return redirect(url_for("login"))
     db = get_db()
     
-    proofs = db.execute("""SELECT p.*, m.name, l.amount as loan_amount 
+    # job_status: an approval already queued for the proof (see approve_payment_proof)
+    pending_proofs = db.execute("""SELECT p.*, m.name, l.amount as loan_amount, j.status AS job_status, u.thumbnail_path
                            FROM payment_proofs p 
                            JOIN members m ON p.member_id = m.member_id 
                            LEFT JOIN loans l ON p.loan_id = l.loan_id 
+                           LEFT JOIN jobs j ON j.idempotency_key = 'approve-proof-' || p.proof_id
+                           LEFT JOIN uploads u ON u.path = p.screenshot_path
                            WHERE p.status='pending' ORDER BY submission_date DESC""").fetchall()
                            
-    return render_template("admin_payment_proofs.html", pending_proofs=proofs)
+    return render_template("admin_payment_proofs.html", pending_proofs=pending_proofs)
 
 # ---------- CHAT ----------
 @app.route("/chat")
+@login_required
 def chat():
-    if "user_id" not in session: return redirect(url_for("login"))
     db = get_db()
     
-    messages = db.execute("SELECT m.*, u.name FROM messages m JOIN members u ON m.member_id = u.member_id ORDER BY m.timestamp").fetchall()
+    # Latest page only, earlier messages load from /chat/messages
+    messages, messages_cursor = pagination.messages_page(db)
     
-    return render_template("chat.html", messages=messages, user_id=session["user_id"], user_name=session["name"])
+    return render_template("chat.html", messages=messages, messages_cursor=messages_cursor, user_id=current_user().member_id, user_name=current_user().name)
+
+@app.route("/chat/messages")
+@login_required
+def chat_messages():
+    try:
+        rows, next_cursor = pagination.messages_page(get_db(), request.args.get("cursor"), pagination.page_size(request.args))
+    except ValueError:
+        return "Invalid cursor", 400
+    return page_fragment("partials/chat_messages.html", rows, next_cursor, user_id=current_user().member_id)
 
 @app.route("/send_message", methods=["POST"])
+@login_required
 def send_message():
-    if "user_id" not in session: return redirect(url_for("login"))
     
     content = request.form.get("content")
     if content:
         db = get_db()
         db.execute("INSERT INTO messages (member_id, content, timestamp) VALUES (?, ?, ?)",
-                   (session["user_id"], content, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                   (current_user().member_id, content, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
         db.commit()
+        chat_broker.get_broker(database_url()).notify()
+    if request.accept_mimetypes.best == "application/json":
+        # Sent from the chat page script; the message comes back on /chat/stream
+        return "", 204
     return redirect(url_for("chat"))
 
+CHAT_BACKLOG_LIMIT = 200
+CHAT_HEARTBEAT_SECONDS = 15
+
+@app.route("/chat/stream")
+@login_required
+def chat_stream():
+    """
+    Server-Sent Events: the messages after Last-Event-ID (or ?after=<id>), then
+    every new message as it is posted (see chat_broker.py).
+    """
+    after = request.headers.get("Last-Event-ID") or request.args.get("after")
+    try:
+        after = int(after) if after else None
+    except ValueError:
+        return "Invalid message id", 400
+    
+    db = get_db()
+    broker = chat_broker.get_broker(database_url())
+    # Subscribe before reading the backlog so nothing posted in between is missed
+    subscription = broker.subscribe(db)
+    if subscription is None:
+        return "Too many chat connections", 503, {"Retry-After": "10"}
+    try:
+        backlog = chat_broker.backlog(db, after, CHAT_BACKLOG_LIMIT + 1) if after is not None else []
+        db.commit()
+    except db.Error:
+        broker.unsubscribe(subscription)
+        raise
+    # The generator runs after this request's connection went back to the pool; it only reads the queue
+    
+    def event(message):
+        return f"id: {message['id']}\ndata: {json.dumps(message)}\n\n"
+    
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            if len(backlog) > CHAT_BACKLOG_LIMIT:
+                # Too far behind to replay: the page reloads its latest messages instead
+                yield "event: reload\ndata: {}\n\n"
+                return
+            replayed = set()
+            for row in backlog:
+                replayed.add(row['id'])
+                yield event(dict(row))
+            while True:
+                try:
+                    message = subscription.queue.get(timeout=CHAT_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    if subscription.dropped:
+                        return
+                    yield ": keepalive\n\n"  # also notices clients that went away
+                    continue
+                if message['id'] not in replayed:
+                    yield event(message)
+                if subscription.dropped and subscription.queue.empty():
+                    return
+        finally:
+            broker.unsubscribe(subscription)
+    
+    return app.response_class(stream(), mimetype="text/event-stream",
+                              headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/admin/chat_stream")
+@admin_required
+def chat_stream_stats():
+    return jsonify(chat_broker.get_broker(database_url()).stats())
+
 # ---------- EXPORT TRANSACTIONS ----------
-import io
-from flask import send_file
+import tempfile
+from flask import send_file, Response, stream_with_context
+import exports
 
 @app.route("/admin/export_transactions")
+@admin_required
 def export_transactions():
-    if session.get("role") != "admin": return redirect(url_for("login"))
+    """
+    Streams the transaction history (see exports.py).
+    ?format=xlsx (default) or zip (one CSV per sheet), optional ?start=&end= (YYYY-MM-DD) and ?member_id=
+    """
+    
+    try:
+        filters = exports.parse_filters(request.args)
+    except ValueError:
+        return "Invalid export filters (dates are YYYY-MM-DD, member_id is a number)", 400
     
     db = get_db()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
-    # 1. Contributions
-    contributions = db.execute("""SELECT m.name as Member, c.month as Month, c.year as Year, c.amount as Amount, 
-                                  c.status as Status, c.paid_date as 'Paid Date'
-                                  FROM monthly_contributions c 
-                                  JOIN members m ON c.member_id = m.member_id
-                                  ORDER BY c.year DESC, c.month DESC""").fetchall()
-                                  
-    # 2. Loan Payments
-    loan_payments = db.execute("""SELECT m.name as Member, p.loan_id as 'Loan ID', p.month_no as 'Month No', 
-                                  p.amount as Amount, p.status as Status, p.paid_date as 'Paid Date'
-                                  FROM interest_payments p 
-                                  JOIN loans l ON p.loan_id = l.loan_id
-                                  JOIN members m ON l.member_id = m.member_id
-                                  ORDER BY p.paid_date DESC""").fetchall()
-                                  
-    # 3. Loans Issued
-    loans_issued = db.execute("""SELECT m.name as Member, l.loan_id as 'Loan ID', l.amount as Amount, 
-                                 l.interest_rate_percent as 'Interest Rate', l.total_months as 'Total Months', 
-                                 l.status as Status, l.repayment_status as 'Repayment Status', 
-                                 l.request_time as 'Request Time', l.approved_time as 'Approved Time', 
-                                 l.closed_time as 'Closed Time'
-                                 FROM loans l 
-                                 JOIN members m ON l.member_id = m.member_id
-                                 ORDER BY l.request_time DESC""").fetchall()
-                                 
-    # Convert to DataFrames
-    # Use list comprehension to convert sqlite3.Row to dict
-    df_contrib = pd.DataFrame([dict(row) for row in contributions])
-    df_loans = pd.DataFrame([dict(row) for row in loan_payments])
-    df_loans_issued = pd.DataFrame([dict(row) for row in loans_issued])
-    
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        if not df_contrib.empty:
-            df_contrib.to_excel(writer, sheet_name='Contributions', index=False)
-        else:
-            pd.DataFrame({"Message": ["No Data"]}).to_excel(writer, sheet_name='Contributions', index=False)
-            
-        if not df_loans.empty:
-            df_loans.to_excel(writer, sheet_name='Loan Payments', index=False)
-        else:
-            pd.DataFrame({"Message": ["No Data"]}).to_excel(writer, sheet_name='Loan Payments', index=False)
-            
-        if not df_loans_issued.empty:
-            df_loans_issued.to_excel(writer, sheet_name='Loans Issued', index=False)
-        else:
-            pd.DataFrame({"Message": ["No Data"]}).to_excel(writer, sheet_name='Loans Issued', index=False)
-            
+    if request.args.get("format") == "zip":
+        response = Response(stream_with_context(exports.stream_csv_zip(db, filters)), mimetype="application/zip")
+        response.headers["Content-Disposition"] = f"attachment; filename=Transactions_{timestamp}.zip"
+        return response
+    
+    # Write-only workbook spooled to a temp file, then sent in chunks
+    output = tempfile.TemporaryFile()
+    exports.write_xlsx(db, output, filters)
     output.seek(0)
-    filename = f"Transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    filename = f"Transactions_{timestamp}.xlsx"
     return send_file(output, as_attachment=True, download_name=filename, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
 @app.route("/admin/manage_payments")
+@admin_required
 def admin_manage_payments():
-    if session.get("role") != "admin": return redirect(url_for("login"))
     db = get_db()
     
-    contributions = db.execute("SELECT c.*, m.name FROM monthly_contributions c JOIN members m ON c.member_id = m.member_id ORDER BY year DESC, month DESC").fetchall()
-    
-    interest_payments = db.execute("SELECT p.*, m.name, l.amount as loan_amount FROM interest_payments p JOIN loans l ON p.loan_id = l.loan_id JOIN members m ON l.member_id = m.member_id ORDER BY paid_date DESC").fetchall()
+    # First page of each table, "Load more" fetches the next slice by keyset cursor
+    contributions, contributions_cursor = pagination.contributions_page(db)
+    interest_payments, interest_payments_cursor = pagination.interest_payments_page(db)
     
     return render_template("admin_manage_payments.html", 
                          contributions=contributions, 
-                         interest_payments=interest_payments)
+                         contributions_cursor=contributions_cursor,
+                         interest_payments=interest_payments,
+                         interest_payments_cursor=interest_payments_cursor)
+
+@app.route("/admin/manage_payments/contributions")
+@admin_required
+def manage_payments_contributions():
+    try:
+        rows, next_cursor = pagination.contributions_page(get_db(), request.args.get("cursor"), pagination.page_size(request.args))
+    except ValueError:
+        return "Invalid cursor", 400
+    return page_fragment("partials/manage_contribution_rows.html", rows, next_cursor)
+
+@app.route("/admin/manage_payments/interest_payments")
+@admin_required
+def manage_payments_interest_payments():
+    try:
+        rows, next_cursor = pagination.interest_payments_page(get_db(), request.args.get("cursor"), pagination.page_size(request.args))
+    except ValueError:
+        return "Invalid cursor", 400
+    return page_fragment("partials/manage_interest_rows.html", rows, next_cursor)
 
 @app.route("/admin/delete_contribution/<int:id>", methods=["POST"])
+@admin_required
 def delete_contribution(id):
-    if session.get("role") != "admin": return redirect(url_for("login"))
     db = get_db()
+    contribution = db.execute("SELECT member_id, year, month, amount, status FROM monthly_contributions WHERE id=?", (id,)).fetchone()
     db.execute("DELETE FROM monthly_contributions WHERE id=?", (id,))
+    sync_manager.record_change(db, sync_manager.CONTRIBUTIONS, id)
+    if contribution and contribution['status'] == 'paid':
+        fund_ledger.record_contribution(db, -contribution['amount'], contribution['member_id'], id)
+        contribution_masks.record_unpaid(db, contribution['member_id'], contribution['year'], contribution['month'])
+    tags = (cache.contributions_tag(contribution['year']), cache.member_tag(contribution['member_id']), cache.FUND) if contribution else ()
+    data_versions.bump(db, *tags)
     db.commit()
+    page_cache().invalidate(*tags)
     flash("✅ Contribution deleted successfully.")
     return redirect(url_for("admin_manage_payments"))
 
 @app.route("/admin/delete_interest/<int:id>", methods=["POST"])
+@admin_required
 def delete_interest(id):
-    if session.get("role") != "admin": return redirect(url_for("login"))
     db = get_db()
+    payment = db.execute("SELECT loan_id, month_no, amount, status FROM interest_payments WHERE id=?", (id,)).fetchone()
     db.execute("DELETE FROM interest_payments WHERE id=?", (id,))
+    sync_manager.record_change(db, sync_manager.PAYMENTS, id)
+    loan = db.execute("SELECT * FROM loans WHERE loan_id=?", (payment['loan_id'],)).fetchone() if payment else None
+    if payment and payment['status'] == 'paid':
+        fund_ledger.record_repayment(db, loan, payment['month_no'], payment['amount'], sign=-1, payment_id=id)
+    if loan:
+        loan_schedule.record_payment(db, loan, payment['month_no'])
+    tags = (cache.LOANS, cache.member_tag(loan['member_id']), cache.FUND) if loan else ()
+    data_versions.bump(db, *tags)
     db.commit()
+    page_cache().invalidate(*tags)
     flash("✅ Payment deleted successfully.")
     return redirect(url_for("admin_manage_payments"))
 
 @app.route("/admin/approve_payment_proof/<int:proof_id>")
+@admin_required
 def approve_payment_proof(proof_id):
-    if session.get("role") != "admin": return redirect(url_for("login"))
-    db = get_db()
-    proof = db.execute("SELECT * FROM payment_proofs WHERE proof_id=?", (proof_id,)).fetchone()
-    
-    if proof and proof['status'] == 'pending':
-        if proof['proof_type'] == 'emi':
-            # Logic similar to update_interest
-            loan = db.execute("SELECT * FROM loans WHERE loan_id=?", (proof['loan_id'],)).fetchone()
-            if loan:
-                current_balance = loan['remaining_balance']
-                interest_rate = loan['interest_rate_percent']
-                
-                # Interest for this payment (simplified assumption: payment covers full month interest)
-                interest_component = (current_balance * interest_rate) / 100
-                principal_component = proof['amount'] - interest_component
-                
-                new_balance = current_balance - principal_component
-                
-                status_update = "open"
-                if new_balance <= 1:
-                    new_balance = 0
-                    status_update = "closed"
-                    
-                # Update Loan
-                if status_update == "closed":
-                     db.execute("UPDATE loans SET remaining_balance=?, repayment_status='closed', closed_time=? WHERE loan_id=?", 
-                                (new_balance, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), proof['loan_id']))
-                else:
-                     db.execute("UPDATE loans SET remaining_balance=? WHERE loan_id=?", 
-                                (new_balance, proof['loan_id']))
-                                
-            # Add to interest payments logs
-            db.execute("INSERT INTO interest_payments (loan_id, month_no, amount, status, paid_date) VALUES (?,?,?,?,?)",
-                       (proof['loan_id'], proof['month_no'], proof['amount'], 'paid', datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        elif proof['proof_type'] == 'contribution':
-            # Update/Insert contribution
-             existing = db.execute("SELECT id FROM monthly_contributions WHERE member_id=? AND month=? AND year=?",
-                                   (proof['member_id'], proof['month'], proof['year'])).fetchone()
-             if existing:
-                 db.execute("UPDATE monthly_contributions SET status='paid', paid_date=? WHERE id=?",
-                            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), existing['id']))
-             else:
-                 db.execute("INSERT INTO monthly_contributions (member_id, month, year, amount, status, paid_date) VALUES (?,?,?,?,?,?)",
-                            (proof['member_id'], proof['month'], proof['year'], proof['amount'], 'paid', datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    
+    # The loan / contribution / ledger updates run on the job queue (proofs.approve_proof);
+    # the key makes a repeated click return the same job
+    job = dispatch("approve_proofs", {"proof_ids": [proof_id]}, f"approve-proof-{proof_id}")
+    if job['status'] == 'failed' and jobs.retry(get_db(), job['id']):
+        # Approving again after a failure retries the same job
+        job = dispatch("approve_proofs", {"proof_ids": [proof_id]}, f"approve-proof-{proof_id}")
+    if job['status'] == 'succeeded':
+        flash(f"✅ Proof #{proof_id} approved.")
+    elif job['status'] == 'failed':
+        flash(f"❌ Approval of proof #{proof_id} failed: {job['error']}")
+    else:
+        flash(f"⏳ Approval of proof #{proof_id} queued (job #{job['id']}).")
         
-        db.execute("UPDATE payment_proofs SET status='approved', review_date=? WHERE proof_id=?", 
-                   (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), proof_id))
+    return redirect(url_for("admin_payment_proofs"))
+
+@app.route("/admin/payment_proofs/bulk", methods=["POST"])
+@admin_required
+def bulk_review_payment_proofs():
+    """
+    Approves or rejects many proofs in a single transaction (see proofs.review_batch).
+    Form post from the review page, or JSON {"proof_ids": [...], "action": "approve"|"reject", "admin_notes": "..."}
+    which gets the per-proof results back.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        data = data if isinstance(data, dict) else {}
+        proof_ids = data.get("proof_ids", [])
+    else:
+        data = {"action": request.form.get("action"), "admin_notes": request.form.get("admin_notes", "")}
+        proof_ids = [int(proof_id) if proof_id.isdigit() else proof_id for proof_id in request.form.getlist("proof_ids")]
+    
+    db = get_db()
+    try:
+        results = proofs.review_batch(db, proof_ids, data.get("action"), data.get("admin_notes") or "")
+        tags = proofs.cache_tags(results)
+        data_versions.bump(db, *tags)
         db.commit()
-        
+        page_cache().invalidate(*tags)
+    except (ValueError, TypeError) as e:
+        db.rollback()
+        if request.is_json: return jsonify({"error": str(e)}), 400
+        flash(f"❌ {e}")
+        return redirect(url_for("admin_payment_proofs"))
+    except db.Error as e:
+        db.rollback()
+        app.logger.exception("Bulk review failed")
+        if request.is_json: return jsonify({"error": "database error, nothing was applied"}), 500
+        flash("❌ Database error, nothing was applied.")
+        return redirect(url_for("admin_payment_proofs"))
+    
+    summary = {"approved": 0, "rejected": 0, "skipped": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    if request.is_json:
+        return jsonify({"summary": summary, "results": results})
+    flash(f"✅ {summary['approved']} approved, {summary['rejected']} rejected, {summary['skipped']} skipped.")
     return redirect(url_for("admin_payment_proofs"))
 
 @app.route("/admin/reject_payment_proof/<int:proof_id>", methods=["POST"])
+@admin_required
 def reject_payment_proof(proof_id):
-    if session.get("role") != "admin": return redirect(url_for("login"))
     admin_notes = request.form.get("admin_notes", "")
     
     db = get_db()
-    db.execute("UPDATE payment_proofs SET status='rejected', review_date=?, admin_notes=? WHERE proof_id=?", 
-               (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), admin_notes, proof_id))
+    result = proofs.reject_proof(db, proof_id, admin_notes)
+    data_versions.bump(db, *proofs.cache_tags([result]))
     db.commit()
     return redirect(url_for("admin_payment_proofs"))
 
+# ---------- BACKGROUND JOBS ----------
+def job_response(job, status=200):
+    view = jobs.describe(job)
+    view["url"] = url_for("job_status", job_id=job['id'])
+    if job['kind'] == 'export_transactions' and job['status'] == 'succeeded':
+        view["download_url"] = url_for("job_download", job_id=job['id'])
+    return jsonify(view), status
+
+@app.route("/admin/jobs")
+@admin_required
+def job_list():
+    try:
+        page, next_cursor = jobs.jobs_page(get_db(), request.args.get("cursor"), pagination.page_size(request.args))
+    except ValueError:
+        return jsonify({"error": "invalid cursor"}), 400
+    return jsonify({"jobs": [jobs.describe(job) for job in page], "next_cursor": next_cursor})
+
+@app.route("/admin/jobs/metrics")
+@admin_required
+def job_metrics():
+    return jsonify(jobs.metrics(get_db()))
+
+@app.route("/admin/jobs/<int:job_id>")
+@admin_required
+def job_status(job_id):
+    job = jobs.get_job(get_db(), job_id)
+    if job is None:
+        return jsonify({"error": "no such job"}), 404
+    return job_response(job)
+
+@app.route("/admin/jobs/<int:job_id>/retry", methods=["POST"])
+@admin_required
+def job_retry(job_id):
+    db = get_db()
+    if not jobs.retry(db, job_id):
+        return jsonify({"error": "only failed jobs can be retried"}), 409
+    if app.config['JOBS_INLINE']:
+        jobs.run_pending(db)
+    else:
+        start_job_workers()
+    return job_response(jobs.get_job(db, job_id), 202)
+
+@app.route("/admin/jobs/export", methods=["POST"])
+@admin_required
+def job_export():
+    """Queues an export (same parameters as /admin/export_transactions); clients may send an Idempotency-Key header."""
+    params = request.values.to_dict()
+    try:
+        exports.parse_filters(params)
+    except ValueError:
+        return jsonify({"error": "invalid export filters (dates are YYYY-MM-DD, member_id is a number)"}), 400
+    payload = {"format": "zip" if params.get("format") == "zip" else "xlsx",
+               "filters": {key: params[key] for key in ("start", "end", "member_id") if params.get(key)}}
+    if current_tenant():
+        payload["dir"] = tenants.data_dir(tasks.EXPORT_DIR, current_tenant())
+    return job_response(dispatch("export_transactions", payload, request.headers.get("Idempotency-Key")), 202)
+
+@app.route("/admin/jobs/<int:job_id>/download")
+@admin_required
+def job_download(job_id):
+    job = jobs.get_job(get_db(), job_id)
+    if job is None or job['kind'] != 'export_transactions' or job['status'] != 'succeeded':
+        return jsonify({"error": "no finished export for this job"}), 404
+    path = tasks.export_path(job)
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=os.path.basename(path))
+
+@app.route("/admin/jobs/sheet_sync", methods=["POST"])
+@admin_required
+def job_sheet_sync():
+    # Syncs the changes made so far; repeated clicks within a minute queue it once
+    key = request.headers.get("Idempotency-Key") or f"sheet_sync-{datetime.now().strftime('%Y%m%d%H%M')}"
+    return job_response(dispatch("sheet_sync", sheet_sync_payload(), key), 202)
+
+@app.route("/admin/jobs/backup", methods=["POST"])
+@admin_required
+def job_backup():
+    if storage.is_postgres_url(database_url()):
+        # The job could only fail (it uses the SQLite backup API), like the schedule in start_job_workers
+        return jsonify({"error": "backups use the SQLite backup API, use pg_dump for PostgreSQL"}), 409
+    # At most one backup per minute unless the client supplies its own key
+    key = request.headers.get("Idempotency-Key") or f"backup-{datetime.now().strftime('%Y%m%d%H%M')}"
+    return job_response(dispatch("backup", backup_payload(), key), 202)
+
+@app.route("/admin/import", methods=["POST"])
+@admin_required
+def job_import():
+    """
+    Queues an import of an uploaded .xlsx / .csv history (see bulk_import.py);
+    "kind" names the rows of a CSV whose file name doesn't. The job's result
+    counts the imported rows and lists the rejected ones.
+    """
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": "upload a file in the \"file\" field"}), 400
+    folder = tenants.data_dir(tasks.IMPORT_DIR, current_tenant())
+    try:
+        path, sha256 = bulk_import.save_upload(upload.stream, upload.filename, folder)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    kind = request.form.get("kind") or None
+    try:
+        bulk_import.sections(path, kind)  # a file the job could not even open is refused here
+    except ValueError as e:
+        os.remove(path)
+        return jsonify({"error": str(e)}), 400
+    # The same file uploaded twice is imported once
+    key = request.headers.get("Idempotency-Key") or f"import-{sha256}-{kind or ''}"
+    return job_response(dispatch("bulk_import", {"path": path, "kind": kind}, key), 202)
+
+# ---------- JSON API (v1) ----------
+def api_response(key, scopes, build):
+    """
+    JSON response for the /api/v1 routes. The ETag comes from the data versions
+    of `scopes` (see data_versions.py); a request whose If-None-Match still
+    matches gets 304 and build() is never called.
+    """
+    etag = data_versions.etag(get_db(), key, scopes)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # Per-session data: clients may keep it, but must revalidate every time
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+@app.route("/api/v1/fund")
+@login_required
+def api_fund():
+    """Fund balance and running totals; ?as_of=YYYY-MM-DD[ HH:MM:SS] replays them from the journal (see journal.py)."""
+    if request.args.get("as_of"):
+        try:
+            at = journal.parse_at(request.args["as_of"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return api_response(("fund", at), [cache.FUND],
+                            lambda: {"as_of": at, **journal.summary(journal.as_of(get_db(), at))})
+    return api_response(("fund",), [cache.FUND], lambda: fund_ledger.get_fund_summary(get_db()))
+
+@app.route("/api/v1/loans")
+@login_required
+def api_loans():
+    """Loans with their repayment progress: every loan for admins, a member's own loans otherwise. ?status= filters."""
+    status = request.args.get("status")
+    where, params = ("1=1", []) if current_user().is_admin else ("l.member_id = ?", [current_user().member_id])
+    if status:
+        where, params = f"{where} AND l.status = ?", params + [status]
+
+    def build():
+        loans = repayment_progress(fetch_loans_with_progress(get_db(), where, params))
+        return {"loans": loans}
+    return api_response(("loans", where, tuple(params)), [cache.LOANS], build)
+
+@app.route("/api/v1/loans/<int:loan_id>")
+@login_required
+def api_loan(loan_id):
+    """One loan's repayment progress, its payments and its EMI schedule (admins, or the member who holds it)."""
+    db = get_db()
+    loan = db.execute("SELECT member_id FROM loans WHERE loan_id=?", (loan_id,)).fetchone()
+    if loan is None or (not current_user().is_admin and loan['member_id'] != current_user().member_id):
+        return jsonify({"error": "no such loan"}), 404
+
+    def build():
+        progress = repayment_progress(fetch_loans_with_progress(db, "l.loan_id = ?", [loan_id]))
+        payments = db.execute("""SELECT id, month_no, amount, status, paid_date FROM interest_payments
+                                 WHERE loan_id = ? ORDER BY month_no, id""", (loan_id,)).fetchall()
+        schedule = loan_schedule.by_loan(db, "l.loan_id = ?", [loan_id]).get(loan_id, [])
+        return {"loan": progress[0], "payments": [dict(payment) for payment in payments],
+                "schedule": [dict(row) for row in schedule]}
+    return api_response(("loan", loan_id), [cache.LOANS], build)
+
+@app.route("/api/v1/contributions/<int:year>")
+@admin_required
+def api_contributions(year):
+    """The contribution matrix of `year`: every member's paid months (see contribution_masks.py)."""
+
+    def build():
+        members = [{"member_id": row['member_id'], "name": row['name'], "paid_mask": row['paid_mask'],
+                    "paid_months": contribution_masks.paid_months(row['paid_mask'])}
+                   for row in contribution_masks.year_matrix(get_db(), year)]
+        return {"year": year, "members": members}
+    return api_response(("contributions", year), [cache.contributions_tag(year), cache.MEMBERS], build)
+
+@app.route("/api/v1/proofs/pending")
+@admin_required
+def api_pending_proofs():
+    """Payment proofs waiting for review, newest first."""
+
+    def build():
+        rows = get_db().execute("""SELECT p.proof_id, p.proof_type, p.loan_id, p.member_id, m.name, p.month_no, p.month, p.year,
+                                          p.amount, p.submission_date, l.amount AS loan_amount
+                                   FROM payment_proofs p
+                                   JOIN members m ON p.member_id = m.member_id
+                                   LEFT JOIN loans l ON p.loan_id = l.loan_id
+                                   WHERE p.status = 'pending' ORDER BY p.submission_date DESC""").fetchall()
+        return {"proofs": [dict(row) for row in rows]}
+    return api_response(("pending_proofs",), [cache.PROOFS], build)
+
 if __name__ == "__main__":
     app.run(debug=True)
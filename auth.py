@@ -0,0 +1,194 @@
+"""
+Password hashing and the logged-in member behind a request.
+
+members.password holds a werkzeug hash ("scrypt:..." or "pbkdf2:..."). Rows
+from before hashing still hold the plaintext password; they keep working, and
+the first successful login replaces it with a hash. So does a login whose
+hash was made with other parameters than PASSWORD_HASH_METHOD (rehash on
+login). To hash every remaining plaintext password at once, or count them:
+
+    python auth.py migrate [DATABASE_URL]
+    python auth.py status [DATABASE_URL]
+
+A password check costs ~100 ms of CPU by design. authenticate() runs the
+checks on a pool of HASH_WORKERS threads (default: half the CPUs), so a burst
+of logins queues there instead of putting every server thread to hashing, and
+the other pages keep being served. A login still waiting after HASH_TIMEOUT
+seconds raises Busy.
+
+After login the session only holds the member id. load_principal() turns it
+into a Principal (id, name, role, status), read once and then kept in the
+page cache under the member's tag (see cache.py). app.current_user() keeps it
+for the rest of the request.
+"""
+import hmac
+import os
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import cache
+import migrate
+import storage
+
+DB_NAME = "database.db"
+
+HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+HASH_TIMEOUT = float(os.environ.get("HASH_TIMEOUT", 10))
+HASH_PREFIXES = ("scrypt:", "pbkdf2:")
+
+
+class Principal(namedtuple("Principal", "member_id name role status")):
+    """The logged-in member, as the routes see it."""
+    __slots__ = ()
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+    @property
+    def active(self):
+        return self.status != "inactive"
+
+
+class Busy(Exception):
+    """The hashing pool did not get to a login within HASH_TIMEOUT."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_method_params = None
+_dummy_hash = None
+
+
+def _executor():
+    # Created on first use, so forked server workers each start their own threads
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(HASH_WORKERS, thread_name_prefix="auth-hash")
+    return _pool
+
+
+def _on_pool(function, *args):
+    future = _executor().submit(function, *args)
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        raise Busy()
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=HASH_METHOD)
+
+
+def hash_passwords(passwords):
+    """Hashes of many passwords, computed on the HASH_WORKERS pool (imports, migrate_plaintext)."""
+    return list(_executor().map(hash_password, passwords))
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(HASH_PREFIXES) and stored.count("$") == 2
+
+
+def needs_rehash(stored):
+    """True for plaintext, or a hash made with other parameters than HASH_METHOD."""
+    global _method_params
+    if _method_params is None:
+        _method_params = hash_password("").split("$", 1)[0]
+    return not is_hashed(stored) or stored.split("$", 1)[0] != _method_params
+
+
+def check_password(stored, password):
+    if is_hashed(stored):
+        return check_password_hash(stored, password)
+    return hmac.compare_digest((stored or "").encode(), password.encode())
+
+
+def _verify(stored, password):
+    """Runs on the pool: the check, plus the new hash when the stored one needs replacing."""
+    global _dummy_hash
+    if stored is None:
+        # Unknown username: spend the same time as a real check, so usernames can't be probed by timing
+        _dummy_hash = _dummy_hash or hash_password(os.urandom(16).hex())
+        check_password_hash(_dummy_hash, password)
+        return False, None
+    if not check_password(stored, password):
+        return False, None
+    return True, hash_password(password) if needs_rehash(stored) else None
+
+
+def authenticate(db, username, password):
+    """
+    The Principal for a correct username / password of an active member, else
+    None. Upgrades a plaintext or outdated hash in place (the caller commits).
+    Raises Busy when the hashing pool is backed up.
+    """
+    row = db.execute("SELECT member_id, name, role, status, password FROM members WHERE username = ?",
+                     (username,)).fetchone()
+    ok, new_hash = _on_pool(_verify, row['password'] if row else None, password)
+    if not ok:
+        return None
+    if new_hash:
+        db.execute("UPDATE members SET password = ? WHERE member_id = ?", (new_hash, row['member_id']))
+    user = Principal(row['member_id'], row['name'], row['role'], row['status'])
+    return user if user.active else None
+
+
+def load_principal(db, member_id):
+    """The member's Principal (None when the member no longer exists), cached until the member's tag changes."""
+    def load():
+        row = db.execute("SELECT member_id, name, role, status FROM members WHERE member_id = ?",
+                         (member_id,)).fetchone()
+        return Principal(row['member_id'], row['name'], row['role'], row['status']) if row else None
+    return cache.for_db(db).cached(("principal", member_id), [cache.member_tag(member_id)], load)
+
+
+def password_status(db):
+    """Counts of members by password storage: hashed (current), outdated hash, plaintext."""
+    counts = {"hashed": 0, "outdated": 0, "plaintext": 0}
+    for row in db.execute("SELECT password FROM members"):
+        if not is_hashed(row['password']):
+            counts["plaintext"] += 1
+        else:
+            counts["outdated" if needs_rehash(row['password']) else "hashed"] += 1
+    return counts
+
+
+def migrate_plaintext(db):
+    """Hashes every plaintext password. Does not commit. Returns how many were hashed."""
+    rows = [row for row in db.execute("SELECT member_id, password FROM members") if not is_hashed(row['password'])]
+    hashes = hash_passwords([row['password'] for row in rows])
+    db.executemany("UPDATE members SET password = ? WHERE member_id = ?",
+                   [(new_hash, row['member_id']) for new_hash, row in zip(hashes, rows)])
+    return len(rows)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    db_url = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("DATABASE_URL", DB_NAME)
+
+    conn = storage.connect(db_url)
+    try:
+        migrate.apply_migrations(conn)
+        if command == "migrate":
+            count = migrate_plaintext(conn)
+            conn.commit()
+            print(f"✅ {count} plaintext passwords hashed.")
+        elif command == "status":
+            counts = password_status(conn)
+            print(f"🔐 {counts['hashed']} hashed, {counts['outdated']} outdated (rehashed on next login), "
+                  f"{counts['plaintext']} plaintext")
+            if counts["plaintext"]:
+                print("⚠️ Run `python auth.py migrate` to hash the plaintext passwords now.")
+        else:
+            print("Usage: python auth.py [status|migrate] [DATABASE_URL]")
+            sys.exit(2)
+    finally:
+        conn.close()
@@ -1,46 +1,330 @@
-import shutil
+"""
+Incremental, checksummed snapshots of the SQLite database.
+
+A snapshot is taken with SQLite's online backup API (consistent even while
+the app is writing) and cut into CHUNK_BYTES pieces. Chunks are stored once,
+zlib-compressed and named by the SHA-256 of their content, the same way
+uploads.py stores screenshots:
+
+    backups/chunks/ab/<sha256>.z          chunk contents
+    backups/snapshots/<timestamp>.json.gz chunk list, size and SHA-256 of the whole file
+
+A snapshot therefore only writes (and compresses) the chunks that changed
+since an earlier one, and nothing at all when the database did not change.
+Snapshots older than KEEP_DAYS are pruned together with the chunks no
+remaining snapshot uses; the newest snapshot is always kept.
+
+The app takes a snapshot every BACKUP_INTERVAL seconds on the job queue
+(see tasks.backup). From the command line:
+
+    python backup_db.py [backup] [DATABASE]           take a snapshot now
+    python backup_db.py list                          snapshots, oldest first
+    python backup_db.py verify                        check every stored chunk
+    python backup_db.py restore --at "2025-06-01 18:00" --to restored.db
+
+restore picks the newest snapshot taken at or before --at, checks every
+chunk and the whole file against their checksums and runs PRAGMA
+integrity_check before moving the file into place.
+"""
+import argparse
+import contextlib
+import gzip
+import hashlib
+import json
 import os
-from datetime import datetime
+import sqlite3
+import tempfile
+import threading
 import time
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are still serialized within one process
+    fcntl = None
 
 # Configuration
 SOURCE_DB = "database.db"
 BACKUP_DIR = "backups"
-MAX_BACKUPS = 30  # Keep last 30 days
-
-def create_backup():
-    if not os.path.exists(BACKUP_DIR):
-        os.makedirs(BACKUP_DIR)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_filename = f"database_backup_{timestamp}.db"
-    backup_path = os.path.join(BACKUP_DIR, backup_filename)
-    
+KEEP_DAYS = 30
+CHUNK_BYTES = 4096  # one page at SQLite's default page size, so a changed page costs one chunk
+COMPRESS_LEVEL = 6
+
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _locked(backup_dir):
+    """One snapshot or prune at a time per backup directory (threads and, where fcntl exists, processes)."""
+    with _lock:
+        os.makedirs(backup_dir, exist_ok=True)
+        with open(os.path.join(backup_dir, ".lock"), "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+
+def _chunk_path(backup_dir, digest):
+    return os.path.join(backup_dir, "chunks", digest[:2], digest + ".z")
+
+
+def _write_atomic(path, data):
+    partial = path + ".part"
+    with open(partial, "wb") as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def read_chunk(backup_dir, digest):
+    """Returns a chunk's contents; raises ValueError when it is missing or does not match its checksum."""
+    try:
+        with open(_chunk_path(backup_dir, digest), "rb") as f:
+            data = zlib.decompress(f.read())
+    except (OSError, zlib.error) as e:
+        raise ValueError(f"chunk {digest[:12]} is unreadable: {e}")
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"chunk {digest[:12]} does not match its checksum")
+    return data
+
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Every snapshot manifest, oldest first (each with its file `path`)."""
+    folder = os.path.join(backup_dir, "snapshots")
+    if not os.path.isdir(folder):
+        return []
+    snapshots = []
+    for name in sorted(f for f in os.listdir(folder) if f.endswith(".json.gz")):
+        path = os.path.join(folder, name)
+        with gzip.open(path, "rt") as f:
+            manifest = json.load(f)
+        manifest["path"] = path
+        snapshots.append(manifest)
+    return snapshots
+
+
+def _store(image, backup_dir, taken_at):
+    """Stores the chunks of the snapshot file `image` that are not stored yet, then its manifest."""
+    whole = hashlib.sha256()
+    chunks = []
+    new_chunks = bytes_written = 0
+    with open(image, "rb") as f:
+        for data in iter(lambda: f.read(CHUNK_BYTES), b""):
+            whole.update(data)
+            digest = hashlib.sha256(data).hexdigest()
+            chunks.append(digest)
+            path = _chunk_path(backup_dir, digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                compressed = zlib.compress(data, COMPRESS_LEVEL)
+                _write_atomic(path, compressed)
+                new_chunks += 1
+                bytes_written += len(compressed)
+
+    summary = {"chunks": len(chunks), "new_chunks": new_chunks, "bytes_written": bytes_written,
+               "size": os.path.getsize(image)}
+    snapshots = list_snapshots(backup_dir)
+    if snapshots and snapshots[-1]["sha256"] == whole.hexdigest():
+        # Nothing changed: the previous snapshot already covers this point in time
+        summary.update(snapshot=snapshots[-1]["path"], unchanged=True)
+        return summary
+
+    manifest = {
+        "format": 1,
+        "taken_at": taken_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "size": summary["size"],
+        "sha256": whole.hexdigest(),
+        "chunk_bytes": CHUNK_BYTES,
+        "chunks": chunks,
+    }
+    folder = os.path.join(backup_dir, "snapshots")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, taken_at.strftime("%Y%m%d_%H%M%S_%f") + ".json.gz")
+    _write_atomic(path, gzip.compress(json.dumps(manifest).encode()))
+    bytes_written += os.path.getsize(path)
+    summary.update(snapshot=path, unchanged=False, bytes_written=bytes_written)
+    return summary
+
+
+def backup_database(source, backup_dir=BACKUP_DIR):
+    """
+    Snapshots an open sqlite3 connection into backup_dir, writing only the
+    chunks that changed. Returns a summary dict (snapshot path, chunk counts,
+    bytes written, seconds).
+    """
+    started = time.monotonic()
+    with _locked(backup_dir):
+        taken_at = datetime.now()
+        fd, image = tempfile.mkstemp(dir=backup_dir, suffix=".db.part")
+        os.close(fd)
+        try:
+            # The app runs in WAL mode, recent commits may still live in
+            # database.db-wal. The backup API copies a consistent snapshot
+            # and, in WAL mode, does not hold up the writers meanwhile.
+            target = sqlite3.connect(image)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+            summary = _store(image, backup_dir, taken_at)
+        finally:
+            os.remove(image)
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    return summary
+
+
+def prune(backup_dir=BACKUP_DIR, keep_days=KEEP_DAYS):
+    """Removes snapshots older than keep_days (never the newest) and unused chunks; returns (snapshots, chunks) removed."""
+    with _locked(backup_dir):
+        snapshots = list_snapshots(backup_dir)
+        cutoff = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d %H:%M:%S")
+        expired = [s for s in snapshots[:-1] if s["taken_at"] < cutoff]
+        for snapshot in expired:
+            os.remove(snapshot["path"])
+
+        kept = snapshots[len(expired):]
+        used = {digest for snapshot in kept for digest in snapshot["chunks"]}
+        removed_chunks = 0
+        for root, _, files in os.walk(os.path.join(backup_dir, "chunks")):
+            for name in files:
+                # Leftovers of an interrupted snapshot (.part) go as well
+                if name.endswith(".part") or name[:-len(".z")] not in used:
+                    os.remove(os.path.join(root, name))
+                    removed_chunks += 1
+        for name in os.listdir(backup_dir):
+            if name.endswith(".db.part"):
+                os.remove(os.path.join(backup_dir, name))
+    return len(expired), removed_chunks
+
+
+def verify_backups(backup_dir=BACKUP_DIR):
+    """Checks every chunk the snapshots refer to; returns a list of (snapshot path, problem)."""
+    problems = []
+    checked = {}
+    for snapshot in list_snapshots(backup_dir):
+        for digest in snapshot["chunks"]:
+            if digest not in checked:
+                try:
+                    read_chunk(backup_dir, digest)
+                    checked[digest] = None
+                except ValueError as e:
+                    checked[digest] = str(e)
+            if checked[digest]:
+                problems.append((snapshot["path"], checked[digest]))
+                break
+    return problems
+
+
+def find_snapshot(backup_dir=BACKUP_DIR, at=None):
+    """The newest snapshot taken at or before `at` (a datetime; None for the newest), or None."""
+    snapshots = list_snapshots(backup_dir)
+    if at is not None:
+        limit = at.strftime("%Y-%m-%d %H:%M:%S")
+        snapshots = [s for s in snapshots if s["taken_at"] <= limit]
+    return snapshots[-1] if snapshots else None
+
+
+def restore(target, at=None, backup_dir=BACKUP_DIR, force=False):
+    """
+    Rebuilds the database as it was at `at` (newest snapshot at or before it)
+    into `target`. The file only replaces `target` once its checksums and
+    SQLite's integrity check pass. Returns the snapshot used.
+    """
+    snapshot = find_snapshot(backup_dir, at)
+    if snapshot is None:
+        raise LookupError(f"no snapshot taken at or before {at}" if at else "no snapshots yet")
+    if os.path.exists(target) and not force:
+        raise FileExistsError(f"{target} exists (stop the app and pass --force to overwrite it)")
+
+    partial = target + ".restore-part"
+    whole = hashlib.sha256()
+    try:
+        with open(partial, "wb") as out:
+            for digest in snapshot["chunks"]:
+                data = read_chunk(backup_dir, digest)
+                whole.update(data)
+                out.write(data)
+        if whole.hexdigest() != snapshot["sha256"]:
+            raise ValueError("restored file does not match the snapshot checksum")
+        check = sqlite3.connect(partial)
+        try:
+            result = check.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            check.close()
+        if result != "ok":
+            raise ValueError(f"integrity_check failed: {result}")
+
+        # A -wal left by the old file would be replayed onto the restored one
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(target + suffix):
+                os.remove(target + suffix)
+        os.replace(partial, target)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return snapshot
+
+
+def create_backup(source_db=SOURCE_DB, backup_dir=BACKUP_DIR):
     try:
-        if os.path.exists(SOURCE_DB):
-            shutil.copy2(SOURCE_DB, backup_path)
-            print(f"✅ Backup created: {backup_path}")
-            cleanup_old_backups()
+        if os.path.exists(source_db):
+            source = sqlite3.connect(source_db)
+            try:
+                summary = backup_database(source, backup_dir)
+            finally:
+                source.close()
+            if summary["unchanged"]:
+                print(f"✅ No changes since {summary['snapshot']}")
+            else:
+                print(f"✅ Backup created: {summary['snapshot']} ({summary['new_chunks']} of {summary['chunks']} chunks "
+                      f"changed, {summary['bytes_written']:,} bytes written in {summary['seconds']}s)")
+            expired, chunks = prune(backup_dir)
+            if expired or chunks:
+                print(f"🗑️ Removed {expired} old snapshots and {chunks} unused chunks")
         else:
-            print(f"❌ Source database not found: {SOURCE_DB}")
+            print(f"❌ Source database not found: {source_db}")
     except Exception as e:
         print(f"❌ Backup failed: {e}")
 
-def cleanup_old_backups():
-    """Removes old backups to save space, keeping only the recent ones."""
-    try:
-        backups = sorted(
-            [os.path.join(BACKUP_DIR, f) for f in os.listdir(BACKUP_DIR) if f.startswith("database_backup_")],
-            key=os.path.getmtime
-        )
-        
-        while len(backups) > MAX_BACKUPS:
-            oldest = backups.pop(0)
-            os.remove(oldest)
-            print(f"🗑️ Removed old backup: {oldest}")
-            
-    except Exception as e:
-        print(f"⚠️ Cleanup failed: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental SQLite backups with point-in-time restore.")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="backup directory (default: backups)")
+    commands = parser.add_subparsers(dest="command")
+    backup = commands.add_parser("backup", help="take a snapshot now")
+    backup.add_argument("database", nargs="?", default=SOURCE_DB)
+    commands.add_parser("list", help="list snapshots")
+    commands.add_parser("verify", help="check every stored chunk against its checksum")
+    restore_cmd = commands.add_parser("restore", help="rebuild the database as of a point in time")
+    restore_cmd.add_argument("--at", help='"YYYY-MM-DD HH:MM[:SS]" (default: the newest snapshot)')
+    restore_cmd.add_argument("--to", default="database_restored.db", help="file to write (default: database_restored.db)")
+    restore_cmd.add_argument("--force", action="store_true", help="overwrite --to if it exists")
+    args = parser.parse_args()
+
+    if args.command in (None, "backup"):
+        create_backup(getattr(args, "database", SOURCE_DB), args.dir)
+    elif args.command == "list":
+        snapshots = list_snapshots(args.dir)
+        for snapshot in snapshots:
+            print(f"{snapshot['taken_at']}  {snapshot['size']:>12,} bytes  {os.path.basename(snapshot['path'])}")
+        print(f"📦 {len(snapshots)} snapshots")
+    elif args.command == "verify":
+        problems = verify_backups(args.dir)
+        if problems:
+            print("❌ Damaged snapshots:")
+            for path, problem in problems:
+                print(f"   {os.path.basename(path)}: {problem}")
+            raise SystemExit(1)
+        print(f"✅ All {len(list_snapshots(args.dir))} snapshots are complete and match their checksums.")
+    else:
+        try:
+            at = datetime.fromisoformat(args.at) if args.at else None
+            snapshot = restore(args.to, at, args.dir, args.force)
+        except (ValueError, LookupError, FileExistsError) as e:
+            print(f"❌ Restore failed: {e}")
+            raise SystemExit(1)
+        print(f"✅ Restored the snapshot of {snapshot['taken_at']} into {args.to} (checksums and integrity_check passed)")
+
 
 if __name__ == "__main__":
-    create_backup()
+    main()
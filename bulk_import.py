@@ -0,0 +1,639 @@
+"""
+Bulk import of a group's history (members, contributions, loans and their
+repayments) from an Excel workbook or CSV files.
+
+Rows are streamed from the file and handled CHUNK at a time: each chunk is
+validated against the members and rows already known, the good rows go in
+with one executemany() per table, and every bad row is reported with its
+sheet, line and reason instead of stopping the import. The whole import is one
+transaction (the caller commits): run it again after fixing the file and the
+rows already in are reported as "already recorded".
+
+A workbook may hold one sheet per kind, named after it and imported in this
+order; a CSV file (or a workbook with a single sheet) is one kind, given on
+the command line or taken from the file name (e.g. contributions_2023.csv):
+
+    members         name, username, password [, join_date]
+    contributions   username, year, month [, amount, status, paid_date]
+    loans           username, amount, months, date [, interest_rate, status]
+    payments        username, loan_date, month_no, amount, paid_date
+
+Dates are YYYY-MM-DD (or with HH:MM:SS, or Excel dates), months 1-12 or
+month names. A contribution is paid (on the 1st of its month) unless its
+status says pending; a loan is approved on its date unless its status says
+pending or rejected. Payments name their loan by member and loan date and
+must be listed in the order they were paid: the loan balance is carried
+forward exactly like /update_interest does.
+
+The imported money lands in the journal with its own dates, so the balances
+on past dates include it; the monthly snapshots after the earliest imported
+date are taken again. Fund totals, contribution masks and loan schedules are
+rebuilt once at the end, and spreadsheet targets get a full copy on their
+next sync. When a new group's history comes in (more contributions than
+one chunk into a nearly empty table), the secondary indexes of the
+contributions and journal tables are dropped and built once at the end; on a
+table that is already large, keeping them is faster. On PostgreSQL the drop
+keeps other readers of those tables waiting until the import commits.
+
+    python bulk_import.py import <file> [members|contributions|loans|payments] [DATABASE_URL]
+    python bulk_import.py check <file> [kind] [DATABASE_URL]      validate only, nothing is saved
+"""
+import calendar
+import csv
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime
+from functools import lru_cache
+
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from werkzeug.utils import secure_filename
+
+import auth
+import cache
+import contribution_masks
+import data_versions
+import fund_ledger
+import journal
+import loan_schedule
+import migrate
+import storage
+
+DB_NAME = "database.db"
+
+CHUNK = 5000
+REPORTED_REJECTIONS = 500  # the report lists this many; the count covers all of them
+CONTRIBUTION = 200  # default amount, as /update_contribution_status records
+INTEREST_RATE = 1  # default rate, as /request_loan records
+EXTENSIONS = ("csv", "xlsx")
+UPLOAD_CHUNK = 1024 * 1024
+
+KINDS = ("members", "contributions", "loans", "payments")
+# kind -> (required columns, optional columns)
+COLUMNS = {
+    "members": (("name", "username", "password"), ("join_date",)),
+    "contributions": (("username", "year", "month"), ("amount", "status", "paid_date")),
+    "loans": (("username", "amount", "months", "date"), ("interest_rate", "status")),
+    "payments": (("username", "loan_date", "month_no", "amount", "paid_date"), ()),
+}
+# Tables whose secondary indexes are built once after a large import
+DEFERRED_INDEX_TABLES = ("monthly_contributions", "journal")
+
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}(:\d{2})?)?$")
+_MONTHS = {name.lower(): number for names in (calendar.month_name, calendar.month_abbr)
+           for number, name in enumerate(names) if name}
+
+
+class Rejected(ValueError):
+    """A row that can't be imported; the message says why."""
+
+
+# ---------- reading ----------
+def _column(name):
+    return str(name or "").strip().lower().replace(" ", "_").replace("-", "_")
+
+
+def _kind_from_name(path):
+    stem = _column(os.path.splitext(os.path.basename(path))[0])
+    for kind in KINDS:
+        if stem.startswith(kind) or stem.startswith(kind.rstrip("s")):
+            return kind
+    return None
+
+
+def _records(rows):
+    """(line number, {column: value}) of the non-empty rows after the header."""
+    header = [_column(name) for name in next(rows, None) or ()]
+    for line, row in enumerate(rows, start=2):
+        values = ["" if value is None else value for value in row]
+        if all(isinstance(value, str) and not value.strip() for value in values):
+            continue
+        yield line, dict(zip(header, values))
+
+
+def _check_header(title, kind, header):
+    missing = [column for column in COLUMNS[kind][0] if column not in header]
+    if missing:
+        raise ValueError(f"{title}: missing column{'s' if len(missing) > 1 else ''} {', '.join(missing)}")
+
+
+def sections(path, kind=None):
+    """
+    [(sheet title, kind, records)] of a file, in import order. Raises
+    ValueError for a file that can't be imported at all (unknown type or
+    kind, missing columns).
+    """
+    extension = path.rsplit(".", 1)[-1].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError("import files are .xlsx or .csv")
+    if kind is not None and kind not in KINDS:
+        raise ValueError(f"unknown kind {kind!r} (use {', '.join(KINDS)})")
+
+    if extension == "csv":
+        kind = kind or _kind_from_name(path)
+        if kind is None:
+            raise ValueError("name the kind of rows in the CSV file (members, contributions, loans or payments)")
+        f = open(path, newline="", encoding="utf-8-sig")
+        try:
+            _check_header(os.path.basename(path), kind, [_column(name) for name in next(csv.reader(f), [])])
+        except ValueError:
+            f.close()
+            raise
+        f.seek(0)
+
+        def rows():
+            try:
+                yield from csv.reader(f)
+            finally:
+                f.close()
+        return [(os.path.basename(path), kind, _records(rows()))]
+
+    try:
+        book = load_workbook(path, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile, KeyError):
+        raise ValueError("not a readable .xlsx workbook")
+    named = {_column(ws.title): ws for ws in book.worksheets}
+    found = [(named[k].title, k, named[k]) for k in KINDS if k in named]
+    if not found and len(book.worksheets) == 1:
+        single = kind or _kind_from_name(path)
+        if single:
+            found = [(book.worksheets[0].title, single, book.worksheets[0])]
+    if kind is not None:
+        found = [section for section in found if section[1] == kind]
+    if not found:
+        book.close()
+        raise ValueError(f"no sheet named {', '.join(KINDS)} in the workbook")
+    try:
+        for title, sheet_kind, ws in found:
+            header = next(ws.iter_rows(max_row=1, values_only=True), ())
+            _check_header(title, sheet_kind, [_column(name) for name in header])
+    except ValueError:
+        book.close()
+        raise
+    return [(title, sheet_kind, _records(ws.iter_rows(values_only=True))) for title, sheet_kind, ws in found]
+
+
+def save_upload(stream, filename, folder):
+    """
+    Streams an uploaded file into `folder` and returns (path, sha256). The
+    stored name keeps the original one in front, so a CSV's kind still comes
+    from it (contributions_2023-<hash>.csv).
+    """
+    stem, extension = os.path.splitext(secure_filename(filename or ""))
+    extension = extension[1:].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError("import files are .xlsx or .csv")
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, partial = tempfile.mkstemp(dir=folder, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        sha256 = digest.hexdigest()
+        path = os.path.join(folder, f"{stem}-{sha256[:16]}.{extension}")
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return path, sha256
+
+
+def _chunks(records, size=CHUNK):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------- values ----------
+def _text(record, column, required=True):
+    value = record.get(column, "")
+    value = str(value).strip() if value is not None else ""
+    if required and not value:
+        raise Rejected(f"{column} is empty")
+    return value
+
+
+def _number(record, column, default=None, whole=False, positive=True):
+    value = record.get(column, "")
+    if isinstance(value, str):
+        value = value.strip().replace(",", "")
+    if value in ("", None):
+        if default is None:
+            raise Rejected(f"{column} is empty")
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise Rejected(f"{column} {value!r} is not a number")
+    if whole and not number.is_integer():
+        raise Rejected(f"{column} {value!r} is not a whole number")
+    if positive and number <= 0:
+        raise Rejected(f"{column} must be more than 0")
+    return int(number) if number.is_integer() else number
+
+
+@lru_cache(maxsize=4096)
+def _parse_moment(text):
+    """'YYYY-MM-DD HH:MM:SS' of a YYYY-MM-DD[ HH:MM[:SS]] text, None when it isn't one (dates repeat, hence the cache)."""
+    if not _DATE.match(text):
+        return None
+    try:
+        return datetime.fromisoformat(text).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def _moment(record, column, required=True, now=None):
+    """'YYYY-MM-DD HH:MM:SS' of a date / datetime cell or text, None when empty and optional."""
+    value = record.get(column, "")
+    if isinstance(value, datetime):
+        text = value.strftime("%Y-%m-%d %H:%M:%S")
+    elif isinstance(value, date):
+        text = value.strftime("%Y-%m-%d 00:00:00")
+    else:
+        value = str(value or "").strip()
+        if not value:
+            if required:
+                raise Rejected(f"{column} is empty")
+            return None
+        text = _parse_moment(value)
+        if text is None:
+            raise Rejected(f"{column} {value!r} is not a YYYY-MM-DD date")
+    if now and text > now:
+        raise Rejected(f"{column} {text[:10]} is in the future")
+    return text
+
+
+def _month(record):
+    value = record.get("month", "")
+    if isinstance(value, str) and value.strip().lower() in _MONTHS:
+        return _MONTHS[value.strip().lower()]
+    month = _number(record, "month", whole=True)
+    if month not in contribution_masks.MONTHS:
+        raise Rejected(f"month {month} is not 1-12")
+    return month
+
+
+def _choice(record, column, choices, default):
+    value = _text(record, column, required=False).lower() or default
+    if value not in choices:
+        raise Rejected(f"{column} {value!r} is not one of {', '.join(choices)}")
+    return value
+
+
+# ---------- importing ----------
+class _Import:
+    """State carried across the chunks and sections of one import."""
+
+    def __init__(self, db):
+        self.db = db
+        self.now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.counts = {kind: 0 for kind in KINDS}
+        self.rejected = 0
+        self.rejections = []
+        self.members = {row['username']: row['member_id']
+                        for row in db.execute("SELECT member_id, username FROM members")}
+        self.contribution_keys = None  # {(member_id, year, month)}, read on the first contribution chunk
+        self.existing_contributions = 0
+        self.loans = None  # {(member_id, loan date): [loan rows]} of approved loans
+        self.payment_keys = None
+        self.balances = {}  # loan_id -> [remaining balance, closed_time] once a payment moved it
+        self.first_event = None
+        self.tags = set()
+        self.deferred = []  # (name, CREATE INDEX sql) dropped until the end
+
+    def reject(self, title, line, reason):
+        self.rejected += 1
+        if len(self.rejections) < REPORTED_REJECTIONS:
+            self.rejections.append({"sheet": title, "row": line, "reason": reason})
+
+    def member(self, record):
+        username = _text(record, "username")
+        member_id = self.members.get(username)
+        if member_id is None:
+            raise Rejected(f"no member with username {username!r}")
+        return member_id
+
+    def append_events(self, events):
+        """Appends (occurred_at, kind, member_id, loan_id, ref_id, amount, interest, balance) events."""
+        if not events:
+            return
+        self.db.executemany("""INSERT INTO journal (occurred_at, kind, member_id, loan_id, ref_id, amount, interest, balance)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", events)
+        first = min(event[0] for event in events)
+        self.first_event = min(self.first_event or first, first)
+
+
+def _validated(state, title, chunk, validate):
+    rows = []
+    for line, record in chunk:
+        try:
+            rows.append(validate(record))
+        except Rejected as e:
+            state.reject(title, line, str(e))
+    return rows
+
+
+def _new_ids(db, table, id_column, key_columns, after, keys):
+    """
+    {key: [ids]} of the rows inserted after id `after` whose key_columns are
+    in `keys` (a concurrent writer's rows are left out by their keys).
+    """
+    found = {}
+    for row in db.execute(f"SELECT {id_column}, {', '.join(key_columns)} FROM {table} WHERE {id_column} > ? "
+                          f"ORDER BY {id_column}", (after,)):
+        key = tuple(row[column] for column in key_columns)
+        if key in keys:
+            found.setdefault(key, []).append(row[0])
+    return found
+
+
+def _max_id(db, table, id_column):
+    return db.execute(f"SELECT COALESCE(MAX({id_column}), 0) FROM {table}").fetchone()[0]
+
+
+def _import_members(state, title, chunk):
+    db, seen = state.db, set()
+
+    def validate(record):
+        name, username, password = _text(record, "name"), _text(record, "username"), _text(record, "password")
+        if username in state.members:
+            raise Rejected(f"username {username!r} is already taken")
+        if username in seen:
+            raise Rejected(f"username {username!r} appears twice")
+        seen.add(username)
+        join_date = _moment(record, "join_date", required=False, now=state.now) or state.now
+        return [name, username, password, join_date]
+
+    rows = _validated(state, title, chunk, validate)
+    if not rows:
+        return
+    # Kept as is when the file already holds hashes (moving from another install)
+    plain = [row for row in rows if not auth.is_hashed(row[2])]
+    for row, hashed in zip(plain, auth.hash_passwords([row[2] for row in plain])):
+        row[2] = hashed
+    db.executemany("INSERT INTO members (name, username, password, role, join_date) VALUES (?, ?, ?, 'member', ?)",
+                   rows)
+    usernames = {row[1] for row in rows}
+    state.members.update((row['username'], row['member_id'])
+                         for row in db.execute("SELECT member_id, username FROM members")
+                         if row['username'] in usernames)
+    state.counts["members"] += len(rows)
+    state.tags.add(cache.MEMBERS)
+
+
+def _import_contributions(state, title, chunk):
+    db = state.db
+    if state.contribution_keys is None:
+        state.contribution_keys = {(row['member_id'], row['year'], row['month'])
+                                   for row in db.execute("SELECT member_id, year, month FROM monthly_contributions")}
+        state.existing_contributions = len(state.contribution_keys)
+    keys = state.contribution_keys
+
+    def validate(record):
+        member_id, year, month = state.member(record), _number(record, "year", whole=True), _month(record)
+        if not 1900 < year < 3000:
+            raise Rejected(f"year {year} is not a year")
+        if (member_id, year, month) in keys:
+            raise Rejected(f"{calendar.month_name[month]} {year} of {record['username']} is already recorded")
+        status = _choice(record, "status", ("paid", "pending"), "paid")
+        paid_date = None
+        if status == "paid":
+            paid_date = _moment(record, "paid_date", required=False, now=state.now) \
+                or f"{year:04d}-{month:02d}-01 00:00:00"
+        keys.add((member_id, year, month))
+        return (member_id, month, year, _number(record, "amount", CONTRIBUTION), status, paid_date)
+
+    rows = _validated(state, title, chunk, validate)
+    if not rows:
+        return
+    if len(chunk) == CHUNK and state.existing_contributions < CHUNK and not state.deferred:
+        _defer_indexes(state)
+    after = _max_id(db, "monthly_contributions", "id")
+    db.executemany("""INSERT INTO monthly_contributions (member_id, month, year, amount, status, paid_date)
+                      VALUES (?, ?, ?, ?, ?, ?)""", rows)
+    ids = _new_ids(db, "monthly_contributions", "id", ("member_id", "month", "year"), after,
+                   {row[:3] for row in rows})
+    state.append_events([(paid_date, journal.CONTRIBUTION, member_id, None, ids[(member_id, month, year)][0], amount, 0, None)
+                   for member_id, month, year, amount, status, paid_date in rows if status == "paid"])
+    state.counts["contributions"] += len(rows)
+    state.tags.update([cache.FUND, *{cache.contributions_tag(row[2]) for row in rows},
+                       *{cache.member_tag(row[0]) for row in rows}])
+
+
+def _approved_loans(state):
+    if state.loans is None:
+        state.loans = {}
+        for row in state.db.execute("""SELECT loan_id, member_id, amount, principal_portion, interest_rate_percent,
+                                              remaining_balance, repayment_status, closed_time, approved_time
+                                       FROM loans WHERE status IN ('approved', 'paid')"""):
+            state.loans.setdefault((row['member_id'], (row['approved_time'] or "")[:10]), []).append(dict(row))
+    return state.loans
+
+
+def _import_loans(state, title, chunk):
+    db, loans = state.db, _approved_loans(state)
+
+    def validate(record):
+        member_id, amount = state.member(record), _number(record, "amount")
+        months = _number(record, "months", whole=True)
+        rate = _number(record, "interest_rate", INTEREST_RATE, positive=False)
+        moment = _moment(record, "date", now=state.now)
+        status = _choice(record, "status", ("approved", "pending", "rejected"), "approved")
+        if status == "approved" and any(loan['amount'] == amount for loan in loans.get((member_id, moment[:10]), ())):
+            raise Rejected(f"the {amount} loan of {record['username']} on {moment[:10]} is already recorded")
+        # The same EMI parts /request_loan stores
+        interest_portion, principal_portion = int(amount * rate / 100), int(amount / months)
+        return (member_id, amount, rate, interest_portion, months, status, "open", moment,
+                moment if status == "approved" else None, principal_portion + interest_portion, principal_portion,
+                interest_portion, amount)
+
+    rows = _validated(state, title, chunk, validate)
+    events = []
+    # One statement per loan for its id: a group has hundreds of loans, not hundreds of thousands
+    for row in rows:
+        loan_id = db.execute("""INSERT INTO loans (member_id, amount, interest_rate_percent, interest_per_month,
+                                                   total_months, status, repayment_status, request_time, approved_time,
+                                                   emi_amount, principal_portion, interest_portion, remaining_balance)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING loan_id""", row).fetchone()[0]
+        member_id, amount, rate, status, moment = row[0], row[1], row[2], row[5], row[7]
+        if status == "approved":
+            loans.setdefault((member_id, moment[:10]), []).append(
+                {"loan_id": loan_id, "member_id": member_id, "amount": amount, "principal_portion": row[10],
+                 "interest_rate_percent": rate, "remaining_balance": amount, "repayment_status": "open",
+                 "closed_time": None, "approved_time": moment})
+            events.append((moment, journal.LOAN_ISSUED, member_id, loan_id, None, amount, 0, amount))
+        state.tags.add(cache.member_tag(member_id))
+    state.append_events(events)
+    state.counts["loans"] += len(rows)
+    if rows:
+        state.tags.update((cache.LOANS, cache.FUND))
+
+
+def _import_payments(state, title, chunk):
+    db, loans = state.db, _approved_loans(state)
+    if state.payment_keys is None:
+        state.payment_keys = {(row['loan_id'], row['month_no'], row['paid_date'])
+                              for row in db.execute("""SELECT loan_id, month_no, paid_date
+                                                       FROM interest_payments WHERE status = 'paid'""")}
+
+    def validate(record):
+        member_id = state.member(record)
+        loan_date = _moment(record, "loan_date")[:10]
+        matches = loans.get((member_id, loan_date), [])
+        if len(matches) != 1:
+            raise Rejected(f"{record['username']} has {'no approved loan' if not matches else 'two loans'} "
+                           f"on {loan_date}")
+        loan = matches[0]
+        month_no, amount = _number(record, "month_no", whole=True), _number(record, "amount")
+        paid_date = _moment(record, "paid_date", now=state.now)
+        key = (loan['loan_id'], month_no, paid_date)
+        if key in state.payment_keys:
+            raise Rejected(f"payment {month_no} of loan {loan['loan_id']} on {paid_date[:10]} is already recorded")
+        if paid_date < loan.get('last_paid', ""):
+            raise Rejected(f"paid before the loan's previous payment ({loan['last_paid'][:10]}), list them in order")
+        loan['last_paid'] = paid_date
+        state.payment_keys.add(key)
+        return loan, month_no, amount, paid_date
+
+    payments = _validated(state, title, chunk, validate)
+    if not payments:
+        return
+    after = _max_id(db, "interest_payments", "id")
+    db.executemany("INSERT INTO interest_payments (loan_id, month_no, amount, status, paid_date) VALUES (?, ?, ?, 'paid', ?)",
+                   [(loan['loan_id'], month_no, amount, paid_date) for loan, month_no, amount, paid_date in payments])
+    ids = _new_ids(db, "interest_payments", "id", ("loan_id", "month_no", "paid_date"), after,
+                   {(loan['loan_id'], month_no, paid_date) for loan, month_no, amount, paid_date in payments})
+    events = []
+    for loan, month_no, amount, paid_date in payments:
+        # The balance arithmetic of /update_interest, one payment after the other
+        balance = loan['remaining_balance']
+        balance -= amount - balance * loan['interest_rate_percent'] / 100
+        if balance <= 1:
+            balance = 0
+            if loan['repayment_status'] != 'closed':
+                loan['repayment_status'], loan['closed_time'] = 'closed', paid_date
+        loan['remaining_balance'] = balance
+        state.balances[loan['loan_id']] = loan
+        payment_id = ids[(loan['loan_id'], month_no, paid_date)].pop(0)
+        events.append((paid_date, journal.REPAYMENT, loan['member_id'], loan['loan_id'], payment_id, amount,
+                       fund_ledger.repayment_interest(loan, month_no), balance))
+        state.tags.add(cache.member_tag(loan['member_id']))
+    state.append_events(events)
+    state.counts["payments"] += len(payments)
+    state.tags.update((cache.LOANS, cache.FUND))
+
+
+IMPORTERS = {"members": _import_members, "contributions": _import_contributions, "loans": _import_loans,
+             "payments": _import_payments}
+
+
+def _defer_indexes(state):
+    """Drops the non-unique indexes of DEFERRED_INDEX_TABLES until _build_deferred_indexes()."""
+    db = state.db
+    if db.dialect == "postgres":
+        indexes = db.execute("""SELECT indexname, indexdef FROM pg_indexes
+                                WHERE schemaname = current_schema() AND tablename IN (?, ?)
+                                AND indexdef NOT LIKE 'CREATE UNIQUE%%'""", DEFERRED_INDEX_TABLES).fetchall()
+    else:
+        indexes = db.execute("""SELECT name, sql FROM sqlite_master
+                                WHERE type = 'index' AND tbl_name IN (?, ?) AND sql IS NOT NULL
+                                AND sql NOT LIKE 'CREATE UNIQUE%'""", DEFERRED_INDEX_TABLES).fetchall()
+    for name, sql in indexes:
+        db.execute(f"DROP INDEX {name}")
+        state.deferred.append((name, sql))
+
+
+def _build_deferred_indexes(state):
+    for _, sql in state.deferred:
+        state.db.execute(sql)
+    state.deferred = []
+
+
+def _finish(state):
+    db, counts = state.db, state.counts
+    _build_deferred_indexes(state)
+    if state.balances:
+        db.executemany("UPDATE loans SET remaining_balance = ?, repayment_status = ?, closed_time = ? WHERE loan_id = ?",
+                       [(loan['remaining_balance'], loan['repayment_status'], loan['closed_time'], loan_id)
+                        for loan_id, loan in state.balances.items()])
+    if counts["contributions"] or counts["loans"] or counts["payments"]:
+        fund_ledger.rebuild_fund_summary(db)
+        contribution_masks.rebuild_masks(db)
+    if counts["loans"] or counts["payments"]:
+        loan_schedule.rebuild(db)
+    if state.first_event:
+        # Snapshots taken before these events existed are wrong from the first one on
+        db.execute("DELETE FROM journal_snapshots WHERE period_end > ?", (state.first_event,))
+        journal.take_snapshots(db)
+    if counts["contributions"] or counts["payments"]:
+        # Too many rows for the change log: the next sync of every target copies everything
+        db.execute("UPDATE sync_cursors SET last_seq = NULL")
+    data_versions.bump(db, *state.tags)
+
+
+def import_file(db, path, kind=None):
+    """
+    Imports every section of `path` (see sections()). Does not commit. Returns
+    (report, cache tags): the report has the imported count of each kind, the
+    number of rejected rows and the first REPORTED_REJECTIONS of them.
+    """
+    started = time.perf_counter()
+    found = sections(path, kind)
+    if db.dialect == "sqlite" and not db.in_transaction:
+        db.execute("BEGIN")  # sqlite3 would commit the index drops on their own otherwise
+    state = _Import(db)
+    for title, section_kind, records in found:
+        for chunk in _chunks(records):
+            IMPORTERS[section_kind](state, title, chunk)
+    _finish(state)
+    report = {**state.counts, "rejected": state.rejected, "rejections": state.rejections,
+              "seconds": round(time.perf_counter() - started, 2)}
+    return report, sorted(state.tags)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    args = sys.argv[2:]
+    if command not in ("import", "check") or not args:
+        print("Usage: python bulk_import.py import|check <file> [members|contributions|loans|payments] [DATABASE_URL]")
+        sys.exit(2)
+    path, kind = args[0], args[1] if len(args) > 1 and args[1] in KINDS else None
+    rest = args[2:] if kind else args[1:]
+    db_url = rest[0] if rest else os.environ.get("DATABASE_URL", DB_NAME)
+
+    conn = storage.connect(db_url)
+    try:
+        migrate.apply_migrations(conn)
+        try:
+            report, _ = import_file(conn, path, kind)
+        except (ValueError, OSError) as e:
+            print(f"❌ Could not import {path}: {e}")
+            sys.exit(1)
+        if command == "import":
+            conn.commit()
+        else:
+            conn.rollback()
+        done = ", ".join(f"{report[k]} {k}" for k in KINDS if report[k])
+        print(f"{'✅ Imported' if command == 'import' else '🔎 Would import'} {done or 'nothing'} "
+              f"in {report['seconds']:.2f}s.")
+        if report["rejected"]:
+            print(f"⚠️ {report['rejected']} rows rejected:")
+            for rejection in report["rejections"][:20]:
+                print(f"   {rejection['sheet']} row {rejection['row']}: {rejection['reason']}")
+            if command == "check":
+                sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,186 @@
+"""
+In-process cache for read-heavy pages, invalidated by the write routes.
+
+Entries are kept in an LRU (MAXSIZE entries, TTL seconds) and carry tags such
+as "loans", "members", "contributions:2025" or "member:7". A write route calls
+invalidate() with the tags it touched, after its commit; every entry holding
+one of them is then stale and is recomputed on its next read.
+
+Invalidation is generation based: each tag has a counter and an entry
+remembers the counters it was computed under. A page computed while a write
+was landing is therefore never stored as fresh.
+
+With CACHE_SHARED_DIR set, tag generations are also kept as small files in that
+directory (replaced atomically on invalidate), so an invalidation in one
+gunicorn worker or `python jobs.py work` process reaches every other process
+on the host. Reads then cost one stat() per tag.
+
+Counters (hits, misses, evictions, expirations, stale, invalidations) are
+returned by stats().
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import storage
+
+MAXSIZE = 512
+TTL_SECONDS = 60
+
+# Tags used by the app
+LOANS = "loans"      # loans and their repayments (loan_tracking)
+MEMBERS = "members"  # the member list (contribution_tracking)
+FUND = "fund"        # fund balance and totals (no cached page, used for the API ETags, see data_versions.py)
+PROOFS = "proofs"    # the pending proof queue (API only, like FUND)
+
+
+def contributions_tag(year):
+    return f"contributions:{year}"
+
+
+def member_tag(member_id):
+    return f"member:{member_id}"
+
+
+_MISS = object()
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class Cache:
+    def __init__(self, maxsize=MAXSIZE, ttl=TTL_SECONDS, shared_dir=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_dir = shared_dir
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+        self._entries = OrderedDict()  # key -> (value, expires_at, tags, stamp)
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "stale": 0,
+            "invalidations": 0,
+        }
+
+    def _tag_file(self, tag):
+        return os.path.join(self.shared_dir, tag.replace(":", "_").replace("/", "_"))
+
+    def _stamp(self, tags):
+        stamp = []
+        for tag in tags:
+            shared = None
+            if self.shared_dir:
+                try:
+                    st = os.stat(self._tag_file(tag))
+                    shared = (st.st_ino, st.st_mtime_ns)
+                except FileNotFoundError:
+                    pass
+            stamp.append((self._generations.get(tag, 0), shared))
+        return tuple(stamp)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            value, expires_at, tags, stamp = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            if self._stamp(tags) != stamp:
+                del self._entries[key]
+                self._stats["stale"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def cached(self, key, tags, compute):
+        """Returns the cached value for `key`, or computes, stores and returns it."""
+        value = self.get(key, _MISS)
+        if value is not _MISS:
+            return value
+        with self._lock:
+            stamp = self._stamp(tags)
+        value = compute()
+        with self._lock:
+            if self._stamp(tags) != stamp:
+                return value  # invalidated while computing, do not keep it
+            self._entries[key] = (value, time.monotonic() + self.ttl, tuple(tags), stamp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return value
+
+    def invalidate(self, *tags):
+        """Marks every entry carrying one of `tags` stale (in all processes sharing CACHE_SHARED_DIR)."""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                self._stats["invalidations"] += 1
+        if self.shared_dir:
+            for tag in tags:
+                # A fresh file (new inode) per invalidation is what other processes compare against
+                fd, partial = tempfile.mkstemp(dir=self.shared_dir)
+                os.close(fd)
+                os.replace(partial, self._tag_file(tag))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0
+        stats["maxsize"] = self.maxsize
+        stats["ttl_seconds"] = self.ttl
+        stats["shared_dir"] = self.shared_dir
+        return stats
+
+
+def get_cache(namespace, maxsize=None):
+    """
+    One cache per database (namespace), shared by all threads. `maxsize` only
+    applies to the call that creates it (default: CACHE_MAXSIZE or MAXSIZE).
+    """
+    cache = _caches.get(namespace)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(namespace)
+            if cache is None:
+                shared_root = os.environ.get("CACHE_SHARED_DIR")
+                shared_dir = None
+                if shared_root:
+                    shared_dir = os.path.join(shared_root, hashlib.sha1(namespace.encode()).hexdigest()[:16])
+                cache = _caches[namespace] = Cache(
+                    maxsize=maxsize or int(os.environ.get("CACHE_MAXSIZE", MAXSIZE)),
+                    ttl=float(os.environ.get("CACHE_TTL", TTL_SECONDS)),
+                    shared_dir=shared_dir)
+    return cache
+
+
+def discard(namespace):
+    """Drops the cache of a database that is being closed; the next get_cache() starts an empty one."""
+    with _caches_lock:
+        _caches.pop(namespace, None)
+
+
+def for_db(db):
+    """The cache of the database `db` is connected to."""
+    return get_cache(storage.database_id(db))
@@ -0,0 +1,175 @@
+"""
+Live chat fan-out for the /chat/stream Server-Sent Events endpoint.
+
+One Broker per database polls `messages` for rows newer than the ones it has
+already sent (a primary key range read every POLL_SECONDS for the whole
+process, however many chat windows are open) and hands each new message to
+every subscriber. send_message() wakes the poller, so a message posted to
+this process goes out at once; one posted to another gunicorn worker is
+picked up on the next poll.
+
+Each subscriber gets a bounded queue (QUEUE_SIZE). A client that stops
+reading until its queue is full is dropped rather than buffered without
+limit; its EventSource reconnects with Last-Event-ID and catches up from the
+database. Past MAX_SUBSCRIBERS, new streams are refused (503).
+"""
+import logging
+import os
+import queue
+import threading
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 1.0
+QUEUE_SIZE = 1000  # more than one poll can publish, so only a stalled reader fills it
+# Each open stream holds a server thread: keep this below the thread count
+MAX_SUBSCRIBERS = int(os.environ.get("CHAT_MAX_STREAMS", 2000))
+POLL_BATCH = 500
+# PostgreSQL can commit ids out of order; re-read this many ids below the newest sent one
+LOOKBACK_IDS = 100
+
+MESSAGE_COLUMNS = "m.id, m.member_id, m.content, m.timestamp, u.name"
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+class Subscription:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = False
+
+
+class Broker:
+    def __init__(self, url):
+        self.url = url
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._sent = set()
+        self._start = 0
+        self._newest = None
+        self._stats = {
+            "polls": 0,
+            "published": 0,
+            "delivered": 0,
+            "dropped_slow": 0,
+            "refused": 0,
+            "peak_subscribers": 0,
+        }
+
+    def subscribe(self, db):
+        """
+        Registers a new stream, or returns None when the process is at MAX_SUBSCRIBERS.
+        `db` is the caller's connection, used once to start the poller at the newest message.
+        """
+        with self._lock:
+            if len(self._subscribers) >= MAX_SUBSCRIBERS:
+                self._stats["refused"] += 1
+                return None
+            if not self._subscribers:
+                # Nobody was listening, so nothing was polled: start from the newest message
+                self._start = self._newest = db.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+                self._sent = set()
+            subscription = Subscription()
+            self._subscribers.add(subscription)
+            self._stats["peak_subscribers"] = max(self._stats["peak_subscribers"], len(self._subscribers))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="chat-broker", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def notify(self):
+        """A message was just written: poll now instead of at the next tick."""
+        self._wake.set()
+
+    def publish(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._stats["published"] += 1
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # Backpressure: stop feeding a reader this far behind, it resyncs from the database
+                subscription.dropped = True
+                with self._lock:
+                    if subscription in self._subscribers:
+                        self._subscribers.discard(subscription)
+                        self._stats["dropped_slow"] += 1
+            else:
+                with self._lock:
+                    self._stats["delivered"] += 1
+
+    def poll(self, db):
+        """Publishes the messages committed since the last poll; returns how many."""
+        floor = max(self._newest - LOOKBACK_IDS, self._start)
+        rows = db.execute(f"""SELECT {MESSAGE_COLUMNS} FROM messages m
+                              JOIN members u ON m.member_id = u.member_id
+                              WHERE m.id > ? ORDER BY m.id LIMIT ?""", (floor, POLL_BATCH + LOOKBACK_IDS)).fetchall()
+        db.commit()  # end the read transaction, the next poll needs a fresh snapshot
+        self._stats["polls"] += 1
+        published = 0
+        for row in rows:
+            if row['id'] in self._sent:
+                continue
+            self._sent.add(row['id'])
+            self._newest = max(self._newest, row['id'])
+            self.publish(dict(row))
+            published += 1
+        self._sent = {message_id for message_id in self._sent if message_id > self._newest - LOOKBACK_IDS}
+        return published
+
+    def _run(self):
+        db = storage.connect(self.url)
+        try:
+            while True:
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+                with self._lock:
+                    if not self._subscribers:
+                        # Nobody left to feed: let the thread and its connection go, subscribe() starts a new one
+                        self._thread = None
+                        return
+                try:
+                    while self.poll(db) >= POLL_BATCH:
+                        pass
+                except db.Error:
+                    logger.exception("Chat poll failed")
+                    db.rollback()
+        finally:
+            db.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["subscribers"] = len(self._subscribers)
+            stats["queued"] = sum(s.queue.qsize() for s in self._subscribers)
+        stats["newest_id"] = self._newest
+        stats["max_subscribers"] = MAX_SUBSCRIBERS
+        return stats
+
+
+def get_broker(url):
+    """One broker per database, shared by all request threads of the process."""
+    broker = _brokers.get(url)
+    if broker is None:
+        with _brokers_lock:
+            broker = _brokers.get(url)
+            if broker is None:
+                broker = _brokers[url] = Broker(url)
+    return broker
+
+
+def backlog(db, after_id, limit):
+    """Messages after `after_id`, oldest first (at most `limit`)."""
+    return db.execute(f"""SELECT {MESSAGE_COLUMNS} FROM messages m
+                          JOIN members u ON m.member_id = u.member_id
+                          WHERE m.id > ? ORDER BY m.id LIMIT ?""", (after_id, limit)).fetchall()
@@ -0,0 +1,181 @@
+"""
+Paid contributions as one 12-bit mask per member per year.
+
+`contribution_masks` holds a row per (year, member_id) with bit (month - 1)
+set when that month's contribution is paid; a missing row or bit means
+pending. The year leads the primary key, so a year's matrix is one
+contiguous range and multi-year or arrears questions read members x years
+small integers instead of the raw contribution rows.
+
+The `record_*` helpers are called by the write routes next to
+fund_ledger.record_contribution(), inside the caller's transaction. Run this
+file directly to check the masks against monthly_contributions, or to
+rebuild them:
+
+    python contribution_masks.py verify [DATABASE_URL]
+    python contribution_masks.py rebuild [DATABASE_URL]
+"""
+import os
+import sys
+from datetime import date
+
+import migrate
+import storage
+
+DB_NAME = "database.db"
+
+MONTHS = range(1, 13)
+FULL_YEAR = (1 << 12) - 1
+
+
+def bit(month):
+    return 1 << (int(month) - 1)
+
+
+def paid_months(mask):
+    return [month for month in MONTHS if mask & bit(month)]
+
+
+def record_paid(db, member_id, year, month):
+    """The member's contribution for year/month is now paid."""
+    if int(month) not in MONTHS:
+        return
+    db.execute("""INSERT INTO contribution_masks (year, member_id, paid_mask) VALUES (?, ?, ?)
+                  ON CONFLICT (year, member_id) DO UPDATE SET paid_mask = contribution_masks.paid_mask | excluded.paid_mask""",
+               (int(year), int(member_id), bit(month)))
+
+
+def record_unpaid(db, member_id, year, month):
+    """The member's contribution for year/month is no longer paid (unpaid or deleted)."""
+    if int(month) not in MONTHS:
+        return
+    db.execute("UPDATE contribution_masks SET paid_mask = paid_mask & ? WHERE year = ? AND member_id = ?",
+               (FULL_YEAR ^ bit(month), int(year), int(member_id)))
+
+
+def compute_masks(db):
+    """Builds {(year, member_id): mask} from the raw rows (full scan, used by rebuild/verify only)."""
+    masks = {}
+    for row in db.execute("SELECT year, member_id, month FROM monthly_contributions WHERE status = 'paid'"):
+        if row['month'] in MONTHS:
+            key = (row['year'], row['member_id'])
+            masks[key] = masks.get(key, 0) | bit(row['month'])
+    return masks
+
+
+def rebuild_masks(db):
+    """Recomputes every mask from scratch. Does not commit."""
+    masks = compute_masks(db)
+    db.execute("DELETE FROM contribution_masks")
+    db.executemany("INSERT INTO contribution_masks (year, member_id, paid_mask) VALUES (?, ?, ?)",
+                   [(year, member_id, mask) for (year, member_id), mask in masks.items()])
+    return masks
+
+
+def verify_masks(db):
+    """Returns a list of (year, member_id, stored, actual) for every mask that has drifted."""
+    actual = compute_masks(db)
+    stored = {(row['year'], row['member_id']): row['paid_mask']
+              for row in db.execute("SELECT year, member_id, paid_mask FROM contribution_masks")}
+    mismatches = []
+    for key in sorted(set(actual) | set(stored)):
+        if stored.get(key, 0) != actual.get(key, 0):
+            mismatches.append((key[0], key[1], stored.get(key), actual.get(key, 0)))
+    return mismatches
+
+
+def year_matrix(db, year):
+    """Every member with their paid mask for `year` (0 when nothing is paid)."""
+    return db.execute("""SELECT m.member_id, m.name, COALESCE(c.paid_mask, 0) AS paid_mask
+                         FROM members m
+                         LEFT JOIN contribution_masks c ON c.year = ? AND c.member_id = m.member_id
+                         WHERE m.role = 'member'
+                         ORDER BY m.member_id""", (year,)).fetchall()
+
+
+def _masks_between(db, first_year, last_year):
+    return {(row['member_id'], row['year']): row['paid_mask']
+            for row in db.execute("SELECT year, member_id, paid_mask FROM contribution_masks WHERE year BETWEEN ? AND ?",
+                                  (first_year, last_year))}
+
+
+def history(db, first_year, last_year):
+    """Paid months of every member for each year in first_year..last_year."""
+    masks = _masks_between(db, first_year, last_year)
+    members = []
+    for member in db.execute("SELECT member_id, name FROM members WHERE role = 'member' ORDER BY member_id"):
+        years = {}
+        for year in range(first_year, last_year + 1):
+            mask = masks.get((member['member_id'], year), 0)
+            years[year] = {"paid_mask": mask, "paid_months": paid_months(mask)}
+        members.append({"member_id": member['member_id'], "name": member['name'], "years": years})
+    return members
+
+
+def _joined(join_date):
+    """(year, month) the member joined, or None when the date is missing or unreadable."""
+    try:
+        return int(str(join_date)[:4]), int(str(join_date)[5:7])
+    except (TypeError, ValueError):
+        return None
+
+
+def last_closed_month(today=None):
+    today = today or date.today()
+    return (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+
+
+def arrears(db, min_unpaid=3, first_year=None, until=None):
+    """
+    Members with at least `min_unpaid` unpaid months from January of
+    `first_year` (default: the year of `until`) through `until` (year, month),
+    by default the last month that has ended. Months before a member joined
+    are not due. Most unpaid months first.
+    """
+    last_year, last_month = until or last_closed_month()
+    first_year = first_year or last_year
+    masks = _masks_between(db, first_year, last_year)
+
+    result = []
+    for member in db.execute("SELECT member_id, name, join_date FROM members WHERE role = 'member'"):
+        joined = _joined(member['join_date'])
+        unpaid = []
+        for year in range(first_year, last_year + 1):
+            due = FULL_YEAR if year < last_year else (1 << last_month) - 1
+            if joined and year < joined[0]:
+                due = 0
+            elif joined and year == joined[0]:
+                due &= FULL_YEAR ^ ((1 << (joined[1] - 1)) - 1)
+            missing = due & ~masks.get((member['member_id'], year), 0)
+            unpaid += [f"{year}-{month:02d}" for month in paid_months(missing)]
+        if len(unpaid) >= min_unpaid:
+            result.append({"member_id": member['member_id'], "name": member['name'],
+                           "unpaid_count": len(unpaid), "unpaid_months": unpaid})
+    result.sort(key=lambda row: (-row["unpaid_count"], row["member_id"]))
+    return result
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    db_url = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("DATABASE_URL", DB_NAME)
+
+    conn = storage.connect(db_url)
+    try:
+        migrate.apply_migrations(conn)
+        if command == "rebuild":
+            masks = rebuild_masks(conn)
+            conn.commit()
+            print(f"✅ {len(masks)} contribution masks rebuilt.")
+        elif command == "verify":
+            mismatches = verify_masks(conn)
+            if mismatches:
+                print("❌ Contribution masks are out of sync:")
+                for year, member_id, stored, actual in mismatches[:20]:
+                    print(f"   {year} member {member_id}: stored={stored} actual={actual}")
+                sys.exit(1)
+            print("✅ Contribution masks match the raw rows.")
+        else:
+            print("Usage: python contribution_masks.py [verify|rebuild] [DATABASE_URL]")
+            sys.exit(2)
+    finally:
+        conn.close()
@@ -0,0 +1,48 @@
+"""
+Data version counters behind the /api/v1 ETags.
+
+`data_versions` keeps one counter per scope. The scopes are the cache.py tags
+("fund", "loans", "proofs", "members", "contributions:2025", "member:7").
+A write route bumps the scopes it changed with bump(), inside its own
+transaction, and after the commit invalidates the same tags in the page
+cache.
+
+An API response depends on a few scopes, and its ETag is a hash of their
+counters. Checking If-None-Match is therefore one primary key read: when
+nothing has changed the route answers 304 without building the body. The
+counters live in the database, so every gunicorn worker and job process
+hands out the same ETag for the same data.
+"""
+import hashlib
+
+
+def bump(db, *scopes):
+    """Marks `scopes` changed. Does not commit."""
+    if not scopes:
+        return
+    # Sorted so concurrent writers lock the rows in the same order (PostgreSQL)
+    db.executemany("""INSERT INTO data_versions (scope, version) VALUES (?, 1)
+                      ON CONFLICT (scope) DO UPDATE SET version = data_versions.version + 1""",
+                   [(scope,) for scope in sorted(set(scopes))])
+
+
+def versions(db, scopes):
+    """{scope: version} for `scopes`; a scope that was never bumped is at 0."""
+    scopes = sorted(set(scopes))
+    placeholders = ", ".join("?" for _ in scopes)
+    found = {row['scope']: row['version']
+             for row in db.execute(f"SELECT scope, version FROM data_versions WHERE scope IN ({placeholders})",
+                                   tuple(scopes))}
+    return {scope: found.get(scope, 0) for scope in scopes}
+
+
+def etag(db, key, scopes):
+    """
+    Entity tag for the response `key` (the route and its arguments) built from
+    the current versions of `scopes`. Read it before building the body, so a
+    write landing in between can only leave the tag older than the data.
+    """
+    current = versions(db, scopes)
+    digest = hashlib.sha1(repr((key, sorted(current.items()))).encode()).hexdigest()
+    return f"v1-{digest[:24]}"
+
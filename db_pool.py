@@ -0,0 +1,186 @@
+"""
+Per-thread SQLite connection pool.
+
+gunicorn (8 threads) and waitress both serve requests from a fixed set of
+worker threads, so each thread keeps one long-lived connection instead of
+opening a new one per request. Every connection is configured for concurrent
+serving:
+
+    journal_mode=WAL     readers no longer block the writer (and vice versa)
+    synchronous=NORMAL   fsync on checkpoint only, safe in WAL mode
+    busy_timeout         wait for the write lock instead of failing at once
+    cached_statements    keep the prepared statements of every route
+
+Statements that still hit "database is locked" are retried with a short
+backoff. Checkouts, wait time and lock retries are counted in `stats()`.
+
+close_idle() closes the pools nobody checked out from for a while, so a
+process serving many databases (see tenants.py) only keeps the busy ones open.
+"""
+import sqlite3
+import threading
+import time
+
+BUSY_TIMEOUT_SECONDS = 5.0
+CACHED_STATEMENTS = 256
+LOCK_RETRIES = 5
+LOCK_BACKOFF_SECONDS = 0.05
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolClosed(Exception):
+    """checkout() on a pool close_idle() already closed; get_pool() returns a fresh one."""
+
+
+def _is_locked(error):
+    return "database is locked" in str(error) or "database table is locked" in str(error)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection that retries statements failing with "database is locked"."""
+
+    pool = None
+    dialect = "sqlite"
+
+    def _retry(self, operation, *args):
+        attempt = 0
+        while True:
+            try:
+                return operation(*args)
+            except sqlite3.OperationalError as e:
+                if not _is_locked(e) or attempt >= LOCK_RETRIES:
+                    if _is_locked(e) and self.pool:
+                        self.pool._count("lock_failures")
+                    raise
+                attempt += 1
+                if self.pool:
+                    self.pool._count("lock_retries")
+                time.sleep(LOCK_BACKOFF_SECONDS * attempt)
+
+    def execute(self, *args):
+        return self._retry(super().execute, *args)
+
+    def executemany(self, *args):
+        return self._retry(super().executemany, *args)
+
+    def commit(self):
+        return self._retry(super().commit)
+
+    def stream(self, sql, params=(), batch_size=2000):
+        """Iterates a large result in batches instead of materializing it."""
+        cur = self.execute(sql, params)
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
+
+
+class SQLitePool:
+    def __init__(self, path, busy_timeout=BUSY_TIMEOUT_SECONDS, cached_statements=CACHED_STATEMENTS):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = []
+        self._in_use = 0
+        self.last_used = time.monotonic()
+        self.closed = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "connections_opened": 0,
+            "checkout_wait_ms": 0.0,
+            "lock_retries": 0,
+            "lock_failures": 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def connect(self):
+        """Opens a new configured connection (not tied to the calling thread)."""
+        # Each connection still serves a single thread; close() may come from the one closing the pool
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements, factory=PooledConnection)
+        conn.pool = self
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        self._count("connections_opened")
+        return conn
+
+    def checkout(self):
+        """Returns this thread's connection, opening it on first use."""
+        started = time.perf_counter()
+        with self._stats_lock:
+            if self.closed:
+                raise PoolClosed(self.path)
+            self._in_use += 1
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+            with self._stats_lock:
+                self._connections.append(conn)
+        with self._stats_lock:
+            self.last_used = time.monotonic()
+            self._stats["checkouts"] += 1
+            self._stats["checkout_wait_ms"] += (time.perf_counter() - started) * 1000
+        return conn
+
+    def checkin(self, conn):
+        """Hands the connection back; anything left uncommitted is rolled back."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            with self._stats_lock:
+                self._in_use -= 1
+                self.last_used = time.monotonic()
+
+    def close_if_idle(self, idle_seconds):
+        """Closes every connection when none is checked out and the last checkin is `idle_seconds` old."""
+        with self._stats_lock:
+            if self.closed or self._in_use or time.monotonic() - self.last_used < idle_seconds:
+                return self.closed
+            self.closed = True
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        return True
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_checkout_wait_ms"] = stats["checkout_wait_ms"] / stats["checkouts"] if stats["checkouts"] else 0
+        stats["path"] = self.path
+        stats["in_use"] = self._in_use
+        return stats
+
+
+def get_pool(path):
+    """One pool per database file, shared by all threads."""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, SQLitePool(path))
+    return pool
+
+
+def close_idle(path, idle_seconds=0):
+    """Closes the pool of `path` if it is idle (see SQLitePool.close_if_idle). False while it is in use."""
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            return True
+        if not pool.close_if_idle(idle_seconds):
+            return False
+        del _pools[path]
+    return True
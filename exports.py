@@ -0,0 +1,181 @@
+"""
+Streaming transaction exports.
+
+Rows are read through `db.stream()` (a server-side cursor on PostgreSQL) and
+written out as they arrive, so memory stays flat however large the history is:
+
+    write_xlsx()      openpyxl write-only workbook into a file object
+    stream_csv_zip()  generator of bytes: one CSV per sheet inside a ZIP,
+                      the first chunk is sent before the queries finish
+
+Both take the same filters: start/end date (YYYY-MM-DD, inclusive) and member_id.
+"""
+import csv
+import io
+import zipfile
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+
+import amortization
+
+CHUNK_ROWS = 5000
+SCHEDULE_LOANS_PER_CHUNK = 1000
+
+CONTRIBUTION_COLUMNS = ["Member", "Month", "Year", "Amount", "Status", "Paid Date"]
+PAYMENT_COLUMNS = ["Member", "Loan ID", "Month No", "Amount", "Status", "Paid Date"]
+LOAN_COLUMNS = ["Member", "Loan ID", "Amount", "Interest Rate", "Total Months", "Status",
+                "Repayment Status", "Request Time", "Approved Time", "Closed Time"]
+SCHEDULE_COLUMNS = ["Member", "Loan ID", "Month No", "Opening Principal", "Principal", "Interest",
+                    "EMI", "Closing Principal"]
+
+
+def parse_filters(args):
+    """Reads start/end/member_id from request args; raises ValueError on bad input."""
+    filters = {"start": None, "end": None, "member_id": None}
+    if args.get("start"):
+        filters["start"] = datetime.strptime(args["start"], "%Y-%m-%d").date()
+    if args.get("end"):
+        filters["end"] = datetime.strptime(args["end"], "%Y-%m-%d").date()
+    if args.get("member_id"):
+        filters["member_id"] = int(args["member_id"])
+    return filters
+
+
+def _where(filters, date_column=None, period=False):
+    clauses, params = [], []
+    if filters.get("member_id"):
+        clauses.append("m.member_id = ?")
+        params.append(filters["member_id"])
+    if period:
+        # Contributions are filed by (year, month), not by a timestamp
+        if filters.get("start"):
+            clauses.append("c.year * 100 + c.month >= ?")
+            params.append(filters["start"].year * 100 + filters["start"].month)
+        if filters.get("end"):
+            clauses.append("c.year * 100 + c.month <= ?")
+            params.append(filters["end"].year * 100 + filters["end"].month)
+    elif date_column:
+        if filters.get("start"):
+            clauses.append(f"{date_column} >= ?")
+            params.append(filters["start"].strftime("%Y-%m-%d"))
+        if filters.get("end"):
+            clauses.append(f"{date_column} < ?")
+            params.append((filters["end"] + timedelta(days=1)).strftime("%Y-%m-%d"))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def _schedule_rows(db, filters):
+    where, params = _where(filters, "l.approved_time")
+    where = (where + " AND " if where else " WHERE ") + "l.status = 'approved'"
+    loans = db.stream(f"""SELECT m.name, l.loan_id, l.amount, l.total_months, l.interest_rate_percent
+                          FROM loans l
+                          JOIN members m ON l.member_id = m.member_id
+                          {where}
+                          ORDER BY l.loan_id""", params)
+
+    def flush(chunk):
+        schedule = amortization.schedules([l['amount'] for l in chunk],
+                                          [l['total_months'] for l in chunk],
+                                          [l['interest_rate_percent'] for l in chunk])
+        columns = [schedule[key].round(2).tolist() for key in
+                   ("remaining_principal_start", "principal_component", "interest_component",
+                    "total_emi", "remaining_principal_end")]
+        for i, loan_index in enumerate(schedule["loan_index"].tolist()):
+            loan = chunk[loan_index]
+            yield [loan['name'], loan['loan_id'], int(schedule["month"][i])] + [col[i] for col in columns]
+
+    chunk = []
+    for loan in loans:
+        chunk.append(loan)
+        if len(chunk) == SCHEDULE_LOANS_PER_CHUNK:
+            yield from flush(chunk)
+            chunk = []
+    if chunk:
+        yield from flush(chunk)
+
+
+def export_sheets(db, filters):
+    """Yields (sheet name, header, row iterator) for every sheet, lazily."""
+    where, params = _where(filters, period=True)
+    yield "Contributions", CONTRIBUTION_COLUMNS, db.stream(f"""
+        SELECT m.name, c.month, c.year, c.amount, c.status, c.paid_date
+        FROM monthly_contributions c
+        JOIN members m ON c.member_id = m.member_id
+        {where}
+        ORDER BY c.year DESC, c.month DESC""", params)
+
+    where, params = _where(filters, "p.paid_date")
+    yield "Loan Payments", PAYMENT_COLUMNS, db.stream(f"""
+        SELECT m.name, p.loan_id, p.month_no, p.amount, p.status, p.paid_date
+        FROM interest_payments p
+        JOIN loans l ON p.loan_id = l.loan_id
+        JOIN members m ON l.member_id = m.member_id
+        {where}
+        ORDER BY p.paid_date DESC""", params)
+
+    where, params = _where(filters, "l.request_time")
+    yield "Loans Issued", LOAN_COLUMNS, db.stream(f"""
+        SELECT m.name, l.loan_id, l.amount, l.interest_rate_percent, l.total_months, l.status,
+               l.repayment_status, l.request_time, l.approved_time, l.closed_time
+        FROM loans l
+        JOIN members m ON l.member_id = m.member_id
+        {where}
+        ORDER BY l.request_time DESC""", params)
+
+    yield "Loan Schedules", SCHEDULE_COLUMNS, _schedule_rows(db, filters)
+
+
+def write_xlsx(db, fileobj, filters):
+    """Writes the workbook in openpyxl write-only mode (rows are never all in memory)."""
+    wb = Workbook(write_only=True)
+    for name, header, rows in export_sheets(db, filters):
+        ws = wb.create_sheet(name)
+        ws.append(header)
+        empty = True
+        for row in rows:
+            ws.append(list(row))
+            empty = False
+        if empty:
+            ws.append(["No Data"])
+    wb.save(fileobj)
+
+
+class _ChunkBuffer:
+    """Unseekable sink for ZipFile: collects written bytes until they are drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_csv_zip(db, filters):
+    """Yields a ZIP archive (one CSV per sheet) chunk by chunk."""
+    sink = _ChunkBuffer()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, header, rows in export_sheets(db, filters):
+            filename = name.lower().replace(" ", "_") + ".csv"
+            with archive.open(filename, mode="w", force_zip64=True) as member:
+                text = io.TextIOWrapper(member, encoding="utf-8", newline="")
+                writer = csv.writer(text)
+                writer.writerow(header)
+                for i, row in enumerate(rows, 1):
+                    writer.writerow(list(row))
+                    if i % CHUNK_ROWS == 0:
+                        text.flush()
+                        yield sink.drain()
+                text.flush()
+                text.detach()
+            yield sink.drain()
+    yield sink.drain()
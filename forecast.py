@@ -0,0 +1,241 @@
+"""
+Fund liquidity forecast and loan what-if simulation.
+
+project() follows the fund balance month by month over the next `months`
+months (this month first), starting from the current balance:
+
+    in    contributions: every member pays CONTRIBUTION a month (this month,
+          only those who haven't paid yet)
+    in    the EMIs due from this month on in loan_schedule (overdue EMIs are
+          reported as arrears but not counted on: they are late already)
+    out   a pending request, when it is simulated as approved: paid out this
+          month, its EMIs due the months after
+
+The uncertain part runs as a Monte Carlo over many paths at once (NumPy
+arrays of paths x loans and paths x months). Each open loan stops paying
+from a random month, drawn from a yearly `default_rate`. Each due
+contribution is missed with probability `shortfall`. Every pending request
+is then tried on the same paths, alone and all together, so differences
+between requests are not noise. The random seed is fixed, so the page does
+not jump between reloads.
+
+Paths run in batches (BATCH, fewer on a fund with many loans) until PATHS
+are done or BUDGET_MS is spent (always at least one batch), which bounds the
+time the admin loans page waits. The result records how many paths it used.
+Run this file directly for a report (the scenario comes from the FORECAST_*
+variables):
+
+    python forecast.py [DATABASE_URL]
+"""
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+
+import amortization
+import fund_ledger
+import loan_schedule
+import migrate
+import storage
+
+DB_NAME = "database.db"
+
+CONTRIBUTION = 200
+MONTHS = int(os.environ.get("FORECAST_MONTHS", "12"))
+MAX_MONTHS = 60
+PATHS = int(os.environ.get("FORECAST_PATHS", "10000"))
+BATCH = 1000
+BATCH_CELLS = 4000000  # paths x loans x months per batch: bounds memory and the time between budget checks
+BUDGET_MS = float(os.environ.get("FORECAST_BUDGET_MS", "100"))
+# Percent of open loans that stop paying within a year / of contributions missed
+DEFAULT_RATE = float(os.environ.get("FORECAST_DEFAULT_RATE", "5"))
+SHORTFALL = float(os.environ.get("FORECAST_SHORTFALL", "5"))
+# The fund is "short" in a month that ends below this balance
+RESERVE = float(os.environ.get("FORECAST_RESERVE", "0"))
+SEED = 20240101
+LOW, HIGH = 5, 95  # percentiles of the band shown around the median
+
+
+def scenario(args):
+    """{default_rate, shortfall, months} from a request's query args, the defaults where missing or invalid."""
+    def number(name, default, low, high):
+        try:
+            value = float(args.get(name, default))
+        except (TypeError, ValueError):
+            return default
+        return min(max(value, low), high) if value == value else default
+
+    return {"default_rate": number("default_rate", DEFAULT_RATE, 0, 100),
+            "shortfall": number("shortfall", SHORTFALL, 0, 100),
+            "months": int(number("months", MONTHS, 1, MAX_MONTHS))}
+
+
+def _month_index(today, day):
+    """Months from today's month to `day`'s (0 = this month)."""
+    return (day.year - today.year) * 12 + day.month - today.month
+
+
+def load(db, months=MONTHS, today=None):
+    """The forecast inputs: balance, arrears, contributors and open EMIs per month, and the pending requests."""
+    today = today or date.today()
+    balance = fund_ledger.get_fund_summary(db)["balance"]
+    members = db.execute("SELECT COUNT(*) FROM members WHERE role='member'").fetchone()[0]
+    paid = db.execute("SELECT COUNT(*) FROM monthly_contributions WHERE year=? AND month=? AND status='paid'",
+                      (today.year, today.month)).fetchone()[0]
+    contributors = np.full(months, members, dtype=np.int64)
+    contributors[0] = max(members - paid, 0)
+
+    start = today.replace(day=1)
+    arrears = db.execute("SELECT COALESCE(SUM(emi), 0) FROM loan_schedule WHERE status = 'due' AND due_date < ?",
+                         (start.isoformat(),)).fetchone()[0]
+    rows = db.execute("""SELECT loan_id, due_date, emi FROM loan_schedule
+                         WHERE status = 'due' AND due_date >= ? AND due_date < ?""",
+                      (start.isoformat(), loan_schedule.due_date(start, months).isoformat())).fetchall()
+    loan_ids = sorted({row['loan_id'] for row in rows})
+    position = {loan_id: i for i, loan_id in enumerate(loan_ids)}
+    emis = np.zeros((len(loan_ids), months))
+    for row in rows:
+        month = _month_index(today, date.fromisoformat(str(row['due_date'])[:10]))
+        emis[position[row['loan_id']], month] += row['emi']
+
+    pending = db.execute("""SELECT l.loan_id, l.amount, l.total_months, l.interest_rate_percent, m.name
+                            FROM loans l JOIN members m ON l.member_id = m.member_id
+                            WHERE l.status='pending' ORDER BY request_time""").fetchall()
+    pending_emis = np.zeros((len(pending), months))
+    priced = [i for i, loan in enumerate(pending) if (loan['total_months'] or 0) > 0]
+    if priced:
+        columns = amortization.schedules([pending[i]['amount'] for i in priced],
+                                         [pending[i]['total_months'] for i in priced],
+                                         [pending[i]['interest_rate_percent'] or 0 for i in priced])
+        # Approved this month, EMI n is due n months later
+        keep = columns["month"] < months
+        rows_of = np.asarray(priced)[columns["loan_index"][keep]]
+        np.add.at(pending_emis, (rows_of, columns["month"][keep].astype(np.int64)), columns["total_emi"][keep])
+
+    return {"today": today, "balance": float(balance), "arrears": float(arrears), "contributors": contributors,
+            "loan_ids": loan_ids, "emis": emis,
+            "pending": [(loan['loan_id'], loan['name'], float(loan['amount'])) for loan in pending],
+            "pending_emis": pending_emis}
+
+
+def _stops(rng, hazard, shape, months):
+    """The month each loan stops paying from, per path (`months` when it pays to the end)."""
+    if hazard <= 0:
+        return np.full(shape, months, dtype=np.int64)
+    return np.minimum(rng.geometric(hazard, size=shape) - 1, months)
+
+
+def _received(stops, emis):
+    """EMIs received per path and month: (paths, loans) stop months against (loans, months) EMIs."""
+    months = emis.shape[1]
+    lost = np.zeros((stops.shape[0], months))
+    # Only the (path, loan) pairs that stop inside the horizon lose anything, and they are few
+    paths, loans = np.nonzero(stops < months)
+    if len(paths):
+        missed = emis[loans] * (np.arange(months) >= stops[paths, loans][:, None])
+        stopped, starts = np.unique(paths, return_index=True)
+        lost[stopped] = np.add.reduceat(missed, starts, axis=0)
+    return emis.sum(axis=0) - lost
+
+
+def simulate(inputs, default_rate=DEFAULT_RATE, shortfall=SHORTFALL, paths=PATHS, budget_ms=BUDGET_MS,
+             reserve=RESERVE, seed=SEED):
+    """Runs the paths over `inputs` (from load()) and summarizes them; see the module docstring."""
+    started = time.perf_counter()
+    contributors, emis, pending_emis = inputs["contributors"], inputs["emis"], inputs["pending_emis"]
+    months = len(contributors)
+    amounts = np.array([amount for _, _, amount in inputs["pending"]])
+    hazard = 1 - (1 - default_rate / 100) ** (1 / 12)
+    rng = np.random.default_rng(seed)
+
+    balances, lowest_each, lowest_all = [], [], []
+    done = 0
+    while done < paths:
+        n = min(BATCH, paths - done, max(BATCH_CELLS // ((len(emis) + len(amounts)) * months or 1), 1))
+        paid = rng.binomial(contributors, 1 - shortfall / 100, size=(n, months)) * CONTRIBUTION
+        received = _received(_stops(rng, hazard, (n, len(emis)), months), emis)
+        base = inputs["balance"] + np.cumsum(paid + received, axis=1)
+        balances.append(base)
+
+        # Each pending request on the same paths: paid out now, repaid until it stops
+        stops = _stops(rng, hazard, (n, len(amounts)), months)
+        repaid = pending_emis[None, :, :] * (stops[:, :, None] > np.arange(months))
+        change = np.cumsum(repaid, axis=2) - amounts[None, :, None]
+        lowest_each.append((base[:, None, :] + change).min(axis=2))
+        lowest_all.append((base + change.sum(axis=1)).min(axis=1))
+
+        done += n
+        if (time.perf_counter() - started) * 1000 >= budget_ms:
+            break
+
+    balances = np.concatenate(balances)
+    lowest = balances.min(axis=1)
+    lowest_each = np.concatenate(lowest_each)
+    lowest_all = np.concatenate(lowest_all)
+    low, median, high = np.percentile(balances, (LOW, 50, HIGH), axis=0)
+    today = inputs["today"]
+    expected_emis = emis.sum(axis=0)
+    expected_contributions = contributors * CONTRIBUTION
+
+    def risk(lowest_balances):
+        return {"short": float((lowest_balances < reserve).mean()),
+                "lowest": float(np.percentile(lowest_balances, LOW))}
+
+    return {
+        "balance": inputs["balance"], "arrears": inputs["arrears"],
+        "default_rate": default_rate, "shortfall": shortfall, "reserve": reserve,
+        "paths": int(done), "seconds": time.perf_counter() - started,
+        "months": [{"month": f"{today.year + (today.month - 1 + i) // 12}-{(today.month - 1 + i) % 12 + 1:02d}",
+                    "contributions": float(expected_contributions[i]), "emis": float(expected_emis[i]),
+                    "scheduled": float(inputs["balance"] + np.cumsum(expected_contributions + expected_emis)[i]),
+                    "low": float(low[i]), "median": float(median[i]), "high": float(high[i]),
+                    "short": float((balances[:, i] < reserve).mean())}
+                   for i in range(months)],
+        **risk(lowest),
+        "pending": {loan_id: risk(lowest_each[:, i]) for i, (loan_id, _, _) in enumerate(inputs["pending"])},
+        "all_pending": risk(lowest_all) if inputs["pending"] else None,
+    }
+
+
+def project(db, default_rate=DEFAULT_RATE, shortfall=SHORTFALL, months=MONTHS, paths=PATHS, budget_ms=BUDGET_MS,
+            today=None):
+    """load() then simulate(): the forecast shown on the admin loans page."""
+    started = time.perf_counter()
+    inputs = load(db, months, today)
+    budget_ms -= (time.perf_counter() - started) * 1000
+    result = simulate(inputs, default_rate, shortfall, paths, budget_ms)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+if __name__ == "__main__":
+    db_url = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("DATABASE_URL", DB_NAME)
+    conn = storage.connect(db_url)
+    try:
+        migrate.apply_migrations(conn)
+        inputs = load(conn)
+        result = simulate(inputs, budget_ms=float("inf"))
+    finally:
+        conn.close()
+
+    print(f"💧 Balance {result['balance']:,.2f}; {result['default_rate']:g}% of loans stop paying a year, "
+          f"{result['shortfall']:g}% of contributions missed; {result['paths']} paths in {result['seconds']:.2f}s")
+    if result["arrears"]:
+        print(f"   Overdue EMIs not counted on: {result['arrears']:,.2f}")
+    print(f"   {'month':<8} {'contrib':>10} {'EMIs':>10} {'scheduled':>12} {f'p{LOW}':>12} {'median':>12} "
+          f"{f'p{HIGH}':>12} {'short':>6}")
+    for month in result["months"]:
+        print(f"   {month['month']:<8} {month['contributions']:>10,.0f} {month['emis']:>10,.0f} "
+              f"{month['scheduled']:>12,.0f} {month['low']:>12,.0f} {month['median']:>12,.0f} "
+              f"{month['high']:>12,.0f} {month['short']:>6.1%}")
+    print(f"{'⚠️' if result['short'] else '✅'} Chance of going below {RESERVE:,.0f}: {result['short']:.1%}, "
+          f"lowest balance (1 path in {100 // LOW}): {result['lowest']:,.2f}")
+    for loan_id, name, amount in inputs["pending"]:
+        risk = result["pending"][loan_id]
+        print(f"   if loan {loan_id} ({name}, {amount:,.0f}) is approved: {risk['short']:.1%} short, "
+              f"lowest {risk['lowest']:,.2f}")
+    if result["all_pending"]:
+        print(f"   if all {len(inputs['pending'])} are approved: {result['all_pending']['short']:.1%} short, "
+              f"lowest {result['all_pending']['lowest']:,.2f}")
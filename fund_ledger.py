@@ -0,0 +1,182 @@
+"""
+Materialized fund summary.
+
+Keeps running totals in the `fund_summary` table so the dashboard can read the
+fund position with a single lookup instead of re-aggregating contributions,
+repayments and loans on every request.
+
+The `record_*` helpers are called by the write routes inside their own
+transaction and never commit themselves. Each also appends the event to the
+journal (journal.py), the history the totals are checked against. Run this
+file directly to check the stored totals against the raw rows, or to rebuild
+them:
+
+    python fund_ledger.py verify [DATABASE_URL]
+    python fund_ledger.py rebuild [DATABASE_URL]
+"""
+import os
+import sys
+from datetime import datetime
+
+import amortization
+import journal
+import migrate
+import storage
+
+DB_NAME = "database.db"
+
+# Totals are floats (interest is fractional), allow half a paisa of drift.
+TOLERANCE = 0.005
+
+SUMMARY_COLUMNS = ("total_collections", "total_repayments", "total_loans_issued", "total_interest_earned")
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def repayment_interest(loan, month_no):
+    """Interest part of a paid EMI, as shown on the dashboard (reducing balance)."""
+    remaining_principal = loan['amount'] - (loan['principal_portion'] * (int(month_no) - 1))
+    if remaining_principal < 0:
+        remaining_principal = 0
+    return (remaining_principal * loan['interest_rate_percent']) / 100
+
+
+def compute_totals(db):
+    """Aggregates the totals from the raw rows (full scans, used by rebuild/verify only)."""
+    totals = {
+        "total_collections": db.execute("SELECT SUM(amount) FROM monthly_contributions WHERE status = 'paid'").fetchone()[0] or 0,
+        "total_repayments": db.execute("SELECT SUM(amount) FROM interest_payments WHERE status = 'paid'").fetchone()[0] or 0,
+        "total_loans_issued": db.execute("SELECT SUM(amount) FROM loans WHERE status IN ('approved', 'paid')").fetchone()[0] or 0,
+    }
+
+    payments = db.execute("""
+        SELECT p.month_no, l.amount, l.principal_portion, l.interest_rate_percent
+        FROM interest_payments p
+        JOIN loans l ON p.loan_id = l.loan_id
+        WHERE p.status = 'paid'
+    """).fetchall()
+    # Interest is priced on the stored principal_portion and is not cut off at
+    # total_months (extra payments still earn interest), hence the unbounded term.
+    priced = amortization.amortize([p['amount'] for p in payments],
+                                   [float("inf")] * len(payments),
+                                   [p['interest_rate_percent'] for p in payments],
+                                   [int(p['month_no']) for p in payments],
+                                   principal_constant=[p['principal_portion'] for p in payments])
+    totals["total_interest_earned"] = float(priced["interest_component"].sum())
+    return totals
+
+
+def rebuild_fund_summary(db):
+    """Recomputes the stored totals from scratch. Does not commit."""
+    totals = compute_totals(db)
+    db.execute("DELETE FROM fund_summary WHERE id = 1")
+    db.execute("""INSERT INTO fund_summary
+                  (id, total_collections, total_repayments, total_loans_issued, total_interest_earned, updated_at)
+                  VALUES (1, ?, ?, ?, ?, ?)""",
+               (totals["total_collections"], totals["total_repayments"], totals["total_loans_issued"],
+                totals["total_interest_earned"], _now()))
+    return totals
+
+
+def verify_fund_summary(db):
+    """Returns a list of (column, stored, actual) for every total that has drifted."""
+    stored = db.execute("SELECT * FROM fund_summary WHERE id = 1").fetchone()
+    actual = compute_totals(db)
+    mismatches = []
+    for column in SUMMARY_COLUMNS:
+        stored_value = stored[column] if stored else None
+        if stored_value is None or abs(stored_value - actual[column]) > TOLERANCE:
+            mismatches.append((column, stored_value, actual[column]))
+    return mismatches
+
+
+def get_fund_summary(db):
+    """
+    Reads the fund position in O(1).
+    Returns a dict with the stored totals plus the starting fund and current balance.
+    """
+    row = db.execute("""SELECT f.total_balance, s.*
+                        FROM fund f LEFT JOIN fund_summary s ON s.id = 1
+                        WHERE f.id = 1""").fetchone()
+    if row is None or row['id'] is None:
+        # First read after /init (or the row was wiped): materialize it once
+        rebuild_fund_summary(db)
+        db.commit()
+        row = db.execute("""SELECT f.total_balance, s.*
+                            FROM fund f LEFT JOIN fund_summary s ON s.id = 1
+                            WHERE f.id = 1""").fetchone()
+
+    summary = {column: row[column] if row else 0 for column in SUMMARY_COLUMNS}
+    summary["starting_fund"] = row['total_balance'] if row else 0
+    summary["balance"] = (summary["starting_fund"] + summary["total_collections"]
+                          + summary["total_repayments"] - summary["total_loans_issued"])
+    return summary
+
+
+def _apply(db, **deltas):
+    assignments = ", ".join(f"{column} = {column} + ?" for column in deltas)
+    db.execute(f"UPDATE fund_summary SET {assignments}, updated_at = ? WHERE id = 1",
+               (*deltas.values(), _now()))
+
+
+def record_contribution(db, amount, member_id=None, contribution_id=None):
+    """A contribution became paid (positive amount) or stopped being paid (negative)."""
+    _apply(db, total_collections=amount)
+    journal.append(db, journal.CONTRIBUTION, amount, member_id=member_id, ref_id=contribution_id)
+
+
+def record_repayment(db, loan, month_no, amount, sign=1, payment_id=None, balance=None):
+    """
+    A paid EMI was recorded (sign=1) or removed (sign=-1). `loan` may be None
+    for orphan rows; `balance` is the loan's remaining balance afterwards, when it changed.
+    """
+    interest = repayment_interest(loan, month_no) if loan else 0
+    _apply(db, total_repayments=sign * amount, total_interest_earned=sign * interest)
+    journal.append(db, journal.REPAYMENT, sign * amount, member_id=loan['member_id'] if loan else None,
+                   loan_id=loan['loan_id'] if loan else None, ref_id=payment_id, interest=sign * interest,
+                   balance=balance)
+
+
+def record_loan_issued(db, amount, loan_id=None, member_id=None):
+    """A loan moved into (positive) or out of (negative) the approved/paid states."""
+    _apply(db, total_loans_issued=amount)
+    journal.append(db, journal.LOAN_ISSUED, amount, member_id=member_id, loan_id=loan_id)
+
+
+def record_starting_fund(db, amount):
+    """Sets the starting fund (fund.total_balance), creating the fund row on a new database."""
+    row = db.execute("SELECT total_balance FROM fund WHERE id = 1").fetchone()
+    if row is None:
+        db.execute("INSERT INTO fund (id, total_balance) VALUES (1, ?)", (amount,))
+    else:
+        db.execute("UPDATE fund SET total_balance = ? WHERE id = 1", (amount,))
+    journal.append(db, journal.STARTING_FUND, amount - ((row['total_balance'] or 0) if row else 0), balance=amount)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    db_url = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("DATABASE_URL", DB_NAME)
+
+    conn = storage.connect(db_url)
+    try:
+        migrate.apply_migrations(conn)
+        if command == "rebuild":
+            totals = rebuild_fund_summary(conn)
+            conn.commit()
+            print("✅ Fund summary rebuilt:")
+            for column in SUMMARY_COLUMNS:
+                print(f"   {column}: {totals[column]:,.2f}")
+        elif command == "verify":
+            mismatches = verify_fund_summary(conn)
+            if mismatches:
+                print("❌ Fund summary is out of sync:")
+                for column, stored, actual in mismatches:
+                    print(f"   {column}: stored={stored} actual={actual}")
+                sys.exit(1)
+            print("✅ Fund summary matches the raw rows.")
+        else:
+            print("Usage: python fund_ledger.py [verify|rebuild] [DATABASE_URL]")
+            sys.exit(2)
+    finally:
+        conn.close()
@@ -0,0 +1,294 @@
+"""
+Request and query instrumentation behind /admin/metrics.
+
+When enabled, app.get_db() hands out the pooled connection wrapped in an
+InstrumentedConnection. The wrapper times every execute / executemany /
+executescript / stream / commit into the current request's RequestTrace.
+When the request ends, finish() folds the trace into process-wide counters:
+
+    per route       requests, latency histogram, queries and time spent in the database
+    per statement   calls, total and max time (SQL normalized: whitespace, IN (?, ?, ...))
+    flags           slow queries (SLOW_QUERY_MS), slow requests (SLOW_REQUEST_MS),
+                    N+1 patterns: one statement run N_PLUS_ONE_THRESHOLD+ times in a request
+
+Flags are also logged as warnings. prometheus() renders the counters in the
+Prometheus text format, and top_statements() returns the statements by
+total time with their SQL text. Each process keeps its own counters, so with
+several gunicorn workers, scrape each one (or run one worker per port).
+
+server_timing() renders a request's trace as a Server-Timing header (time in
+the database and the statement count), which benchmark.py reads to count
+queries per request against a live server.
+
+Disabled, get_db() returns the bare connection and the request hooks return
+at once, so nothing is timed or stored.
+
+sample_profile() is separate and runs on demand only. It samples the stacks
+of every thread for a few seconds and returns them in the collapsed format
+("frame;frame;frame count") read by flamegraph.pl and speedscope.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 1000))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 25))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_PROFILE_SECONDS = 30
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+_normalized = {}  # raw SQL -> normalized SQL; statements are mostly constants, so this stays small
+_MAX_NORMALIZED = 4096
+
+
+def normalize(sql):
+    """Statement text used to group calls: collapsed whitespace, IN lists of any length as one."""
+    text = _normalized.get(sql)
+    if text is None:
+        text = _PLACEHOLDER_LIST.sub("?, ...", _WHITESPACE.sub(" ", sql).strip())
+        if len(_normalized) >= _MAX_NORMALIZED:
+            _normalized.clear()
+        _normalized[sql] = text
+    return text
+
+
+class RequestTrace:
+    """Queries run while serving one request: [(sql, seconds)]."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+
+
+def server_timing(trace):
+    """Server-Timing header value for a request so far: database time and statements, total time."""
+    db_ms = sum(seconds for _, seconds in trace.queries) * 1000
+    total_ms = (time.perf_counter() - trace.started) * 1000
+    return f'db;dur={db_ms:.2f};desc="{len(trace.queries)} queries", app;dur={total_ms:.2f}'
+
+
+class InstrumentedConnection:
+    """Wraps a pooled connection (SQLite or PostgreSQL) and records each statement into `trace`."""
+
+    def __init__(self, conn, trace):
+        self._conn = conn
+        self._trace = trace
+
+    def _timed(self, sql, operation, *args):
+        started = time.perf_counter()
+        try:
+            return operation(*args)
+        finally:
+            self._trace.queries.append((sql, time.perf_counter() - started))
+
+    def execute(self, sql, params=()):
+        return self._timed(sql, self._conn.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._timed(sql, self._conn.executemany, sql, seq_of_params)
+
+    def executescript(self, script):
+        return self._timed("-- script", self._conn.executescript, script)
+
+    def stream(self, sql, params=(), **kwargs):
+        # Only the time spent fetching rows counts, not the caller's work between them
+        rows = self._conn.stream(sql, params, **kwargs)
+        seconds = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - started
+                yield row
+        finally:
+            rows.close()
+            self._trace.queries.append((sql, seconds))
+
+    def commit(self):
+        return self._timed("COMMIT", self._conn.commit)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class Registry:
+    """Process-wide counters fed by finish()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.routes = {}      # (route, method, status) -> {"count", "seconds", "buckets", "queries", "db_seconds"}
+            self.statements = {}  # normalized sql -> {"calls", "seconds", "max", "routes"}
+            self.slow_queries = Counter()     # route -> count
+            self.slow_requests = Counter()    # route -> count
+            self.n_plus_one = Counter()       # (route, normalized sql) -> requests flagged
+
+    def finish(self, trace, route, method, status):
+        """Folds a finished request into the counters and logs what it flagged."""
+        elapsed = time.perf_counter() - trace.started
+        per_statement = {}
+        db_seconds = 0.0
+        for sql, seconds in trace.queries:
+            text = normalize(sql)
+            calls, total, longest = per_statement.get(text, (0, 0.0, 0.0))
+            per_statement[text] = (calls + 1, total + seconds, max(longest, seconds))
+            db_seconds += seconds
+
+        slow = [(text, longest) for text, (_, _, longest) in per_statement.items() if longest * 1000 >= SLOW_QUERY_MS]
+        repeated = [(text, calls) for text, (calls, _, _) in per_statement.items() if calls >= N_PLUS_ONE_THRESHOLD]
+
+        with self._lock:
+            stats = self.routes.setdefault((route, method, status), {
+                "count": 0, "seconds": 0.0, "buckets": [0] * len(LATENCY_BUCKETS), "queries": 0, "db_seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += elapsed
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed <= bound:
+                    stats["buckets"][i] += 1
+            stats["queries"] += len(trace.queries)
+            stats["db_seconds"] += db_seconds
+            for text, (calls, total, longest) in per_statement.items():
+                statement = self.statements.setdefault(text, {"calls": 0, "seconds": 0.0, "max": 0.0, "routes": set()})
+                statement["calls"] += calls
+                statement["seconds"] += total
+                statement["max"] = max(statement["max"], longest)
+                statement["routes"].add(route)
+            if slow:
+                self.slow_queries[route] += len(slow)
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                self.slow_requests[route] += 1
+            for text, _ in repeated:
+                self.n_plus_one[(route, text)] += 1
+
+        for text, longest in slow:
+            logger.warning("Slow query (%.0f ms) in %s %s: %s", longest * 1000, method, route, text)
+        for text, calls in repeated:
+            logger.warning("Possible N+1 in %s %s: %d runs of %s", method, route, calls, text)
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            logger.warning("Slow request (%.0f ms, %d queries): %s %s", elapsed * 1000, len(trace.queries), method, route)
+
+    def top_statements(self, limit=50):
+        """Statements by total time, with their SQL text and the routes that ran them."""
+        with self._lock:
+            rows = [{"sql": text, "calls": s["calls"], "total_ms": round(s["seconds"] * 1000, 2),
+                     "avg_ms": round(s["seconds"] * 1000 / s["calls"], 3), "max_ms": round(s["max"] * 1000, 2),
+                     "routes": sorted(s["routes"])}
+                    for text, s in self.statements.items()]
+            flagged = [{"route": route, "sql": text, "requests": count}
+                       for (route, text), count in self.n_plus_one.most_common()]
+        rows.sort(key=lambda row: -row["total_ms"])
+        return {"since": self.started, "statements": rows[:limit], "n_plus_one": flagged}
+
+    def prometheus(self, gauges=None):
+        """The counters (plus `gauges`, {name: {labels tuple: value}}) in the Prometheus text format."""
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            routes = {key: dict(stats, buckets=list(stats["buckets"])) for key, stats in self.routes.items()}
+            statements = {text: dict(s) for text, s in self.statements.items()}
+            slow_queries, slow_requests, n_plus_one = Counter(self.slow_queries), Counter(self.slow_requests), Counter(self.n_plus_one)
+
+        metric("finance_http_request_duration_seconds", "histogram", "Request latency by route")
+        for (route, method, status), stats in sorted(routes.items()):
+            labels = f'route="{_escape(route)}",method="{method}",status="{status}"'
+            for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+                lines.append(f'finance_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'finance_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+            lines.append(f"finance_http_request_duration_seconds_sum{{{labels}}} {stats['seconds']:.6f}")
+            lines.append(f"finance_http_request_duration_seconds_count{{{labels}}} {stats['count']}")
+        metric("finance_db_queries_total", "counter", "Database statements run while serving the route")
+        for (route, method, status), stats in sorted(routes.items()):
+            lines.append(f'finance_db_queries_total{{route="{_escape(route)}",method="{method}",status="{status}"}} {stats["queries"]}')
+        metric("finance_db_seconds_total", "counter", "Time spent in database calls while serving the route")
+        for (route, method, status), stats in sorted(routes.items()):
+            lines.append(f'finance_db_seconds_total{{route="{_escape(route)}",method="{method}",status="{status}"}} {stats["db_seconds"]:.6f}')
+
+        metric("finance_db_statement_calls_total", "counter", "Calls per normalized statement")
+        for text, s in sorted(statements.items()):
+            lines.append(f'finance_db_statement_calls_total{{statement="{_escape(text)}"}} {s["calls"]}')
+        metric("finance_db_statement_seconds_total", "counter", "Time per normalized statement")
+        for text, s in sorted(statements.items()):
+            lines.append(f'finance_db_statement_seconds_total{{statement="{_escape(text)}"}} {s["seconds"]:.6f}')
+
+        metric("finance_db_slow_queries_total", "counter", f"Statements slower than {SLOW_QUERY_MS:g} ms")
+        for route, count in sorted(slow_queries.items()):
+            lines.append(f'finance_db_slow_queries_total{{route="{_escape(route)}"}} {count}')
+        metric("finance_http_slow_requests_total", "counter", f"Requests slower than {SLOW_REQUEST_MS:g} ms")
+        for route, count in sorted(slow_requests.items()):
+            lines.append(f'finance_http_slow_requests_total{{route="{_escape(route)}"}} {count}')
+        metric("finance_db_n_plus_one_total", "counter",
+               f"Requests that ran one statement {N_PLUS_ONE_THRESHOLD}+ times")
+        for (route, text), count in sorted(n_plus_one.items()):
+            lines.append(f'finance_db_n_plus_one_total{{route="{_escape(route)}",statement="{_escape(text)}"}} {count}')
+
+        for name, values in sorted((gauges or {}).items()):
+            metric(name, "gauge", name.replace("_", " "))
+            for labels, value in sorted(values.items()):
+                label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+registry = Registry()
+
+_profile_lock = threading.Lock()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+def sample_profile(seconds, interval=0.005):
+    """
+    Samples every other thread's stack each `interval` for `seconds`. Returns
+    (collapsed stack text, sample count), or None when a profile is already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = Counter()
+        samples = 0
+        deadline = time.perf_counter() + min(seconds, MAX_PROFILE_SECONDS)
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_name(frame))
+                    frame = frame.f_back
+                frames.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(frames))] += 1
+            samples += 1
+            time.sleep(interval)
+        text = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        return text, samples
+    finally:
+        _profile_lock.release()
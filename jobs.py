@@ -0,0 +1,377 @@
+"""
+Background job queue stored in the app database (the `jobs` table).
+
+Routes enqueue work and return at once; worker threads (or a separate
+`python jobs.py work` process) claim jobs, run the registered handler and
+record the outcome:
+
+    queued -> running -> succeeded
+                      -> queued again after a failure (backoff), until max_attempts
+                      -> failed
+
+A handler receives (db, payload, job) and returns a JSON-serializable result.
+Its writes and the job's "succeeded" mark are committed together, so a crash
+mid-job rolls both back and the job is simply claimed again. Callables the
+handler appends to job["on_commit"] run once that commit went through.
+
+A running job holds a lease: its `run_after` is the time the lease ends,
+LEASE_SECONDS after the claim. The worker renews it every HEARTBEAT_SECONDS
+while the handler runs, however long that takes (a large import or export).
+A job whose lease ran out has lost its worker and is put back in the queue.
+
+An idempotency key makes enqueue() return the existing job instead of adding
+a second one, e.g. an admin double-clicking "Approve". schedule() relies on it
+for periodic jobs: every process may enqueue the same time slot, it runs once.
+
+    python jobs.py work [DATABASE_URL]     run a worker in the foreground
+    python jobs.py status [DATABASE_URL]   queue depth and throughput
+"""
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pagination
+import storage
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 2.0
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = 60
+POLL_SECONDS = 1.0
+METRICS_WINDOW_SECONDS = 3600
+
+HANDLERS = {}
+
+_wake = threading.Event()
+_workers = {}
+_schedules = {}
+_workers_lock = threading.Lock()
+
+
+def handler(kind):
+    """Registers the function that runs jobs of `kind`."""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def _job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"]) if job["payload"] else {}
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def enqueue(db, kind, payload=None, idempotency_key=None, max_attempts=MAX_ATTEMPTS, delay=0):
+    """Adds a job (and commits). With an idempotency key already in use, returns that job instead."""
+    if kind not in HANDLERS:
+        raise ValueError(f"no handler registered for job kind {kind!r}")
+    idempotency_key = idempotency_key or f"{kind}:{uuid.uuid4().hex}"
+    now = time.time()
+    cur = db.execute("""INSERT INTO jobs (kind, payload, idempotency_key, status, attempts, max_attempts, run_after, created_at)
+                        VALUES (?, ?, ?, 'queued', 0, ?, ?, ?)
+                        ON CONFLICT (idempotency_key) DO NOTHING""",
+                     (kind, json.dumps(payload or {}), idempotency_key, max_attempts, now + delay, now))
+    created = cur.rowcount == 1
+    db.commit()
+    if created:
+        _wake.set()
+    return _job(db.execute("SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone())
+
+
+def get_job(db, job_id):
+    return _job(db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def jobs_page(db, cursor=None, limit=pagination.DEFAULT_PAGE_SIZE):
+    """Newest jobs first, keyset-paginated like the other admin listings."""
+    rows, next_cursor = pagination.keyset_page(db, "SELECT * FROM jobs",
+                                               [("created_at", "created_at", float), ("id", "id", int)], cursor, limit)
+    return [_job(row) for row in rows], next_cursor
+
+
+def retry(db, job_id):
+    """Puts a failed job back in the queue with a fresh attempt budget."""
+    cur = db.execute("UPDATE jobs SET status='queued', attempts=0, run_after=?, error=NULL WHERE id=? AND status='failed'",
+                     (time.time(), job_id))
+    db.commit()
+    if cur.rowcount:
+        _wake.set()
+    return cur.rowcount == 1
+
+
+def _release_expired(db, now):
+    # Read first: an idle poll should not take the write lock. The started_at
+    # bound covers rows claimed before leases were kept in run_after.
+    expired = "status='running' AND run_after < ? AND started_at < ?"
+    if db.execute(f"SELECT 1 FROM jobs WHERE {expired} LIMIT 1", (now, now - LEASE_SECONDS)).fetchone():
+        db.execute(f"UPDATE jobs SET status='queued', worker=NULL WHERE {expired}", (now, now - LEASE_SECONDS))
+        db.commit()
+
+
+def claim(db, worker):
+    """Takes the next runnable job, or returns None. Safe against concurrent workers."""
+    now = time.time()
+    _release_expired(db, now)
+    candidates = db.execute("""SELECT id FROM jobs WHERE status='queued' AND run_after <= ?
+                               ORDER BY run_after, id LIMIT 5""", (now,)).fetchall()
+    for row in candidates:
+        cur = db.execute("""UPDATE jobs SET status='running', attempts=attempts+1, started_at=?, run_after=?, worker=?
+                            WHERE id=? AND status='queued'""", (now, now + LEASE_SECONDS, worker, row[0]))
+        db.commit()
+        if cur.rowcount == 1:  # another worker may have won the race
+            return get_job(db, row[0])
+    db.commit()
+    return None
+
+
+def run_job(db, job):
+    """Runs one claimed job and records success, a scheduled retry or the final failure."""
+    fn = HANDLERS.get(job["kind"])
+    try:
+        if fn is None:
+            raise LookupError(f"no handler registered for job kind {job['kind']!r}")
+        job["on_commit"] = []
+        result = fn(db, job["payload"], job)
+        db.execute("UPDATE jobs SET status='succeeded', result=?, error=NULL, finished_at=? WHERE id=?",
+                   (json.dumps(result), time.time(), job["id"]))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        error = f"{type(e).__name__}: {e}"
+        if job["attempts"] < job["max_attempts"]:
+            db.execute("UPDATE jobs SET status='queued', error=?, run_after=? WHERE id=?",
+                       (error, time.time() + RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1), job["id"]))
+            logger.warning("Job %s (%s) failed, will retry: %s", job["id"], job["kind"], error)
+        else:
+            db.execute("UPDATE jobs SET status='failed', error=?, finished_at=? WHERE id=?",
+                       (error, time.time(), job["id"]))
+            logger.exception("Job %s (%s) failed after %s attempts", job["id"], job["kind"], job["attempts"])
+        db.commit()
+        return False
+    for callback in job.pop("on_commit"):
+        try:
+            callback()
+        except Exception:  # the job itself succeeded
+            logger.exception("on_commit callback of job %s (%s) failed", job["id"], job["kind"])
+    return True
+
+
+class Heartbeat(threading.Thread):
+    """Renews a running job's lease from its own connection until stop()."""
+
+    def __init__(self, url, job):
+        super().__init__(name=f"heartbeat-{job['id']}", daemon=True)
+        self.url = url
+        self.job = job
+        self.stopping = threading.Event()
+
+    def run(self):
+        db = None
+        try:
+            while not self.stopping.wait(HEARTBEAT_SECONDS):
+                try:
+                    db = db or storage.connect(self.url)
+                    db.execute("UPDATE jobs SET run_after=? WHERE id=? AND status='running' AND worker=?",
+                               (time.time() + LEASE_SECONDS, self.job["id"], self.job["worker"]))
+                    db.commit()
+                except Exception:
+                    # On SQLite the handler's transaction may hold the write lock; then
+                    # no other worker can release the job either, so try the next beat
+                    logger.debug("Could not renew the lease of job %s", self.job["id"], exc_info=True)
+                    if db is not None:
+                        db.rollback()
+        finally:
+            if db is not None:
+                db.close()
+
+    def stop(self):
+        self.stopping.set()
+
+
+def run_pending(db, worker="inline"):
+    """Runs every job that is due now in the calling thread; returns how many ran."""
+    count = 0
+    while True:
+        job = claim(db, worker)
+        if job is None:
+            return count
+        run_job(db, job)
+        count += 1
+
+
+class Worker(threading.Thread):
+    """Claims and runs jobs on its own connection until stopped."""
+
+    def __init__(self, url, name):
+        super().__init__(name=name, daemon=True)
+        self.url = url
+        self.stopping = threading.Event()
+
+    def run(self):
+        db = storage.connect(self.url)
+        try:
+            while not self.stopping.is_set():
+                try:
+                    job = claim(db, self.name)
+                    if job is not None:
+                        heartbeat = Heartbeat(self.url, job)
+                        heartbeat.start()
+                        try:
+                            run_job(db, job)
+                        finally:
+                            heartbeat.stop()
+                        continue
+                except db.Error:
+                    # e.g. the write lock stayed busy past the timeout; poll again later
+                    logger.exception("Worker %s could not claim a job", self.name)
+                    db.rollback()
+                _wake.wait(POLL_SECONDS)
+                _wake.clear()
+        finally:
+            db.close()
+
+    def stop(self):
+        self.stopping.set()
+        _wake.set()
+
+
+def start_workers(url, count):
+    """Starts `count` worker threads for a database (once per process)."""
+    with _workers_lock:
+        workers = [w for w in _workers.get(url, []) if w.is_alive()]
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        while len(workers) < count:
+            worker = Worker(url, f"{prefix}:worker-{len(workers) + 1}")
+            worker.start()
+            workers.append(worker)
+        _workers[url] = workers
+    return workers
+
+
+def schedule(url, kind, interval, payload=None):
+    """
+    Enqueues a `kind` job every `interval` seconds, at multiples of the
+    interval (once per process and kind). The slot is the idempotency key, so
+    several processes scheduling the same job still queue it once per slot.
+    """
+    with _workers_lock:
+        thread = _schedules.get((url, kind))
+        if thread is None or not thread.is_alive():
+            stopping = threading.Event()
+            thread = threading.Thread(target=_schedule_loop, args=(url, kind, interval, payload, stopping),
+                                      name=f"schedule-{kind}", daemon=True)
+            thread.stopping = stopping
+            thread.start()
+            _schedules[(url, kind)] = thread
+    return thread
+
+
+def stop(url):
+    """Stops the workers and schedules of a database (they finish the job at hand first)."""
+    with _workers_lock:
+        threads = _workers.pop(url, [])
+        for key in [key for key in _schedules if key[0] == url]:
+            threads.append(_schedules.pop(key))
+    for thread in threads:
+        thread.stopping.set()
+    _wake.set()
+    return len(threads)
+
+
+def _schedule_loop(url, kind, interval, payload, stopping):
+    db = storage.connect(url)
+    try:
+        while True:
+            slot = (int(time.time() // interval) + 1) * interval
+            if stopping.wait(max(0, slot - time.time())):
+                return
+            try:
+                enqueue(db, kind, payload, f"{kind}@{slot}")
+            except db.Error:
+                logger.exception("Could not enqueue the scheduled %s job", kind)
+                db.rollback()
+    finally:
+        db.close()
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else None
+
+
+def describe(job):
+    """JSON view of a job for the status endpoints."""
+    view = {key: job[key] for key in ("id", "kind", "status", "attempts", "max_attempts", "idempotency_key",
+                                      "worker", "payload", "result", "error")}
+    view["created_at"] = _iso(job["created_at"])
+    view["started_at"] = _iso(job["started_at"])
+    view["finished_at"] = _iso(job["finished_at"])
+    view["queue_wait_ms"] = round((job["started_at"] - job["created_at"]) * 1000, 1) if job["started_at"] else None
+    view["run_ms"] = round((job["finished_at"] - job["started_at"]) * 1000, 1) if job["finished_at"] and job["started_at"] else None
+    return view
+
+
+def metrics(db, window=METRICS_WINDOW_SECONDS):
+    """Queue depth plus throughput and latency of the jobs finished in the last `window` seconds."""
+    now = time.time()
+    depth = {row[0]: row[1] for row in db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+    oldest = db.execute("SELECT MIN(run_after) FROM jobs WHERE status='queued' AND run_after <= ?", (now,)).fetchone()[0]
+
+    kinds = {}
+    for row in db.execute("""SELECT kind, status, created_at, started_at, finished_at FROM jobs
+                             WHERE finished_at >= ?""", (now - window,)):
+        stats = kinds.setdefault(row['kind'], {"succeeded": 0, "failed": 0, "run_ms": [], "wait_ms": []})
+        stats[row['status']] = stats.get(row['status'], 0) + 1
+        if row['started_at']:
+            stats["run_ms"].append((row['finished_at'] - row['started_at']) * 1000)
+            stats["wait_ms"].append((row['started_at'] - row['created_at']) * 1000)
+
+    for stats in kinds.values():
+        run_ms, wait_ms = sorted(stats.pop("run_ms")), stats.pop("wait_ms")
+        finished = stats["succeeded"] + stats["failed"]
+        stats["per_minute"] = round(finished / (window / 60), 2)
+        stats["avg_run_ms"] = round(sum(run_ms) / len(run_ms), 1) if run_ms else 0
+        stats["p95_run_ms"] = round(run_ms[int(0.95 * (len(run_ms) - 1))], 1) if run_ms else 0
+        stats["avg_queue_wait_ms"] = round(sum(wait_ms) / len(wait_ms), 1) if wait_ms else 0
+
+    return {
+        "window_seconds": window,
+        "depth": {status: depth.get(status, 0) for status in ("queued", "running", "succeeded", "failed")},
+        "oldest_queued_age_s": round(now - oldest, 1) if oldest else 0,
+        "kinds": kinds,
+        "workers_alive": sum(w.is_alive() for workers in _workers.values() for w in workers),
+    }
+
+
+if __name__ == "__main__":
+    import migrate
+    import tasks  # noqa: F401  registers the handlers
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("work", "status"):
+        print("Usage: python jobs.py work|status [DATABASE_URL]")
+        raise SystemExit(2)
+
+    url = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("DATABASE_URL", "database.db")
+    db = storage.connect(url)
+    migrate.apply_migrations(db)
+
+    if sys.argv[1] == "status":
+        print(json.dumps(metrics(db), indent=2))
+    else:
+        print(f"👷 Worker running on {url} (Ctrl+C to stop)")
+        worker = Worker(url, f"{socket.gethostname()}:{os.getpid()}:cli")
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            print("👋 Worker stopped")
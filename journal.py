@@ -0,0 +1,289 @@
+"""
+Append-only journal of money events, the record the balances are checked against.
+
+Every change to money goes through fund_ledger.record_*(), which appends a
+row to `journal` inside the caller's transaction: a contribution paid
+(+amount) or unpaid / deleted (-amount), a repayment recorded or deleted
+(with its interest part and the loan's remaining balance afterwards), a loan
+issued or reversed, a new starting fund. Rows are never updated or deleted
+(triggers refuse it), so a deleted contribution still leaves its history.
+
+Replaying the journal in order gives the state at any point: the fund
+totals, each loan's remaining balance and each member's paid contributions.
+`journal_snapshots` keeps that state at the start of every month, so
+as_of(db, "2024-03-15") loads the 2024-03-01 snapshot and replays half a
+month of events instead of the whole history. fund_summary and
+loans.remaining_balance remain the read models every page uses for the
+current state; verify checks them against a full replay.
+
+Events are appended with the current time, so a snapshot never misses one.
+Databases from before the journal got opening entries built from their rows
+(migrations/*/0008_journal.sql); balances between those are not known.
+
+    python journal.py as-of 2024-03-15 [DATABASE_URL]
+    python journal.py snapshot [DATABASE_URL]      take the missing monthly snapshots
+    python journal.py verify [DATABASE_URL]        replay everything, compare with fund_summary and the loans
+"""
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+import fund_ledger
+import migrate
+import storage
+
+DB_NAME = "database.db"
+
+CONTRIBUTION = "contribution"
+REPAYMENT = "repayment"
+LOAN_ISSUED = "loan_issued"
+STARTING_FUND = "starting_fund"
+
+EVENT_COLUMNS = "seq, occurred_at, kind, member_id, loan_id, amount, interest, balance"
+TOTALS = ("starting_fund", "total_collections", "total_repayments", "total_loans_issued", "total_interest_earned")
+TOLERANCE = 0.005
+
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?$")
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def append(db, kind, amount=0, member_id=None, loan_id=None, ref_id=None, interest=0, balance=None, at=None):
+    """Appends one event. Does not commit (the caller's write and its event land together)."""
+    db.execute("""INSERT INTO journal (occurred_at, kind, member_id, loan_id, ref_id, amount, interest, balance)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+               (at or _now(), kind, member_id, loan_id, ref_id, amount, interest, balance))
+
+
+def empty_state():
+    state = {column: 0.0 for column in TOTALS}
+    state["loans"] = {}    # loan_id -> remaining balance (0 once repaid)
+    state["members"] = {}  # member_id -> paid contributions
+    state["events"] = 0
+    state["last_seq"] = 0
+    return state
+
+
+def apply(state, events):
+    """Folds events (rows in EVENT_COLUMNS order) into `state`, in place."""
+    loans, members = state["loans"], state["members"]
+    collections = repayments = issued = interest_earned = 0.0
+    count = 0
+    seq = state["last_seq"]
+    for seq, _, kind, member_id, loan_id, amount, interest, balance in events:
+        count += 1
+        if kind == CONTRIBUTION:
+            collections += amount
+            if member_id is not None:
+                members[member_id] = members.get(member_id, 0) + amount
+        elif kind == REPAYMENT:
+            repayments += amount
+            interest_earned += interest
+            if balance is not None and loan_id is not None:
+                loans[loan_id] = balance
+        elif kind == LOAN_ISSUED:
+            issued += amount
+            if amount > 0:
+                loans[loan_id] = amount if balance is None else balance
+            else:
+                loans.pop(loan_id, None)
+        elif kind == STARTING_FUND:
+            state["starting_fund"] = balance
+    state["total_collections"] += collections
+    state["total_repayments"] += repayments
+    state["total_loans_issued"] += issued
+    state["total_interest_earned"] += interest_earned
+    state["events"] += count
+    state["last_seq"] = max(state["last_seq"], seq)
+    return state
+
+
+def summary(state):
+    """The fund view of a state, with the same keys as fund_ledger.get_fund_summary() plus outstanding_principal."""
+    view = {column: state[column] for column in TOTALS if column != "starting_fund"}
+    view["starting_fund"] = state["starting_fund"]
+    view["balance"] = (state["starting_fund"] + state["total_collections"]
+                       + state["total_repayments"] - state["total_loans_issued"])
+    view["outstanding_principal"] = sum(state["loans"].values())
+    return view
+
+
+def _dump(state):
+    return json.dumps({**state, "loans": list(state["loans"].items()), "members": list(state["members"].items())})
+
+
+def _load(text):
+    state = json.loads(text)
+    state["loans"] = dict(state["loans"])
+    state["members"] = dict(state["members"])
+    return state
+
+
+def _events(db, start=None, end=None, inclusive=False):
+    """Events with start <= occurred_at < end (<= end when inclusive), oldest first."""
+    clauses, params = [], []
+    if start:
+        clauses.append("occurred_at >= ?")
+        params.append(start)
+    if end:
+        clauses.append("occurred_at <= ?" if inclusive else "occurred_at < ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return db.stream(f"SELECT {EVENT_COLUMNS} FROM journal {where} ORDER BY occurred_at, seq", params)
+
+
+def parse_at(text):
+    """'YYYY-MM-DD' (end of that day) or 'YYYY-MM-DD HH:MM:SS'; raises ValueError otherwise."""
+    text = (text or "").strip()
+    if not _DATE.match(text):
+        raise ValueError("dates are YYYY-MM-DD or YYYY-MM-DD HH:MM:SS")
+    datetime.strptime(text[:10], "%Y-%m-%d")
+    return text if len(text) > 10 else text + " 23:59:59"
+
+
+def latest_snapshot(db, at=None):
+    """(period_end, state) of the newest snapshot at or before `at`, or (None, empty state)."""
+    if at:
+        row = db.execute("""SELECT period_end, state FROM journal_snapshots WHERE period_end <= ?
+                            ORDER BY period_end DESC LIMIT 1""", (at,)).fetchone()
+    else:
+        row = db.execute("SELECT period_end, state FROM journal_snapshots ORDER BY period_end DESC LIMIT 1").fetchone()
+    return (row['period_end'], _load(row['state'])) if row else (None, empty_state())
+
+
+def as_of(db, at):
+    """The state after every event up to `at` (a parse_at() timestamp): nearest snapshot plus the events since."""
+    start, state = latest_snapshot(db, at)
+    return apply(state, _events(db, start, at, inclusive=True))
+
+
+def replay(db, at=None):
+    """The same state from a full replay of the journal (what snapshots save)."""
+    return apply(empty_state(), _events(db, None, at, inclusive=True))
+
+
+def _month_starts(first, last):
+    """'YYYY-MM-01 00:00:00' of every month after `first`'s, up to and including `last`'s."""
+    year, month = int(first[:4]), int(first[5:7])
+    end = (int(last[:4]), int(last[5:7]))
+    while True:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        if (year, month) > end:
+            return
+        yield f"{year:04d}-{month:02d}-01 00:00:00"
+
+
+def take_snapshots(db, now=None):
+    """Saves the state at the start of every month that has begun since the last snapshot. Does not commit."""
+    now = now or _now()
+    start, state = latest_snapshot(db)
+    if start is None:
+        first = db.execute("SELECT MIN(occurred_at) FROM journal").fetchone()[0]
+        if first is None:
+            return []
+        start = first[:7] + "-01 00:00:00"
+        # Nothing happened before the first event's month: that is the first period
+        taken = [start]
+        db.execute("INSERT INTO journal_snapshots (period_end, last_seq, events, state, taken_at) VALUES (?, 0, 0, ?, ?)",
+                   (start, _dump(state), now))
+    else:
+        taken = []
+    periods = list(_month_starts(start, now))
+    if not periods:
+        return taken
+    # One ordered pass over the events, cut at every month start (a long import catches up many months)
+    events = iter(_events(db, start, periods[-1]))
+    event = next(events, None)
+
+    def before(period_end):
+        nonlocal event
+        while event is not None and event[1] < period_end:
+            yield event
+            event = next(events, None)
+
+    rows = []
+    for period_end in periods:
+        apply(state, before(period_end))
+        rows.append((period_end, state["last_seq"], state["events"], _dump(state), now))
+    db.executemany("INSERT INTO journal_snapshots (period_end, last_seq, events, state, taken_at) VALUES (?, ?, ?, ?, ?)",
+                   rows)
+    return taken + periods
+
+
+def _differs(a, b):
+    return abs((a or 0) - (b or 0)) > TOLERANCE
+
+
+def verify(db):
+    """
+    Replays the whole journal once and returns a list of (what, stored,
+    replayed) for every snapshot, fund_summary total or loan balance that
+    disagrees with it.
+    """
+    mismatches = []
+    state, start = empty_state(), None
+    for row in db.execute("SELECT period_end, state FROM journal_snapshots ORDER BY period_end").fetchall():
+        apply(state, _events(db, start, row['period_end']))
+        saved = _load(row['state'])
+        for column in TOTALS:
+            if _differs(saved[column], state[column]):
+                mismatches.append((f"snapshot {row['period_end']} {column}", saved[column], state[column]))
+        start = row['period_end']
+    apply(state, _events(db, start))
+
+    stored = fund_ledger.get_fund_summary(db)
+    for column in TOTALS:
+        if _differs(stored[column], state[column]):
+            mismatches.append((column, stored[column], state[column]))
+    for row in db.execute("SELECT loan_id, remaining_balance FROM loans WHERE status IN ('approved', 'paid')"):
+        replayed = state["loans"].get(row['loan_id'])
+        if replayed is None or _differs(row['remaining_balance'], replayed):
+            mismatches.append((f"loan {row['loan_id']} remaining_balance", row['remaining_balance'], replayed))
+    return mismatches
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    args = sys.argv[2:]
+    at = None
+    if command == "as-of":
+        if not args:
+            print("Usage: python journal.py as-of YYYY-MM-DD [DATABASE_URL]")
+            sys.exit(2)
+        at, args = args[0], args[1:]
+    db_url = args[0] if args else os.environ.get("DATABASE_URL", DB_NAME)
+
+    conn = storage.connect(db_url)
+    try:
+        migrate.apply_migrations(conn)
+        if command == "as-of":
+            try:
+                at = parse_at(at)
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(2)
+            state = as_of(conn, at)
+            print(f"📒 As of {at} ({state['events']} events):")
+            for key, value in summary(state).items():
+                print(f"   {key}: {value:,.2f}")
+        elif command == "snapshot":
+            taken = take_snapshots(conn)
+            conn.commit()
+            print(f"✅ {len(taken)} snapshots taken" + (f", newest {taken[-1]}" if taken else ""))
+        elif command == "verify":
+            mismatches = verify(conn)
+            if mismatches:
+                print("❌ The journal disagrees with the stored balances:")
+                for what, stored, replayed in mismatches:
+                    print(f"   {what}: stored={stored} replayed={replayed}")
+                sys.exit(1)
+            print("✅ Journal replay matches fund_summary, the loan balances and the snapshots.")
+        else:
+            print("Usage: python journal.py [as-of DATE|snapshot|verify] [DATABASE_URL]")
+            sys.exit(2)
+    finally:
+        conn.close()
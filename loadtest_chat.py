@@ -0,0 +1,160 @@
+"""
+Load test for the live chat stream (/chat/stream).
+
+Opens CLIENTS concurrent Server-Sent Events connections to a running
+instance, posts MESSAGES chat messages and measures how long each one takes
+to reach every connected client.
+
+    gunicorn -k gthread --threads 1100 --worker-connections 1200 -b 127.0.0.1:8000 app:app
+    python loadtest_chat.py http://127.0.0.1:8000 --clients 1000 --messages 20
+
+Every open stream holds one server thread, so give the server more threads
+than clients (and raise `ulimit -n` for large runs).
+"""
+import argparse
+import http.client
+import json
+import selectors
+import socket
+import statistics
+import threading
+import time
+import urllib.parse
+
+
+def login(host, port, username, password):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request("POST", "/login", urllib.parse.urlencode({"username": username, "password": password}),
+                 {"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader("Set-Cookie")
+    if response.status != 302 or not cookie:
+        raise SystemExit(f"❌ Login failed ({response.status})")
+    return cookie.split(";", 1)[0]
+
+
+def post_message(host, port, cookie, content):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request("POST", "/send_message", urllib.parse.urlencode({"content": content}),
+                 {"Content-Type": "application/x-www-form-urlencoded", "Accept": "application/json", "Cookie": cookie})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status
+
+
+class Streams:
+    """Holds many SSE connections on one selector thread and records when each message arrives."""
+
+    def __init__(self, host, port, cookie):
+        self.host, self.port, self.cookie = host, port, cookie
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}
+        self.status = {}
+        self.received = {}  # content -> [arrival times]
+        self.lock = threading.Lock()
+        self.running = True
+
+    def open(self, count):
+        request = (f"GET /chat/stream HTTP/1.0\r\nHost: {self.host}:{self.port}\r\n"
+                   f"Accept: text/event-stream\r\nCookie: {self.cookie}\r\n\r\n").encode()
+        for _ in range(count):
+            sock = socket.create_connection((self.host, self.port), timeout=10)
+            sock.sendall(request)
+            sock.setblocking(False)
+            self.buffers[sock] = b""
+            self.status[sock] = None
+            self.selector.register(sock, selectors.EVENT_READ)
+
+    def run(self):
+        while self.running:
+            for key, _ in self.selector.select(timeout=0.2):
+                sock = key.fileobj
+                try:
+                    data = sock.recv(65536)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    data = b""
+                if not data:
+                    self.selector.unregister(sock)
+                    self.status[sock] = self.status[sock] or "closed"
+                    sock.close()
+                    continue
+                self._feed(sock, data, time.perf_counter())
+
+    def _feed(self, sock, data, now):
+        buffer = self.buffers[sock] + data
+        if self.status[sock] is None and b"\r\n" in buffer:
+            self.status[sock] = int(buffer.split(b" ", 2)[1])
+        *lines, self.buffers[sock] = buffer.split(b"\n")
+        for line in lines:
+            if line.startswith(b"data: ") and line != b"data: {}":
+                content = json.loads(line[6:])["content"]
+                with self.lock:
+                    self.received.setdefault(content, []).append(now)
+
+    def connected(self):
+        return sum(1 for status in self.status.values() if status == 200)
+
+    def refused(self):
+        return sum(1 for status in self.status.values() if status not in (None, 200))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))] if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url", nargs="?", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between posted messages")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    args = parser.parse_args()
+
+    target = urllib.parse.urlparse(args.url)
+    host, port = target.hostname, target.port or 80
+    cookie = login(host, port, args.username, args.password)
+
+    streams = Streams(host, port, cookie)
+    reader = threading.Thread(target=streams.run, daemon=True)
+    started = time.perf_counter()
+    streams.open(args.clients)
+    reader.start()
+    while streams.connected() + streams.refused() < args.clients and time.perf_counter() - started < 60:
+        time.sleep(0.1)
+    print(f"🔌 {streams.connected()} streams open, {streams.refused()} refused "
+          f"({time.perf_counter() - started:.1f}s to connect)")
+
+    sent = {}
+    run = f"loadtest-{int(time.time())}"
+    for i in range(args.messages):
+        content = f"{run}-{i}"
+        sent[content] = time.perf_counter()
+        status = post_message(host, port, cookie, content)
+        if status != 204:
+            print(f"⚠️ send_message returned {status}")
+        time.sleep(args.interval)
+    time.sleep(2)
+    streams.running = False
+    reader.join()
+
+    latencies, complete = [], 0
+    for content, posted in sent.items():
+        arrivals = streams.received.get(content, [])
+        latencies += [(arrival - posted) * 1000 for arrival in arrivals]
+        complete += len(arrivals) == streams.connected()
+    expected = len(sent) * streams.connected()
+    print(f"📨 {len(latencies)}/{expected} deliveries, {complete}/{len(sent)} messages reached every client")
+    if latencies:
+        print(f"⏱️ latency post→client: p50 {statistics.median(latencies):.1f} ms, "
+              f"p95 {percentile(latencies, 0.95):.1f} ms, max {max(latencies):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Every approved loan's EMI schedule, one stored row per month.
+
+`loan_schedule` holds a row per (loan_id, month_no) with its due date,
+principal, interest, EMI and the balance expected after it. generate() writes
+the whole schedule when a loan is approved (priced by amortization.schedules()).
+Payments are reconciled into it as they arrive: record_payment() marks a
+month paid, or due again when its payment is deleted, and close() retires the
+unpaid months of a loan repaid early. "What is due this month" and "what is
+overdue" are then one range over the (status, due_date) index.
+
+Month n is due on the approval day n months later (the month's last day when
+it is shorter). The write helpers run inside the caller's transaction. Run
+this file directly to check the table against the loans and payments, or to
+rebuild it:
+
+    python loan_schedule.py verify [DATABASE_URL]
+    python loan_schedule.py rebuild [DATABASE_URL]
+"""
+import calendar
+import os
+import sys
+from datetime import date
+
+import amortization
+import migrate
+import storage
+
+DB_NAME = "database.db"
+
+DUE = "due"
+PAID = "paid"
+CLOSED = "closed"  # not paid, but the loan was repaid early
+
+COLUMNS = ("loan_id", "month_no", "due_date", "principal", "interest", "emi", "expected_balance",
+           "paid_amount", "paid_date", "status")
+LOAN_COLUMNS = "loan_id, amount, total_months, interest_rate_percent, approved_time, request_time, repayment_status"
+TOLERANCE = 0.005
+
+
+def due_date(start, month_no):
+    """The date EMI `month_no` falls due for a loan approved on `start` (a date)."""
+    year, month = divmod(start.month - 1 + month_no, 12)
+    year, month = start.year + year, month + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def _start(loan):
+    started = loan['approved_time'] or loan['request_time']
+    return date.fromisoformat(str(started)[:10]) if started else None
+
+
+def _payments(db, loan_id=None):
+    """{(loan_id, month_no): (paid amount, last paid date)} of the paid interest_payments rows."""
+    where, params = ("AND loan_id = ?", (loan_id,)) if loan_id is not None else ("", ())
+    rows = db.execute(f"""SELECT loan_id, month_no, SUM(amount) AS paid_amount, MAX(paid_date) AS paid_date
+                          FROM interest_payments WHERE status = 'paid' {where}
+                          GROUP BY loan_id, month_no""", params)
+    return {(row['loan_id'], row['month_no']): (row['paid_amount'], row['paid_date']) for row in rows}
+
+
+def compute_rows(loans, payments):
+    """Schedule rows (in COLUMNS order) for `loans`, with the months in `payments` marked paid."""
+    loans = [loan for loan in loans if (loan['total_months'] or 0) > 0 and _start(loan)]
+    if not loans:
+        return []
+    columns = amortization.schedules([loan['amount'] for loan in loans], [loan['total_months'] for loan in loans],
+                                     [loan['interest_rate_percent'] for loan in loans])
+    rows = []
+    for i, index in enumerate(columns["loan_index"]):
+        loan = loans[index]
+        month_no = int(columns["month"][i])
+        paid = payments.get((loan['loan_id'], month_no))
+        status = PAID if paid else CLOSED if loan['repayment_status'] == 'closed' else DUE
+        rows.append((loan['loan_id'], month_no, due_date(_start(loan), month_no).isoformat(),
+                     float(columns["principal_component"][i]), float(columns["interest_component"][i]),
+                     float(columns["total_emi"][i]), float(columns["remaining_principal_end"][i]),
+                     paid[0] if paid else 0, paid[1] if paid else None, status))
+    return rows
+
+
+def _insert(db, rows):
+    db.executemany(f"INSERT INTO loan_schedule ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                   rows)
+
+
+def generate(db, loan_id):
+    """Writes the schedule of a loan that was just approved (replacing any earlier one)."""
+    loan = db.execute(f"SELECT {LOAN_COLUMNS} FROM loans WHERE loan_id = ?", (loan_id,)).fetchone()
+    remove(db, loan_id)
+    if loan:
+        _insert(db, compute_rows([loan], _payments(db, loan_id)))
+
+
+def remove(db, loan_id):
+    """The loan is no longer approved (rejected after approval): its schedule goes."""
+    db.execute("DELETE FROM loan_schedule WHERE loan_id = ?", (loan_id,))
+
+
+def record_payment(db, loan, month_no):
+    """
+    A payment for `month_no` of `loan` was recorded or deleted: the month is
+    paid while any paid payment for it is left, due (closed, for a closed
+    loan) otherwise. Months outside the schedule are ignored.
+    """
+    try:
+        month_no = int(month_no)
+    except (TypeError, ValueError):
+        return
+    row = db.execute("""SELECT COUNT(*) AS payments, SUM(amount) AS paid_amount, MAX(paid_date) AS paid_date
+                        FROM interest_payments WHERE loan_id = ? AND status = 'paid' AND month_no = ?""",
+                     (loan['loan_id'], month_no)).fetchone()
+    unpaid = CLOSED if loan['repayment_status'] == 'closed' else DUE
+    db.execute("""UPDATE loan_schedule SET paid_amount = ?, paid_date = ?, status = ?
+                  WHERE loan_id = ? AND month_no = ?""",
+               (row['paid_amount'] or 0, row['paid_date'], PAID if row['payments'] else unpaid,
+                loan['loan_id'], month_no))
+
+
+def close(db, loan_id):
+    """The loan was repaid early: its unpaid months are no longer due."""
+    db.execute("UPDATE loan_schedule SET status = ? WHERE loan_id = ? AND status = ?", (CLOSED, loan_id, DUE))
+
+
+_LISTING = """SELECT s.loan_id, s.month_no, s.due_date, s.emi, s.principal, s.interest, s.expected_balance,
+                     l.member_id, m.name
+              FROM loan_schedule s
+              JOIN loans l ON l.loan_id = s.loan_id
+              JOIN members m ON m.member_id = l.member_id"""
+
+
+def due_between(db, start, end):
+    """Unpaid EMIs due on start <= due_date < end ('YYYY-MM-DD'), earliest first."""
+    return db.execute(f"""{_LISTING} WHERE s.status = 'due' AND s.due_date >= ? AND s.due_date < ?
+                          ORDER BY s.due_date, s.loan_id""", (start, end)).fetchall()
+
+
+def overdue(db, today=None):
+    """Unpaid EMIs whose due date has passed, oldest first."""
+    today = (today or date.today()).isoformat()
+    return db.execute(f"""{_LISTING} WHERE s.status = 'due' AND s.due_date < ?
+                          ORDER BY s.due_date, s.loan_id""", (today,)).fetchall()
+
+
+def by_loan(db, where="1=1", params=()):
+    """{loan_id: [schedule rows, by month]} for the loans matching `where` (over the `l` alias)."""
+    schedules = {}
+    for row in db.execute(f"""SELECT s.* FROM loans l JOIN loan_schedule s ON s.loan_id = l.loan_id
+                              WHERE {where} ORDER BY s.loan_id, s.month_no""", tuple(params)):
+        schedules.setdefault(row['loan_id'], []).append(row)
+    return schedules
+
+
+def _approved_loans(db):
+    return db.execute(f"SELECT {LOAN_COLUMNS} FROM loans WHERE status IN ('approved', 'paid')").fetchall()
+
+
+def rebuild(db):
+    """Recomputes every schedule from the loans and payments. Does not commit. Returns the row count."""
+    rows = compute_rows(_approved_loans(db), _payments(db))
+    db.execute("DELETE FROM loan_schedule")
+    _insert(db, rows)
+    return len(rows)
+
+
+def _differs(stored, expected):
+    if isinstance(expected, (int, float)):
+        return abs((stored or 0) - expected) > TOLERANCE
+    return stored != expected
+
+
+def verify(db):
+    """Returns a list of (loan_id, month_no, column, stored, expected) for every drifted, missing or extra row."""
+    expected = {(row[0], row[1]): row for row in compute_rows(_approved_loans(db), _payments(db))}
+    stored = {(row['loan_id'], row['month_no']): row
+              for row in db.execute(f"SELECT {', '.join(COLUMNS)} FROM loan_schedule")}
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        if key not in stored or key not in expected:
+            mismatches.append((*key, "row", "present" if key in stored else None,
+                               "present" if key in expected else None))
+            continue
+        for i, column in enumerate(COLUMNS[2:], start=2):
+            if _differs(stored[key][column], expected[key][i]):
+                mismatches.append((*key, column, stored[key][column], expected[key][i]))
+    return mismatches
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    db_url = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("DATABASE_URL", DB_NAME)
+
+    conn = storage.connect(db_url)
+    try:
+        migrate.apply_migrations(conn)
+        if command == "rebuild":
+            count = rebuild(conn)
+            conn.commit()
+            print(f"✅ {count} schedule rows rebuilt.")
+        elif command == "verify":
+            mismatches = verify(conn)
+            if mismatches:
+                print("❌ Loan schedules are out of sync:")
+                for loan_id, month_no, column, stored, expected in mismatches[:20]:
+                    print(f"   loan {loan_id} month {month_no} {column}: stored={stored} expected={expected}")
+                sys.exit(1)
+            print("✅ Loan schedules match the loans and payments.")
+        else:
+            print("Usage: python loan_schedule.py [verify|rebuild] [DATABASE_URL]")
+            sys.exit(2)
+    finally:
+        conn.close()
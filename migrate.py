@@ -0,0 +1,123 @@
+"""
+Versioned schema migrations.
+
+Each file in migrations/<dialect>/ (sqlite or postgres) is named
+NNNN_description.sql and is applied once, in order, inside its own transaction.
+Applied versions are recorded in the `schema_migrations` table, so existing
+databases can be upgraded in place without re-running /init. A database
+created from the current schema file is stamped with every version instead
+(stamp_current()), none of them runs there.
+
+    python migrate.py status [DATABASE_URL]
+    python migrate.py up [DATABASE_URL]
+"""
+import os
+import sys
+from datetime import datetime
+
+import storage
+
+DB_NAME = "database.db"
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# What a migration set aside instead of deleting: version -> (count query, message), reported when non-zero
+NOTICES = {
+    "0002_hot_path_indexes": ("SELECT COUNT(*) FROM contribution_duplicates",
+                              "{} duplicate contribution rows were moved to contribution_duplicates, review them "
+                              "(kept_id is the row kept for the same member and month)"),
+}
+
+
+def available_migrations(dialect="sqlite"):
+    """Returns [(version, path)] sorted by version."""
+    folder = os.path.join(MIGRATIONS_DIR, dialect)
+    migrations = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".sql"):
+            migrations.append((filename[:-4], os.path.join(folder, filename)))
+    return migrations
+
+
+def applied_versions(db):
+    db.execute("CREATE TABLE IF NOT EXISTS schema_migrations (version TEXT PRIMARY KEY, applied_at TEXT)")
+    return {row[0] for row in db.execute("SELECT version FROM schema_migrations")}
+
+
+def pending_migrations(db):
+    applied = applied_versions(db)
+    return [(version, path) for version, path in available_migrations(db.dialect) if version not in applied]
+
+
+def stamp_current(db):
+    """Records every migration as applied without running it, for a database just created from the schema file."""
+    applied = applied_versions(db)
+    applied_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for version, _ in available_migrations(db.dialect):
+        if version not in applied:
+            db.execute("INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)", (version, applied_at))
+    db.commit()
+
+
+def apply_migrations(db):
+    """
+    Applies every pending migration. Returns the list of versions applied.
+    Databases that have not been through /init yet are left untouched.
+    """
+    if not storage.table_exists(db, "members"):
+        return []
+
+    applied = []
+    for version, path in pending_migrations(db):
+        with open(path, mode='r') as f:
+            sql = f.read()
+        applied_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        stamp = f"INSERT INTO schema_migrations (version, applied_at) VALUES ('{version}', '{applied_at}');"
+        try:
+            if db.dialect == "sqlite":
+                # executescript() commits first, so BEGIN/COMMIT makes each file atomic
+                db.executescript(f"BEGIN;\n{sql}\n{stamp}\nCOMMIT;")
+            else:
+                db.executescript(f"{sql}\n{stamp}")
+                db.commit()
+        except db.Error:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        applied.append(version)
+        if version in NOTICES:
+            query, message = NOTICES[version]
+            count = db.execute(query).fetchone()[0]
+            db.commit()
+            if count:
+                print(f"⚠️ {version}: " + message.format(count))
+    return applied
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    db_url = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("DATABASE_URL", DB_NAME)
+
+    if not storage.is_postgres_url(db_url) and not os.path.exists(storage.sqlite_path(db_url)):
+        print(f"❌ Database not found: {db_url}")
+        sys.exit(1)
+
+    conn = storage.connect(db_url)
+    try:
+        if command == "up":
+            applied = apply_migrations(conn)
+            for version in applied:
+                print(f"✅ Applied {version}")
+            if not applied:
+                print("Database is up to date.")
+        elif command == "status":
+            pending = pending_migrations(conn)
+            conn.commit()
+            for version in sorted(applied_versions(conn)):
+                print(f"   applied  {version}")
+            for version, _ in pending:
+                print(f"   pending  {version}")
+        else:
+            print("Usage: python migrate.py [status|up] [DATABASE_URL]")
+            sys.exit(2)
+    finally:
+        conn.close()
@@ -0,0 +1,9 @@
+-- Running totals maintained by the write routes (see fund_ledger.py)
+CREATE TABLE IF NOT EXISTS fund_summary (
+    id INTEGER PRIMARY KEY,
+    total_collections DOUBLE PRECISION DEFAULT 0,
+    total_repayments DOUBLE PRECISION DEFAULT 0,
+    total_loans_issued DOUBLE PRECISION DEFAULT 0,
+    total_interest_earned DOUBLE PRECISION DEFAULT 0,
+    updated_at TIMESTAMP
+);
@@ -0,0 +1,45 @@
+-- Secondary indexes for the filters and orderings used by the routes
+
+-- One contribution row per member per month. Older databases may hold
+-- duplicates: the paid row is kept if there is one, otherwise the newest.
+-- The others are payment records, so they are moved to
+-- contribution_duplicates (with the id of the row kept in their place)
+-- rather than deleted; migrate.py reports how many there were.
+CREATE TABLE IF NOT EXISTS contribution_duplicates (
+    id INTEGER PRIMARY KEY, -- its id in monthly_contributions
+    kept_id INTEGER NOT NULL, -- the row kept for the same member and month
+    member_id INTEGER,
+    month INTEGER,
+    year INTEGER,
+    amount INTEGER,
+    status TEXT,
+    paid_date TIMESTAMP,
+    moved_at TIMESTAMP NOT NULL
+);
+
+INSERT INTO contribution_duplicates (id, kept_id, member_id, month, year, amount, status, paid_date, moved_at)
+SELECT c.id, ranked.kept_id, c.member_id, c.month, c.year, c.amount, c.status, c.paid_date, CURRENT_TIMESTAMP
+FROM monthly_contributions c
+JOIN (
+    SELECT id, FIRST_VALUE(id) OVER (
+        PARTITION BY member_id, month, year
+        ORDER BY CASE WHEN status = 'paid' THEN 0 ELSE 1 END, id DESC
+    ) AS kept_id
+    FROM monthly_contributions
+) ranked ON ranked.id = c.id
+WHERE ranked.id <> ranked.kept_id;
+
+DELETE FROM monthly_contributions WHERE id IN (SELECT id FROM contribution_duplicates);
+-- Totals may have included the removed duplicates, rebuild on next read
+DELETE FROM fund_summary WHERE id = 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_contributions_member_period ON monthly_contributions(member_id, month, year);
+CREATE INDEX IF NOT EXISTS ix_contributions_period ON monthly_contributions(year, month);
+CREATE INDEX IF NOT EXISTS ix_interest_payments_loan_status ON interest_payments(loan_id, status);
+CREATE INDEX IF NOT EXISTS ix_interest_payments_paid_date ON interest_payments(paid_date);
+CREATE INDEX IF NOT EXISTS ix_loans_status ON loans(status, repayment_status);
+CREATE INDEX IF NOT EXISTS ix_loans_member ON loans(member_id);
+CREATE INDEX IF NOT EXISTS ix_loans_request_time ON loans(request_time);
+CREATE INDEX IF NOT EXISTS ix_payment_proofs_status ON payment_proofs(status, submission_date);
+CREATE INDEX IF NOT EXISTS ix_members_role ON members(role);
+CREATE INDEX IF NOT EXISTS ix_messages_timestamp ON messages(timestamp);
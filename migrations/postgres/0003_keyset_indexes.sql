@@ -0,0 +1,11 @@
+-- Composite (sort key, id) indexes for the keyset-paginated listings (pagination.py).
+-- They replace the single-column indexes, whose columns they lead with.
+
+DROP INDEX IF EXISTS ix_contributions_period;
+CREATE INDEX IF NOT EXISTS ix_contributions_period_id ON monthly_contributions(year, month, id);
+
+DROP INDEX IF EXISTS ix_interest_payments_paid_date;
+CREATE INDEX IF NOT EXISTS ix_interest_payments_paid_date_id ON interest_payments(paid_date, id);
+
+DROP INDEX IF EXISTS ix_messages_timestamp;
+CREATE INDEX IF NOT EXISTS ix_messages_timestamp_id ON messages(timestamp, id);
@@ -0,0 +1,17 @@
+-- Paid months per member and year, bit (month - 1) set when paid (contribution_masks.py)
+
+CREATE TABLE IF NOT EXISTS contribution_masks (
+    year INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    paid_mask INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (year, member_id)
+);
+CREATE INDEX IF NOT EXISTS ix_contribution_masks_member ON contribution_masks(member_id, year);
+
+-- One row per member and month is guaranteed since 0002, so the bits add up without overlap
+INSERT INTO contribution_masks (year, member_id, paid_mask)
+SELECT year, member_id, SUM(1 << (month - 1))
+FROM monthly_contributions
+WHERE status = 'paid' AND month BETWEEN 1 AND 12
+GROUP BY year, member_id
+ON CONFLICT (year, member_id) DO NOTHING;
@@ -0,0 +1,58 @@
+-- Append-only journal of every money event, with monthly snapshots of the replayed state (journal.py)
+
+CREATE TABLE IF NOT EXISTS journal (
+    seq BIGSERIAL PRIMARY KEY,
+    occurred_at TIMESTAMP NOT NULL,
+    kind TEXT NOT NULL, -- contribution, repayment, loan_issued, starting_fund
+    member_id INTEGER,
+    loan_id INTEGER,
+    ref_id INTEGER, -- the monthly_contributions / interest_payments row
+    amount DOUBLE PRECISION NOT NULL DEFAULT 0, -- signed change, e.g. -200 for a contribution unpaid or deleted
+    interest DOUBLE PRECISION NOT NULL DEFAULT 0, -- repayments: signed interest part
+    balance DOUBLE PRECISION -- loan remaining balance after the event; starting_fund: the new starting fund
+);
+CREATE INDEX IF NOT EXISTS ix_journal_occurred ON journal(occurred_at, seq);
+
+CREATE OR REPLACE FUNCTION journal_append_only() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'journal is append-only';
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS journal_append_only ON journal;
+CREATE TRIGGER journal_append_only BEFORE UPDATE OR DELETE ON journal
+FOR EACH ROW EXECUTE FUNCTION journal_append_only();
+
+CREATE TABLE IF NOT EXISTS journal_snapshots (
+    period_end TIMESTAMP PRIMARY KEY, -- first instant of the next month: the state of every event before it
+    last_seq BIGINT NOT NULL,
+    events INTEGER NOT NULL,
+    state TEXT NOT NULL, -- JSON, see journal.empty_state()
+    taken_at TIMESTAMP NOT NULL
+);
+
+-- Opening entries for the rows written before the journal existed. Loan
+-- balances are only known as of now: the last paid repayment of a loan
+-- carries its current remaining_balance.
+INSERT INTO journal (occurred_at, kind, member_id, loan_id, ref_id, amount, interest, balance)
+SELECT occurred_at, kind, member_id, loan_id, ref_id, amount, interest, balance FROM (
+    SELECT COALESCE((SELECT MIN(join_date) FROM members), LOCALTIMESTAMP(0)) AS occurred_at,
+           'starting_fund' AS kind, NULL::INTEGER AS member_id, NULL::INTEGER AS loan_id, NULL::INTEGER AS ref_id,
+           total_balance::DOUBLE PRECISION AS amount, 0::DOUBLE PRECISION AS interest, total_balance::DOUBLE PRECISION AS balance
+    FROM fund WHERE id = 1
+    UNION ALL
+    SELECT COALESCE(approved_time, request_time, LOCALTIMESTAMP(0)), 'loan_issued', member_id, loan_id, NULL, amount, 0,
+           CASE WHEN EXISTS (SELECT 1 FROM interest_payments p WHERE p.loan_id = loans.loan_id AND p.status = 'paid')
+                THEN amount ELSE remaining_balance END
+    FROM loans WHERE status IN ('approved', 'paid')
+    UNION ALL
+    SELECT COALESCE(c.paid_date, make_timestamp(c.year, c.month, 1, 0, 0, 0)), 'contribution', c.member_id, NULL, c.id,
+           c.amount, 0, NULL
+    FROM monthly_contributions c WHERE c.status = 'paid'
+    UNION ALL
+    SELECT COALESCE(p.paid_date, LOCALTIMESTAMP(0)), 'repayment', l.member_id, p.loan_id, p.id, p.amount,
+           COALESCE(GREATEST(l.amount - l.principal_portion * (p.month_no - 1), 0) * l.interest_rate_percent / 100.0, 0),
+           CASE WHEN p.id = (SELECT MAX(id) FROM interest_payments q WHERE q.loan_id = p.loan_id AND q.status = 'paid')
+                THEN l.remaining_balance END
+    FROM interest_payments p LEFT JOIN loans l ON l.loan_id = p.loan_id
+    WHERE p.status = 'paid'
+) AS opening ORDER BY occurred_at;
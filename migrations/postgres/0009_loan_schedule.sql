@@ -0,0 +1,40 @@
+-- Every approved loan's EMI schedule, reconciled with its payments (loan_schedule.py)
+CREATE TABLE IF NOT EXISTS loan_schedule (
+    loan_id INTEGER NOT NULL,
+    month_no INTEGER NOT NULL,
+    due_date DATE NOT NULL,
+    principal DOUBLE PRECISION NOT NULL,
+    interest DOUBLE PRECISION NOT NULL,
+    emi DOUBLE PRECISION NOT NULL,
+    expected_balance DOUBLE PRECISION NOT NULL, -- remaining principal once this EMI is paid
+    paid_amount DOUBLE PRECISION NOT NULL DEFAULT 0,
+    paid_date TIMESTAMP,
+    status TEXT NOT NULL DEFAULT 'due', -- due, paid, closed (loan repaid early)
+    PRIMARY KEY (loan_id, month_no)
+);
+CREATE INDEX IF NOT EXISTS ix_loan_schedule_status_due ON loan_schedule(status, due_date, loan_id);
+
+-- Schedules of the loans approved before this table existed. Month n is due
+-- on the approval day n months later, clamped to the end of shorter months.
+INSERT INTO loan_schedule (loan_id, month_no, due_date, principal, interest, emi, expected_balance,
+                           paid_amount, paid_date, status)
+SELECT s.loan_id, s.month_no, s.due_date, s.principal, s.interest, s.principal + s.interest, s.expected_balance,
+       COALESCE(p.paid_amount, 0), p.paid_date,
+       CASE WHEN p.loan_id IS NOT NULL THEN 'paid' WHEN s.repayment_status = 'closed' THEN 'closed' ELSE 'due' END
+FROM (
+    -- timestamp + interval '1 month' already stays inside shorter months
+    SELECT l.loan_id, n.month_no, l.repayment_status,
+           (COALESCE(l.approved_time, l.request_time) + n.month_no * INTERVAL '1 month')::DATE AS due_date,
+           l.amount::DOUBLE PRECISION / l.total_months AS principal,
+           GREATEST(l.amount - l.amount::DOUBLE PRECISION / l.total_months * (n.month_no - 1), 0)
+               * l.interest_rate_percent / 100.0 AS interest,
+           GREATEST(l.amount - l.amount::DOUBLE PRECISION / l.total_months * n.month_no, 0) AS expected_balance
+    FROM loans l CROSS JOIN LATERAL generate_series(1, l.total_months) AS n(month_no)
+    WHERE l.status IN ('approved', 'paid') AND COALESCE(l.approved_time, l.request_time) IS NOT NULL
+) s
+LEFT JOIN (
+    SELECT loan_id, month_no, SUM(amount) AS paid_amount, MAX(paid_date) AS paid_date
+    FROM interest_payments WHERE status = 'paid'
+    GROUP BY loan_id, month_no
+) p ON p.loan_id = s.loan_id AND p.month_no = s.month_no
+ON CONFLICT (loan_id, month_no) DO NOTHING;
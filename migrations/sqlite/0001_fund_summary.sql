@@ -0,0 +1,9 @@
+-- Running totals maintained by the write routes (see fund_ledger.py)
+CREATE TABLE IF NOT EXISTS fund_summary (
+    id INTEGER PRIMARY KEY,
+    total_collections REAL DEFAULT 0,
+    total_repayments REAL DEFAULT 0,
+    total_loans_issued REAL DEFAULT 0,
+    total_interest_earned REAL DEFAULT 0,
+    updated_at TEXT
+);
@@ -0,0 +1,22 @@
+-- Background job queue (jobs.py). Times are Unix timestamps (seconds).
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'queued', -- queued, running, succeeded, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after REAL NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    worker TEXT,
+    result TEXT,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_after ON jobs(status, run_after, id);
+CREATE INDEX IF NOT EXISTS ix_jobs_created ON jobs(created_at, id);
+CREATE INDEX IF NOT EXISTS ix_jobs_finished ON jobs(finished_at);
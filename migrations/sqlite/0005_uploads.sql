@@ -0,0 +1,10 @@
+-- Content-addressed payment proof screenshots (uploads.py)
+
+CREATE TABLE IF NOT EXISTS uploads (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size_bytes INTEGER NOT NULL,
+    content_type TEXT,
+    thumbnail_path TEXT,
+    created_at TEXT
+);
@@ -0,0 +1,6 @@
+-- Change counters behind the API ETags, one row per cache.py tag (data_versions.py)
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    scope TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
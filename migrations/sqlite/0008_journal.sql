@@ -0,0 +1,54 @@
+-- Append-only journal of every money event, with monthly snapshots of the replayed state (journal.py)
+
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    occurred_at TEXT NOT NULL,
+    kind TEXT NOT NULL, -- contribution, repayment, loan_issued, starting_fund
+    member_id INTEGER,
+    loan_id INTEGER,
+    ref_id INTEGER, -- the monthly_contributions / interest_payments row
+    amount REAL NOT NULL DEFAULT 0, -- signed change, e.g. -200 for a contribution unpaid or deleted
+    interest REAL NOT NULL DEFAULT 0, -- repayments: signed interest part
+    balance REAL -- loan remaining balance after the event; starting_fund: the new starting fund
+);
+CREATE INDEX IF NOT EXISTS ix_journal_occurred ON journal(occurred_at, seq);
+
+CREATE TRIGGER IF NOT EXISTS journal_no_update BEFORE UPDATE ON journal
+BEGIN SELECT RAISE(ABORT, 'journal is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS journal_no_delete BEFORE DELETE ON journal
+BEGIN SELECT RAISE(ABORT, 'journal is append-only'); END;
+
+CREATE TABLE IF NOT EXISTS journal_snapshots (
+    period_end TEXT PRIMARY KEY, -- first instant of the next month: the state of every event before it
+    last_seq INTEGER NOT NULL,
+    events INTEGER NOT NULL,
+    state TEXT NOT NULL, -- JSON, see journal.empty_state()
+    taken_at TEXT NOT NULL
+);
+
+-- Opening entries for the rows written before the journal existed. Loan
+-- balances are only known as of now: the last paid repayment of a loan
+-- carries its current remaining_balance.
+INSERT INTO journal (occurred_at, kind, member_id, loan_id, ref_id, amount, interest, balance)
+SELECT occurred_at, kind, member_id, loan_id, ref_id, amount, interest, balance FROM (
+    SELECT COALESCE((SELECT MIN(join_date) FROM members), datetime('now', 'localtime')) AS occurred_at,
+           'starting_fund' AS kind, NULL AS member_id, NULL AS loan_id, NULL AS ref_id,
+           total_balance AS amount, 0 AS interest, total_balance AS balance
+    FROM fund WHERE id = 1
+    UNION ALL
+    SELECT COALESCE(approved_time, request_time, datetime('now', 'localtime')), 'loan_issued', member_id, loan_id, NULL, amount, 0,
+           CASE WHEN EXISTS (SELECT 1 FROM interest_payments p WHERE p.loan_id = loans.loan_id AND p.status = 'paid')
+                THEN amount ELSE remaining_balance END
+    FROM loans WHERE status IN ('approved', 'paid')
+    UNION ALL
+    SELECT COALESCE(c.paid_date, printf('%04d-%02d-01 00:00:00', c.year, c.month)), 'contribution', c.member_id, NULL, c.id,
+           c.amount, 0, NULL
+    FROM monthly_contributions c WHERE c.status = 'paid'
+    UNION ALL
+    SELECT COALESCE(p.paid_date, datetime('now', 'localtime')), 'repayment', l.member_id, p.loan_id, p.id, p.amount,
+           COALESCE(MAX(l.amount - l.principal_portion * (CAST(p.month_no AS INTEGER) - 1), 0) * l.interest_rate_percent / 100.0, 0),
+           CASE WHEN p.id = (SELECT MAX(id) FROM interest_payments q WHERE q.loan_id = p.loan_id AND q.status = 'paid')
+                THEN l.remaining_balance END
+    FROM interest_payments p LEFT JOIN loans l ON l.loan_id = p.loan_id
+    WHERE p.status = 'paid'
+) ORDER BY occurred_at;
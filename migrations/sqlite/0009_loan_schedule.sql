@@ -0,0 +1,50 @@
+-- Every approved loan's EMI schedule, reconciled with its payments (loan_schedule.py)
+CREATE TABLE IF NOT EXISTS loan_schedule (
+    loan_id INTEGER NOT NULL,
+    month_no INTEGER NOT NULL,
+    due_date TEXT NOT NULL, -- YYYY-MM-DD
+    principal REAL NOT NULL,
+    interest REAL NOT NULL,
+    emi REAL NOT NULL,
+    expected_balance REAL NOT NULL, -- remaining principal once this EMI is paid
+    paid_amount REAL NOT NULL DEFAULT 0,
+    paid_date TEXT,
+    status TEXT NOT NULL DEFAULT 'due', -- due, paid, closed (loan repaid early)
+    PRIMARY KEY (loan_id, month_no)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_loan_schedule_status_due ON loan_schedule(status, due_date, loan_id);
+
+-- Schedules of the loans approved before this table existed. Month n is due
+-- on the approval day n months later, clamped to the end of shorter months.
+WITH RECURSIVE months(month_no) AS (
+    SELECT 1
+    UNION ALL
+    SELECT month_no + 1 FROM months WHERE month_no < (SELECT MAX(total_months) FROM loans)
+),
+schedule AS (
+    SELECT l.loan_id, n.month_no, l.repayment_status,
+           date(COALESCE(l.approved_time, l.request_time)) AS start,
+           CAST(strftime('%d', COALESCE(l.approved_time, l.request_time)) AS INTEGER) AS start_day,
+           l.amount * 1.0 / l.total_months AS principal,
+           max(l.amount - l.amount * 1.0 / l.total_months * (n.month_no - 1), 0) * l.interest_rate_percent / 100.0 AS interest,
+           max(l.amount - l.amount * 1.0 / l.total_months * n.month_no, 0) AS expected_balance
+    FROM loans l JOIN months n ON n.month_no <= l.total_months
+    WHERE l.status IN ('approved', 'paid') AND COALESCE(l.approved_time, l.request_time) IS NOT NULL
+),
+paid AS (
+    SELECT loan_id, month_no, SUM(amount) AS paid_amount, MAX(paid_date) AS paid_date
+    FROM interest_payments WHERE status = 'paid'
+    GROUP BY loan_id, month_no
+)
+INSERT INTO loan_schedule (loan_id, month_no, due_date, principal, interest, emi, expected_balance,
+                           paid_amount, paid_date, status)
+SELECT s.loan_id, s.month_no,
+       min(date(s.start, 'start of month', '+' || s.month_no || ' months', '+' || (s.start_day - 1) || ' days'),
+           date(s.start, 'start of month', '+' || (s.month_no + 1) || ' months', '-1 day')),
+       s.principal, s.interest, s.principal + s.interest, s.expected_balance,
+       COALESCE(p.paid_amount, 0), p.paid_date,
+       CASE WHEN p.loan_id IS NOT NULL THEN 'paid' WHEN s.repayment_status = 'closed' THEN 'closed' ELSE 'due' END
+FROM schedule s
+LEFT JOIN paid p ON p.loan_id = s.loan_id AND p.month_no = s.month_no
+WHERE true
+ON CONFLICT (loan_id, month_no) DO NOTHING;
@@ -0,0 +1,17 @@
+-- Rows changed by the write routes, read by the spreadsheet sync after its cursor (sync_manager.py)
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL, -- monthly_contributions or interest_payments
+    row_id INTEGER NOT NULL,
+    changed_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sync_cursors (
+    target TEXT PRIMARY KEY, -- workbook path or gsheet:<spreadsheet id>
+    last_seq INTEGER, -- every change up to here is in the target (NULL: never synced, copy everything)
+    synced_at TEXT,
+    leased_until REAL -- unix time; a sync of this target is running until then
+);
+
+-- MIN(last_seq) decides which changes every target has seen
+CREATE INDEX IF NOT EXISTS ix_sync_cursors_last_seq ON sync_cursors(last_seq);
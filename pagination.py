@@ -0,0 +1,113 @@
+"""
+Keyset pagination for the long admin listings and the chat.
+
+Pages are read newest first with `WHERE (key...) < (cursor...) ORDER BY key... DESC
+LIMIT n`, so every page costs the same index seek however much history there is
+(OFFSET would re-read every skipped row). Each ordering ends with the row id,
+which makes the key unique, and has a matching composite index
+(migrations/*/0003_keyset_indexes.sql):
+
+    contributions       (year, month, id)
+    interest payments   (paid_date, id)
+    messages            (timestamp, id)
+
+The cursor handed to the browser is the key of the last row shown, encoded as
+an opaque url-safe token.
+"""
+import base64
+import json
+import math
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# What a cursor value may be, per key type; anything else (lists, objects, null, a
+# string for a number) would reach the keyset comparison and fail there
+_CURSOR_TYPES = {int: (int,), float: (int, float), str: (str,)}
+_MAX_INT = 2 ** 63 - 1
+
+
+def page_size(args, default=DEFAULT_PAGE_SIZE):
+    """?limit= clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        limit = int(args.get("limit", default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _cursor_value(value, kind):
+    if isinstance(value, bool) or not isinstance(value, _CURSOR_TYPES[kind]):
+        return False
+    if isinstance(value, int):
+        return abs(value) <= _MAX_INT
+    return not isinstance(value, float) or math.isfinite(value)
+
+
+def decode_cursor(token, types):
+    """
+    Returns the key values of a cursor token (None for no token); raises
+    ValueError if malformed. `types` holds each key's type (int, float or str).
+    """
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if (not isinstance(values, list) or len(values) != len(types)
+            or not all(_cursor_value(value, kind) for value, kind in zip(values, types))):
+        raise ValueError("invalid cursor")
+    return values
+
+
+def keyset_page(db, sql, keys, cursor=None, limit=DEFAULT_PAGE_SIZE, where=None, params=()):
+    """
+    Runs `sql` (a SELECT without WHERE/ORDER BY) for one page, newest first.
+    `keys` are (column, row field, type) triples. Returns (rows, next cursor or None).
+    """
+    clauses, params = ([where] if where else []), list(params)
+    after = decode_cursor(cursor, [kind for _, _, kind in keys])
+    if after is not None:
+        columns = ", ".join(column for column, _, _ in keys)
+        clauses.append(f"({columns}) < ({', '.join(['?'] * len(keys))})")
+        params.extend(after)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY " + ", ".join(f"{column} DESC" for column, _, _ in keys) + " LIMIT ?"
+    params.append(limit + 1)
+
+    rows = db.execute(sql, params).fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([rows[-1][field] for _, field, _ in keys])
+
+
+def contributions_page(db, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    return keyset_page(db, """SELECT c.*, m.name
+                              FROM monthly_contributions c
+                              JOIN members m ON c.member_id = m.member_id""",
+                       [("c.year", "year", int), ("c.month", "month", int), ("c.id", "id", int)], cursor, limit)
+
+
+def interest_payments_page(db, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    # paid_date is always written with the payment, so no NULL keys to order around
+    return keyset_page(db, """SELECT p.*, m.name, l.amount AS loan_amount
+                              FROM interest_payments p
+                              JOIN loans l ON p.loan_id = l.loan_id
+                              JOIN members m ON l.member_id = m.member_id""",
+                       [("p.paid_date", "paid_date", str), ("p.id", "id", int)], cursor, limit)
+
+
+def messages_page(db, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Latest messages before `cursor`, returned oldest first for display."""
+    rows, next_cursor = keyset_page(db, """SELECT m.*, u.name
+                                           FROM messages m
+                                           JOIN members u ON m.member_id = u.member_id""",
+                                    [("m.timestamp", "timestamp", str), ("m.id", "id", int)], cursor, limit)
+    return rows[::-1], next_cursor
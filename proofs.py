@@ -0,0 +1,175 @@
+"""
+Payment proof review.
+
+The approval side effects (loan balance, interest_payments row, loan schedule,
+contribution upsert, fund ledger, sheet sync change log) live here so the
+review routes and the background job queue (jobs.py) apply exactly the same
+logic. Nothing in this module commits; the caller owns the transaction.
+
+review_batch() applies many approvals or rejections in one transaction.
+EMI proofs are applied loan by loan in month order, since each payment is
+priced on the balance the previous one left.
+"""
+from datetime import datetime
+
+import cache
+import contribution_masks
+import fund_ledger
+import loan_schedule
+import sync_manager
+
+MAX_BATCH = 1000
+_FETCH_CHUNK = 500  # stay under SQLite's bound-parameter limit
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def approve_proof(db, proof_id):
+    """Applies one pending proof. Returns a result dict; proofs no longer pending are skipped."""
+    proof = db.execute("SELECT * FROM payment_proofs WHERE proof_id=?", (proof_id,)).fetchone()
+    if not proof:
+        return {"proof_id": proof_id, "status": "skipped", "reason": "not found"}
+    return _approve(db, proof)
+
+
+def _approve(db, proof):
+    proof_id = proof['proof_id']
+    if proof['status'] != 'pending':
+        return {"proof_id": proof_id, "status": "skipped", "reason": f"already {proof['status']}"}
+    # Claim the proof first: if another reviewer got there in between, apply nothing
+    cur = db.execute("UPDATE payment_proofs SET status='approved', review_date=? WHERE proof_id=? AND status='pending'",
+                     (_now(), proof_id))
+    if cur.rowcount == 0:
+        return {"proof_id": proof_id, "status": "skipped", "reason": "no longer pending"}
+
+    if proof['proof_type'] == 'emi':
+        # Logic similar to update_interest
+        loan = db.execute("SELECT * FROM loans WHERE loan_id=?", (proof['loan_id'],)).fetchone()
+        if loan:
+            current_balance = loan['remaining_balance']
+            interest_rate = loan['interest_rate_percent']
+
+            # Interest for this payment (simplified assumption: payment covers full month interest)
+            interest_component = (current_balance * interest_rate) / 100
+            principal_component = proof['amount'] - interest_component
+
+            new_balance = current_balance - principal_component
+
+            status_update = "open"
+            if new_balance <= 1:
+                new_balance = 0
+                status_update = "closed"
+
+            # Update Loan
+            if status_update == "closed":
+                db.execute("UPDATE loans SET remaining_balance=?, repayment_status='closed', closed_time=? WHERE loan_id=?",
+                           (new_balance, _now(), proof['loan_id']))
+                loan_schedule.close(db, proof['loan_id'])
+            else:
+                db.execute("UPDATE loans SET remaining_balance=? WHERE loan_id=?",
+                           (new_balance, proof['loan_id']))
+
+        # Add to interest payments logs
+        payment_id = db.execute("INSERT INTO interest_payments (loan_id, month_no, amount, status, paid_date) VALUES (?,?,?,?,?) RETURNING id",
+                                (proof['loan_id'], proof['month_no'], proof['amount'], 'paid', _now())).fetchone()[0]
+        fund_ledger.record_repayment(db, loan, proof['month_no'], proof['amount'], payment_id=payment_id,
+                                     balance=new_balance if loan else None)
+        sync_manager.record_change(db, sync_manager.PAYMENTS, payment_id)
+        if loan:
+            loan_schedule.record_payment(db, loan, proof['month_no'])
+    elif proof['proof_type'] == 'contribution':
+        # Update/Insert contribution
+        existing = db.execute("SELECT id, status, amount FROM monthly_contributions WHERE member_id=? AND month=? AND year=?",
+                              (proof['member_id'], proof['month'], proof['year'])).fetchone()
+        if existing:
+            db.execute("UPDATE monthly_contributions SET status='paid', paid_date=? WHERE id=?",
+                       (_now(), existing['id']))
+            if existing['status'] != 'paid':
+                fund_ledger.record_contribution(db, existing['amount'], proof['member_id'], existing['id'])
+            sync_manager.record_change(db, sync_manager.CONTRIBUTIONS, existing['id'])
+        else:
+            contribution_id = db.execute("""INSERT INTO monthly_contributions (member_id, month, year, amount, status, paid_date)
+                                            VALUES (?,?,?,?,?,?) RETURNING id""",
+                                         (proof['member_id'], proof['month'], proof['year'], proof['amount'], 'paid', _now())).fetchone()[0]
+            fund_ledger.record_contribution(db, proof['amount'], proof['member_id'], contribution_id)
+            sync_manager.record_change(db, sync_manager.CONTRIBUTIONS, contribution_id)
+        if proof['year'] and proof['month']:
+            contribution_masks.record_paid(db, proof['member_id'], proof['year'], proof['month'])
+
+    result = {"proof_id": proof_id, "status": "approved", "proof_type": proof['proof_type'], "member_id": proof['member_id']}
+    if proof['proof_type'] == 'emi':
+        result["loan_id"] = proof['loan_id']
+    else:
+        result["year"] = proof['year']
+    return result
+
+
+def cache_tags(results):
+    """
+    Tags (see cache.py) of the data changed by these reviews: bump them in
+    data_versions before the commit, invalidate them in the page cache after.
+    """
+    tags = set()
+    for result in results:
+        if result["status"] == "rejected":
+            tags.add(cache.PROOFS)
+        if result["status"] != "approved":
+            continue
+        tags.update((cache.PROOFS, cache.FUND, cache.member_tag(result["member_id"])))
+        if result["proof_type"] == 'emi':
+            tags.add(cache.LOANS)
+        elif result["proof_type"] == 'contribution':
+            tags.add(cache.contributions_tag(result["year"]))
+    return tags
+
+
+def reject_proof(db, proof_id, admin_notes=""):
+    cur = db.execute("UPDATE payment_proofs SET status='rejected', review_date=?, admin_notes=? WHERE proof_id=? AND status='pending'",
+                     (_now(), admin_notes, proof_id))
+    if cur.rowcount == 0:
+        return {"proof_id": proof_id, "status": "skipped", "reason": "not pending"}
+    return {"proof_id": proof_id, "status": "rejected"}
+
+
+def _review_order(proof):
+    # EMIs grouped by loan in installment order, then contributions by period
+    if proof['proof_type'] == 'emi':
+        return (0, proof['loan_id'] or 0, proof['month_no'] or 0, 0, proof['proof_id'])
+    return (1, proof['member_id'] or 0, proof['year'] or 0, proof['month'] or 0, proof['proof_id'])
+
+
+def review_batch(db, proof_ids, action, admin_notes=""):
+    """
+    Approves or rejects `proof_ids` inside the caller's transaction.
+    Returns one result per requested id, in the order they were applied.
+    """
+    if action not in ("approve", "reject"):
+        raise ValueError("action must be approve or reject")
+    # A string would be iterated digit by digit ("12" -> proofs 1 and 2)
+    if not isinstance(proof_ids, (list, tuple)) or not all(
+            isinstance(proof_id, int) and not isinstance(proof_id, bool) for proof_id in proof_ids):
+        raise ValueError("proof_ids must be a list of integers")
+    proof_ids = list(dict.fromkeys(proof_ids))
+    if len(proof_ids) > MAX_BATCH:
+        raise ValueError(f"at most {MAX_BATCH} proofs per batch")
+
+    found = []
+    for i in range(0, len(proof_ids), _FETCH_CHUNK):
+        chunk = proof_ids[i:i + _FETCH_CHUNK]
+        found += db.execute(f"SELECT * FROM payment_proofs WHERE proof_id IN ({', '.join(['?'] * len(chunk))})",
+                            chunk).fetchall()
+    found.sort(key=_review_order)
+
+    seen = {proof['proof_id'] for proof in found}
+    results = [{"proof_id": proof_id, "status": "skipped", "reason": "not found"}
+               for proof_id in proof_ids if proof_id not in seen]
+    for proof in found:
+        if action == "approve":
+            results.append(_approve(db, proof))
+        elif proof['status'] != 'pending':
+            results.append({"proof_id": proof['proof_id'], "status": "skipped", "reason": f"already {proof['status']}"})
+        else:
+            results.append(reject_proof(db, proof['proof_id'], admin_notes))
+    return results
@@ -1,7 +1,17 @@
 from waitress import serve
-from app import app
+import logging
+import os
 import socket
 
+# Warnings from the app (slow queries, N+1 patterns, failed jobs) go to the console
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# Every open chat window keeps one thread streaming (/chat/stream), leave some for page requests
+THREADS = int(os.environ.get("WAITRESS_THREADS", 100))
+os.environ.setdefault("CHAT_MAX_STREAMS", str(THREADS - 20))
+
+from app import app
+
 # Get local IP
 hostname = socket.gethostname()
 local_ip = socket.gethostbyname(hostname)
@@ -10,4 +20,4 @@ print(f"✅ Starting Production Server...")
 print(f"🌍 Access locally: http://localhost:8080")
 print(f"📡 Access on network: http://{local_ip}:8080")
 
-serve(app, host='0.0.0.0', port=8080)
+serve(app, host='0.0.0.0', port=8080, threads=THREADS)
@@ -4,7 +4,7 @@ CREATE TABLE members (
     member_id SERIAL PRIMARY KEY,
     name TEXT NOT NULL,
     username TEXT UNIQUE NOT NULL,
-    password TEXT NOT NULL,
+    password TEXT NOT NULL, -- werkzeug hash, see auth.py
     role TEXT CHECK(role IN ('admin','member')) NOT NULL,
     status TEXT DEFAULT 'active', -- active, inactive
     join_date TIMESTAMP
@@ -52,6 +52,19 @@ CREATE TABLE monthly_contributions (
     paid_date TIMESTAMP
 );
 
+-- Duplicate contribution rows set aside by migration 0002 (see migrate.py)
+CREATE TABLE contribution_duplicates (
+    id INTEGER PRIMARY KEY, -- its id in monthly_contributions
+    kept_id INTEGER NOT NULL, -- the row kept for the same member and month
+    member_id INTEGER,
+    month INTEGER,
+    year INTEGER,
+    amount INTEGER,
+    status TEXT,
+    paid_date TIMESTAMP,
+    moved_at TIMESTAMP NOT NULL
+);
+
 CREATE TABLE payment_proofs (
     proof_id SERIAL PRIMARY KEY,
     proof_type TEXT DEFAULT 'emi', -- 'emi' or 'contribution'
@@ -74,3 +87,133 @@ CREATE TABLE messages (
     content TEXT NOT NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Running totals maintained by the write routes (see fund_ledger.py)
+CREATE TABLE fund_summary (
+    id INTEGER PRIMARY KEY,
+    total_collections DOUBLE PRECISION DEFAULT 0,
+    total_repayments DOUBLE PRECISION DEFAULT 0,
+    total_loans_issued DOUBLE PRECISION DEFAULT 0,
+    total_interest_earned DOUBLE PRECISION DEFAULT 0,
+    updated_at TIMESTAMP
+);
+
+-- Background job queue (see jobs.py)
+CREATE TABLE jobs (
+    id SERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'queued', -- queued, running, succeeded, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after DOUBLE PRECISION NOT NULL, -- queued: not before this time; running: when the worker's lease ends (see jobs.py)
+    created_at DOUBLE PRECISION NOT NULL,
+    started_at DOUBLE PRECISION,
+    finished_at DOUBLE PRECISION,
+    worker TEXT,
+    result TEXT,
+    error TEXT
+);
+
+-- Payment proof screenshots, stored by content (see uploads.py)
+CREATE TABLE uploads (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size_bytes INTEGER NOT NULL,
+    content_type TEXT,
+    thumbnail_path TEXT,
+    created_at TIMESTAMP
+);
+
+-- Paid months per member and year, bit (month - 1) set when paid (see contribution_masks.py)
+CREATE TABLE contribution_masks (
+    year INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    paid_mask INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (year, member_id)
+);
+
+-- Change counters behind the API ETags, one row per cache.py tag (see data_versions.py)
+CREATE TABLE data_versions (
+    scope TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+-- Append-only journal of every money event and its monthly snapshots (see journal.py)
+CREATE TABLE journal (
+    seq BIGSERIAL PRIMARY KEY,
+    occurred_at TIMESTAMP NOT NULL,
+    kind TEXT NOT NULL, -- contribution, repayment, loan_issued, starting_fund
+    member_id INTEGER,
+    loan_id INTEGER,
+    ref_id INTEGER, -- the monthly_contributions / interest_payments row
+    amount DOUBLE PRECISION NOT NULL DEFAULT 0, -- signed change, e.g. -200 for a contribution unpaid or deleted
+    interest DOUBLE PRECISION NOT NULL DEFAULT 0, -- repayments: signed interest part
+    balance DOUBLE PRECISION -- loan remaining balance after the event; starting_fund: the new starting fund
+);
+
+CREATE OR REPLACE FUNCTION journal_append_only() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'journal is append-only';
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER journal_append_only BEFORE UPDATE OR DELETE ON journal
+FOR EACH ROW EXECUTE FUNCTION journal_append_only();
+
+CREATE TABLE journal_snapshots (
+    period_end TIMESTAMP PRIMARY KEY, -- first instant of the next month: the state of every event before it
+    last_seq BIGINT NOT NULL,
+    events INTEGER NOT NULL,
+    state TEXT NOT NULL, -- JSON, see journal.empty_state()
+    taken_at TIMESTAMP NOT NULL
+);
+
+-- Every approved loan's EMI schedule, reconciled with its payments (see loan_schedule.py)
+CREATE TABLE loan_schedule (
+    loan_id INTEGER NOT NULL,
+    month_no INTEGER NOT NULL,
+    due_date DATE NOT NULL,
+    principal DOUBLE PRECISION NOT NULL,
+    interest DOUBLE PRECISION NOT NULL,
+    emi DOUBLE PRECISION NOT NULL,
+    expected_balance DOUBLE PRECISION NOT NULL, -- remaining principal once this EMI is paid
+    paid_amount DOUBLE PRECISION NOT NULL DEFAULT 0,
+    paid_date TIMESTAMP,
+    status TEXT NOT NULL DEFAULT 'due', -- due, paid, closed (loan repaid early)
+    PRIMARY KEY (loan_id, month_no)
+);
+
+-- Rows changed by the write routes, read by the spreadsheet sync after its cursor (see sync_manager.py)
+CREATE TABLE change_log (
+    seq BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL, -- monthly_contributions or interest_payments
+    row_id INTEGER NOT NULL,
+    changed_at TIMESTAMP NOT NULL
+);
+
+CREATE TABLE sync_cursors (
+    target TEXT PRIMARY KEY, -- workbook path or gsheet:<spreadsheet id>
+    last_seq BIGINT, -- every change up to here is in the target (NULL: never synced, copy everything)
+    synced_at TIMESTAMP,
+    leased_until DOUBLE PRECISION -- unix time; a sync of this target is running until then
+);
+
+-- Indexes (also applied to existing databases by migrations/*/0002 and later)
+CREATE UNIQUE INDEX ux_contributions_member_period ON monthly_contributions(member_id, month, year);
+CREATE INDEX ix_contributions_period_id ON monthly_contributions(year, month, id);
+CREATE INDEX ix_interest_payments_loan_status ON interest_payments(loan_id, status);
+CREATE INDEX ix_interest_payments_paid_date_id ON interest_payments(paid_date, id);
+CREATE INDEX ix_loans_status ON loans(status, repayment_status);
+CREATE INDEX ix_loans_member ON loans(member_id);
+CREATE INDEX ix_loans_request_time ON loans(request_time);
+CREATE INDEX ix_payment_proofs_status ON payment_proofs(status, submission_date);
+CREATE INDEX ix_members_role ON members(role);
+CREATE INDEX ix_messages_timestamp_id ON messages(timestamp, id);
+CREATE INDEX ix_jobs_status_run_after ON jobs(status, run_after, id);
+CREATE INDEX ix_jobs_created ON jobs(created_at, id);
+CREATE INDEX ix_jobs_finished ON jobs(finished_at);
+CREATE INDEX ix_contribution_masks_member ON contribution_masks(member_id, year);
+CREATE INDEX ix_journal_occurred ON journal(occurred_at, seq);
+CREATE INDEX ix_loan_schedule_status_due ON loan_schedule(status, due_date, loan_id);
+CREATE INDEX ix_sync_cursors_last_seq ON sync_cursors(last_seq);
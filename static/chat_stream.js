@@ -0,0 +1,64 @@
+// Live chat: new messages arrive over Server-Sent Events from /chat/stream
+// (see chat_broker.py) and the form posts without reloading the page.
+(function () {
+    const history = document.getElementById('chat-history');
+    const box = document.getElementById('chat-messages');
+    const form = document.getElementById('chat-form');
+    if (!history || !window.EventSource) return;
+    const userId = Number(history.dataset.userId);
+
+    function render(msg) {
+        if (history.querySelector('[data-message-id="' + msg.id + '"]')) return;
+        const mine = msg.member_id === userId;
+        const row = document.createElement('div');
+        row.dataset.messageId = msg.id;
+        row.style.marginBottom = '1rem';
+        row.style.textAlign = mine ? 'right' : 'left';
+
+        const meta = document.createElement('div');
+        meta.style.fontSize = '0.8rem';
+        meta.style.color = 'var(--text-muted)';
+        meta.textContent = msg.name + ' • ' + String(msg.timestamp).slice(11, 16);
+
+        const bubble = document.createElement('div');
+        bubble.style.cssText = 'display: inline-block; padding: 10px 15px; border-radius: 12px; color: white; max-width: 80%;';
+        bubble.style.background = mine ? 'var(--primary)' : 'rgba(255,255,255,0.1)';
+        bubble.textContent = msg.content;
+
+        row.appendChild(meta);
+        row.appendChild(bubble);
+        const atBottom = box.scrollHeight - box.scrollTop - box.clientHeight < 40;
+        history.appendChild(row);
+        if (atBottom || mine) box.scrollTop = box.scrollHeight;
+    }
+
+    // On reconnect the browser sends Last-Event-ID, so only missed messages are replayed
+    let lastId = history.dataset.after;
+    function connect() {
+        const source = new EventSource(history.dataset.stream + '?after=' + encodeURIComponent(lastId));
+        source.onmessage = function (event) {
+            lastId = Math.max(Number(lastId), Number(event.lastEventId));
+            render(JSON.parse(event.data));
+        };
+        source.addEventListener('reload', function () { window.location.reload(); });
+        source.onerror = function () {
+            // Refused (server busy): the browser gives up, so try again later
+            if (source.readyState === EventSource.CLOSED) setTimeout(connect, 30000);
+        };
+    }
+    connect();
+
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        const input = form.elements.content;
+        fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: { 'Accept': 'application/json' },
+            credentials: 'same-origin'
+        }).then(function (response) {
+            if (!response.ok) throw new Error(response.status);
+            input.value = '';
+        }).catch(function () { form.submit(); });
+    });
+})();
@@ -0,0 +1,36 @@
+// "Load more" buttons for the keyset-paginated listings (see pagination.py).
+// <button data-load-more="/url" data-cursor="..." data-target="element id"
+//         [data-insert="prepend"] [data-scroll="scrolling element id"]>
+// A fragment answered without X-Next-Cursor was the last one: the button goes (the Loan Tracker's
+// schedules load that way, in one piece).
+document.addEventListener('click', function (event) {
+    const button = event.target.closest('[data-load-more]');
+    if (!button) return;
+    button.disabled = true;
+
+    fetch(button.dataset.loadMore + '?cursor=' + encodeURIComponent(button.dataset.cursor), { credentials: 'same-origin' })
+        .then(function (response) {
+            if (!response.ok) throw new Error(response.status);
+            const next = response.headers.get('X-Next-Cursor');
+            return response.text().then(function (html) { return { html: html, next: next }; });
+        })
+        .then(function (page) {
+            const target = document.getElementById(button.dataset.target);
+            if (button.dataset.insert === 'prepend') {
+                // Older rows go on top; keep the visible rows where they were
+                const box = document.getElementById(button.dataset.scroll) || target;
+                const height = box.scrollHeight;
+                target.insertAdjacentHTML('afterbegin', page.html);
+                box.scrollTop += box.scrollHeight - height;
+            } else {
+                target.insertAdjacentHTML('beforeend', page.html);
+            }
+            if (page.next) {
+                button.dataset.cursor = page.next;
+                button.disabled = false;
+            } else {
+                button.remove();
+            }
+        })
+        .catch(function () { button.disabled = false; });
+});
@@ -0,0 +1,459 @@
+"""
+Spreadsheet copy of the contributions and loan payments, kept up to date from a change log.
+
+The write routes call record_change() for every monthly_contributions or
+interest_payments row they insert, update or delete, inside their own
+transaction. That appends (table, row id) to `change_log`. sync() runs on the
+job queue ("sheet_sync", every SHEET_SYNC_INTERVAL seconds, see app.py): it
+reads the changes after the target's cursor in `sync_cursors`, loads the
+current version of just those rows, and applies them to the target as one
+batch per sheet. A row that no longer exists is deleted from the sheet. The
+cursor only moves once the target has saved, so a failed sync is simply
+repeated. A target without a cursor (new, or its file is gone) gets a full
+copy first, as does a workbook re-saved in a form save() can't patch. A
+lease on the cursor row keeps two workers from syncing the same target at
+once.
+
+Targets are picked by SHEET_SYNC_TARGET:
+
+    finance_data.xlsx           local workbook (the default), changed rows rewritten by id
+    gsheet:<spreadsheet id>     Google Sheet via gspread and a service account (GOOGLE_CREDENTIALS)
+
+    python sync_manager.py sync [DATABASE_URL]
+    python sync_manager.py full [DATABASE_URL]      copy everything again
+    python sync_manager.py status [DATABASE_URL]    cursor and pending changes of every target
+    python sync_manager.py verify [DATABASE_URL]    compare a local workbook with the database
+"""
+import numbers
+import os
+import re
+import sys
+import time
+import zipfile
+from collections import namedtuple
+from datetime import datetime
+from itertools import zip_longest
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils import get_column_letter
+
+import migrate
+import storage
+
+try:
+    import gspread
+except ImportError:  # only needed for Google Sheet targets
+    gspread = None
+
+DB_NAME = "database.db"
+LOCAL_EXCEL_FILE = "finance_data.xlsx"
+TARGET = os.environ.get("SHEET_SYNC_TARGET", LOCAL_EXCEL_FILE)
+CREDENTIALS_FILE = os.environ.get("GOOGLE_CREDENTIALS", "credentials.json")
+GSHEET_PREFIX = "gsheet:"
+BATCH = 5000  # changes read per round
+LEASE_SECONDS = 600  # a sync that crashed holds its target at most this long
+_FETCH_CHUNK = 500  # stay under SQLite's bound-parameter limit
+# Any constant: PostgreSQL writers of change_log queue on it, so seq order is commit order
+_LOG_LOCK = 7021
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+CONTRIBUTIONS = "monthly_contributions"
+PAYMENTS = "interest_payments"
+
+Sheet = namedtuple("Sheet", "title headers query")
+
+SHEETS = {
+    CONTRIBUTIONS: Sheet("Contributions", ["id", "Member", "month", "year", "amount", "status", "paid_date"],
+                         """SELECT c.id, m.name, c.month, c.year, c.amount, c.status, c.paid_date
+                            FROM monthly_contributions c
+                            LEFT JOIN members m ON c.member_id = m.member_id"""),
+    PAYMENTS: Sheet("LoanPayments", ["id", "Member", "loan_id", "month_no", "amount", "paid_date"],
+                    """SELECT ip.id, m.name, ip.loan_id, ip.month_no, ip.amount, ip.paid_date
+                       FROM interest_payments ip
+                       LEFT JOIN loans l ON ip.loan_id = l.loan_id
+                       LEFT JOIN members m ON l.member_id = m.member_id"""),
+}
+ID_COLUMN = {CONTRIBUTIONS: "c.id", PAYMENTS: "ip.id"}
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def record_change(db, table, row_id):
+    """Row `row_id` of `table` (CONTRIBUTIONS or PAYMENTS) was inserted, updated or deleted. Does not commit."""
+    if db.dialect == "postgres":
+        db.execute("SELECT pg_advisory_xact_lock(?)", (_LOG_LOCK,))
+    db.execute("INSERT INTO change_log (table_name, row_id, changed_at) VALUES (?, ?, ?)", (table, row_id, _now()))
+
+
+# ---------- targets ----------
+class LayoutChanged(Exception):
+    """The workbook was saved by something else (e.g. Excel) and can't be patched; copy it again."""
+
+
+_ROW = re.compile(r"<row\b[^>]*>.*?</row>", re.S)
+_ROW_ID = re.compile(r'<row r="(\d+)"[^>]*><c r="A\d+"(?: t="n")?><v>([^<]*)</v>')
+_CELL_REF = re.compile(r'(<row r=")\d+|(<c r="[A-Z]+)\d+')
+
+
+def _row_xml(number, values):
+    cells = []
+    for column, value in enumerate(values, start=1):
+        ref = f"{get_column_letter(column)}{number}"
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            cells.append(f'<c r="{ref}" t="b"><v>{int(value)}</v></c>')
+        elif isinstance(value, numbers.Number):
+            cells.append(f'<c r="{ref}" t="n"><v>{value}</v></c>')
+        else:
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+class WorkbookTarget:
+    """
+    The local .xlsx stand-in. The changes of a sync are collected and save()
+    rewrites only the sheets they touch: rows are copied as they are stored in
+    the file (renumbered after a deletion), and just the changed ones are
+    encoded again, so a small change doesn't re-parse every cell.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.changes = {}  # title -> (headers, {id: row}, {deleted ids})
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def replace(self, sheets):
+        """Writes a new workbook from {title: (headers, rows)} (rows may be a generator)."""
+        book = Workbook(write_only=True)
+        for title, (headers, rows) in sheets.items():
+            ws = book.create_sheet(title)
+            ws.append(headers)
+            for row in rows:
+                ws.append(list(row))
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        # Saved under a temporary name so a reader never opens half a file
+        book.save(self.path + ".part")
+        os.replace(self.path + ".part", self.path)
+
+    def apply(self, title, headers, upserts, deletes):
+        _, pending, deleted = self.changes.setdefault(title, (headers, {}, set()))
+        for row_id, row in upserts.items():
+            pending[row_id] = row
+            deleted.discard(row_id)
+        for row_id in deletes:
+            pending.pop(row_id, None)
+            deleted.add(row_id)
+
+    def save(self):
+        """Writes the collected changes. Raises LayoutChanged for a workbook it didn't write."""
+        if not self.changes:
+            return
+        with zipfile.ZipFile(self.path) as source:
+            parts = self._sheet_parts(source)
+            missing = set(self.changes) - set(parts)
+            if missing:
+                raise LayoutChanged(f"no sheet {', '.join(sorted(missing))}")
+            patched = {parts[title]: self._patch(source.read(parts[title]).decode("utf-8"), *change)
+                       for title, change in self.changes.items()}
+            with zipfile.ZipFile(self.path + ".part", "w", zipfile.ZIP_DEFLATED) as out:
+                for info in source.infolist():
+                    out.writestr(info, patched[info.filename] if info.filename in patched
+                                 else source.read(info.filename))
+        os.replace(self.path + ".part", self.path)
+        self.changes = {}
+
+    @staticmethod
+    def _sheet_parts(source):
+        """{sheet title: worksheet part name} from the workbook's relationships."""
+        workbook = ElementTree.fromstring(source.read("xl/workbook.xml"))
+        rels = ElementTree.fromstring(source.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target").lstrip("/") for rel in rels}
+        parts = {}
+        for sheet in workbook.iter(f"{{{_MAIN_NS}}}sheet"):
+            target = targets[sheet.get(f"{{{_REL_NS}}}id")]
+            parts[sheet.get("name")] = target if target.startswith("xl/") else "xl/" + target
+        return parts
+
+    @staticmethod
+    def _patch(xml, headers, pending, deleted):
+        head, found, rest = xml.partition("<sheetData>")
+        body, closed, tail = rest.partition("</sheetData>")
+        if not found or not closed:
+            raise LayoutChanged("no sheetData")
+        pending = dict(pending)
+        rows = _ROW.findall(body)
+        if sum(map(len, rows)) != len(body):
+            raise LayoutChanged("rows in an unknown form")
+        out = rows[:1] or [_row_xml(1, headers)]
+        for chunk in rows[1:]:
+            match = _ROW_ID.match(chunk)
+            if not match:
+                raise LayoutChanged("a row without a numeric id in column A")
+            row_id = int(float(match.group(2)))
+            if row_id in deleted:
+                continue
+            number = len(out) + 1
+            if row_id in pending:
+                out.append(_row_xml(number, pending.pop(row_id)))
+            elif int(match.group(1)) == number:
+                out.append(chunk)
+            else:
+                out.append(_CELL_REF.sub(lambda m: f"{m.group(1) or m.group(2)}{number}", chunk))
+        for row in pending.values():
+            out.append(_row_xml(len(out) + 1, row))
+        return f"{head}<sheetData>{''.join(out)}</sheetData>{tail}".encode("utf-8")
+
+    def read(self, title):
+        """{id: row} of a sheet as saved on disk."""
+        book = load_workbook(self.path, read_only=True)
+        try:
+            if title not in book.sheetnames:
+                return {}
+            return {row[0]: tuple(row) for row in book[title].iter_rows(min_row=2, values_only=True)}
+        finally:
+            book.close()
+
+
+class GoogleSheetTarget:
+    """A Google Sheet: one read of column A per sheet, then batched cell updates, appends and deletes."""
+
+    def __init__(self, sheet_id, credentials=CREDENTIALS_FILE):
+        if gspread is None:
+            raise RuntimeError("Google Sheet targets need gspread (pip install gspread)")
+        self.book = gspread.service_account(filename=credentials).open_by_key(sheet_id)
+
+    def exists(self):
+        return True
+
+    def _worksheet(self, title, headers):
+        try:
+            return self.book.worksheet(title)
+        except gspread.WorksheetNotFound:
+            return self.book.add_worksheet(title=title, rows=1, cols=len(headers))
+
+    def replace(self, sheets):
+        for title, (headers, rows) in sheets.items():
+            ws = self._worksheet(title, headers)
+            ws.clear()
+            ws.append_rows([headers])
+            chunk = []
+            for row in rows:
+                chunk.append(_cells(row))
+                if len(chunk) == BATCH:
+                    ws.append_rows(chunk)
+                    chunk = []
+            if chunk:
+                ws.append_rows(chunk)
+
+    def apply(self, title, headers, upserts, deletes):
+        ws = self._worksheet(title, headers)
+        index = {value: number for number, value in enumerate(ws.col_values(1), start=1) if number > 1}
+        updates, appends = [], []
+        for row_id, row in upserts.items():
+            number = index.get(str(row_id))
+            if number is None:
+                appends.append(_cells(row))
+            else:
+                updates.append({"range": f"A{number}", "values": [_cells(row)]})
+        if updates:
+            ws.batch_update(updates)
+        if appends:
+            ws.append_rows(appends)
+        for number in sorted((index[str(row_id)] for row_id in deletes if str(row_id) in index), reverse=True):
+            ws.delete_rows(number)
+
+    def save(self):
+        pass  # every call above is already applied
+
+
+def _cells(row):
+    return ["" if value is None else value for value in row]
+
+
+def open_target(spec=None):
+    spec = spec or TARGET
+    if spec.startswith(GSHEET_PREFIX):
+        return GoogleSheetTarget(spec[len(GSHEET_PREFIX):])
+    return WorkbookTarget(spec)
+
+
+# ---------- syncing ----------
+def _cursor(db, target):
+    row = db.execute("SELECT last_seq FROM sync_cursors WHERE target = ?", (target,)).fetchone()
+    return row['last_seq'] if row else None
+
+
+def _claim(db, target):
+    """Takes the target's lease (and commits); False while another sync holds it."""
+    now = time.time()
+    db.execute("INSERT INTO sync_cursors (target) VALUES (?) ON CONFLICT (target) DO NOTHING", (target,))
+    cur = db.execute("""UPDATE sync_cursors SET leased_until = ?
+                        WHERE target = ? AND (leased_until IS NULL OR leased_until < ?)""",
+                     (now + LEASE_SECONDS, target, now))
+    db.commit()
+    return cur.rowcount == 1
+
+
+def _release(db, target):
+    db.rollback()
+    db.execute("UPDATE sync_cursors SET leased_until = NULL WHERE target = ?", (target,))
+    db.commit()
+
+
+def _save_cursor(db, target, last_seq):
+    db.execute("UPDATE sync_cursors SET last_seq = ?, synced_at = ? WHERE target = ?", (last_seq, _now(), target))
+    # Changes every target has seen are not needed any more
+    db.execute("DELETE FROM change_log WHERE seq <= (SELECT MIN(last_seq) FROM sync_cursors)")
+
+
+def _current_rows(db, table, row_ids):
+    """{id: row} of the rows that still exist, in the sheet's column order."""
+    sheet, rows = SHEETS[table], {}
+    row_ids = sorted(row_ids)
+    for start in range(0, len(row_ids), _FETCH_CHUNK):
+        chunk = row_ids[start:start + _FETCH_CHUNK]
+        query = f"{sheet.query} WHERE {ID_COLUMN[table]} IN ({', '.join('?' * len(chunk))})"
+        rows.update((row[0], tuple(row)) for row in db.execute(query, chunk))
+    return rows
+
+
+def _copy_all(db, target_spec, target):
+    # Read before the rows: a change made while copying is applied again by the next sync
+    last_seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+    counts = {}
+
+    def rows(table):
+        for row in db.stream(f"{SHEETS[table].query} ORDER BY {ID_COLUMN[table]}"):
+            counts[table] = counts.get(table, 0) + 1
+            yield tuple(row)
+    target.replace({sheet.title: (sheet.headers, rows(table)) for table, sheet in SHEETS.items()})
+    _save_cursor(db, target_spec, last_seq)
+    db.commit()
+    return {"target": target_spec, "full": True, "rows": sum(counts.values()), "cursor": last_seq}
+
+
+def sync(db, target_spec=None, full=False):
+    """
+    Applies the changes after the target's cursor, or copies every row when
+    `full` or the target has never been synced. Commits. Returns a summary
+    (with "skipped" when another sync of the target is running).
+    """
+    target_spec = target_spec or TARGET
+    if not _claim(db, target_spec):
+        return {"target": target_spec, "skipped": "another sync of this target is running"}
+    try:
+        target = open_target(target_spec)
+        cursor = _cursor(db, target_spec)
+        if full or cursor is None or not target.exists():
+            return _copy_all(db, target_spec, target)
+        try:
+            return _apply_changes(db, target_spec, target, cursor)
+        except LayoutChanged:
+            db.rollback()
+            return _copy_all(db, target_spec, open_target(target_spec))
+    finally:
+        _release(db, target_spec)
+
+
+def _apply_changes(db, target_spec, target, cursor):
+    changes = upserted = deleted = 0
+    while True:
+        batch = db.execute("SELECT seq, table_name, row_id FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+                           (cursor, BATCH)).fetchall()
+        if not batch:
+            break
+        changed = {}
+        for row in batch:
+            changed.setdefault(row['table_name'], set()).add(row['row_id'])
+        for table, row_ids in changed.items():
+            if table not in SHEETS:
+                continue
+            current = _current_rows(db, table, row_ids)
+            gone = row_ids - set(current)
+            target.apply(SHEETS[table].title, SHEETS[table].headers, current, gone)
+            upserted += len(current)
+            deleted += len(gone)
+        changes += len(batch)
+        cursor = batch[-1]['seq']
+    target.save()
+    _save_cursor(db, target_spec, cursor)
+    db.commit()
+    return {"target": target_spec, "full": False, "changes": changes, "upserted": upserted, "deleted": deleted,
+            "cursor": cursor}
+
+
+def _same(stored, current):
+    # Saved rows lose their trailing empty cells
+    return all((a or None) == (b or None) or (isinstance(b, float) and abs((a or 0) - b) < 0.005)
+               for a, b in zip_longest(stored, current))
+
+
+def verify(db, target_spec=None):
+    """
+    Returns a list of (sheet, id, in workbook, in database) for every row of a
+    local workbook target that differs from the database (changes not synced
+    yet included).
+    """
+    target = open_target(target_spec)
+    if not isinstance(target, WorkbookTarget):
+        raise ValueError("only local workbook targets can be verified")
+    mismatches = []
+    for table, sheet in SHEETS.items():
+        stored = target.read(sheet.title) if target.exists() else {}
+        current = {row[0]: tuple(row) for row in db.stream(f"{sheet.query} ORDER BY {ID_COLUMN[table]}")}
+        for row_id in sorted(set(stored) | set(current)):
+            if not _same(stored.get(row_id, ()), current.get(row_id, ())):
+                mismatches.append((sheet.title, row_id, stored.get(row_id), current.get(row_id)))
+    return mismatches
+
+
+def status(db):
+    """Every target's cursor, last sync and the changes still waiting for it."""
+    return [{"target": row['target'], "cursor": row['last_seq'], "synced_at": row['synced_at'],
+             "pending": db.execute("SELECT COUNT(*) FROM change_log WHERE seq > ?", (row['last_seq'] or 0,)).fetchone()[0]}
+            for row in db.execute("SELECT target, last_seq, synced_at FROM sync_cursors ORDER BY target").fetchall()]
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "sync"
+    db_url = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("DATABASE_URL", DB_NAME)
+
+    conn = storage.connect(db_url)
+    try:
+        migrate.apply_migrations(conn)
+        if command in ("sync", "full"):
+            result = sync(conn, full=command == "full")
+            if "skipped" in result:
+                print(f"⚠️ {result['target']}: {result['skipped']}")
+            elif result["full"]:
+                print(f"✅ {result['rows']} rows copied to {result['target']}")
+            else:
+                print(f"✅ {result['changes']} changes applied to {result['target']}: "
+                      f"{result['upserted']} rows written, {result['deleted']} deleted")
+        elif command == "verify":
+            mismatches = verify(conn)
+            if mismatches:
+                print(f"❌ {TARGET} differs from the database:")
+                for title, row_id, stored, current in mismatches[:20]:
+                    print(f"   {title} {row_id}: workbook={stored} database={current}")
+                sys.exit(1)
+            print(f"✅ {TARGET} matches the database.")
+        elif command == "status":
+            targets = status(conn)
+            for row in targets:
+                print(f"   {row['target']}: cursor {row['cursor']}, {row['pending']} pending, last sync {row['synced_at']}")
+            print(f"📄 {len(targets)} sync targets")
+        else:
+            print("Usage: python sync_manager.py [sync|full|status|verify] [DATABASE_URL]")
+            sys.exit(2)
+    finally:
+        conn.close()
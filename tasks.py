@@ -0,0 +1,103 @@
+"""
+Job handlers for the background queue (see jobs.py).
+
+    approve_proofs        {"proof_ids": [...]}            proof approvals, one transaction
+    export_transactions   {"format": "xlsx"|"zip", "filters": {...}, "dir": ...}   workbook into dir (default EXPORT_DIR)
+    backup                {"dir": ...}                     incremental SQLite snapshot into dir (default backup_db.BACKUP_DIR)
+    thumbnail             {"sha256": ...}                  review-page thumbnail of an uploaded screenshot
+    journal_snapshots     {}                               monthly balance snapshots not taken yet (journal.py)
+    sheet_sync            {"target": ...}                  changed rows into the spreadsheet (default sync_manager.TARGET)
+    bulk_import           {"path": ..., "kind": ...}       an uploaded .xlsx / .csv, one transaction (bulk_import.py)
+"""
+import os
+
+import backup_db
+import bulk_import
+import cache
+import data_versions
+import exports
+import jobs
+import journal
+import proofs
+import sync_manager
+import uploads
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "exports")
+IMPORT_DIR = os.environ.get("IMPORT_DIR", "imports")
+
+
+@jobs.handler("approve_proofs")
+def approve_proofs(db, payload, job):
+    results = proofs.review_batch(db, payload["proof_ids"], "approve")
+    tags = proofs.cache_tags(results)
+    data_versions.bump(db, *tags)
+    job["on_commit"].append(lambda: cache.for_db(db).invalidate(*tags))
+    return results
+
+
+def export_path(job):
+    extension = "zip" if job["payload"].get("format") == "zip" else "xlsx"
+    return os.path.join(job["payload"].get("dir", EXPORT_DIR), f"Transactions_job{job['id']}.{extension}")
+
+
+@jobs.handler("export_transactions")
+def export_transactions(db, payload, job):
+    filters = exports.parse_filters(payload.get("filters", {}))
+    path = export_path(job)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Written under a temporary name so a download never sees half a file
+    with open(path + ".part", "wb") as f:
+        if payload.get("format") == "zip":
+            for chunk in exports.stream_csv_zip(db, filters):
+                f.write(chunk)
+        else:
+            exports.write_xlsx(db, f, filters)
+    os.replace(path + ".part", path)
+    return {"file": os.path.basename(path), "bytes": os.path.getsize(path)}
+
+
+@jobs.handler("backup")
+def backup(db, payload, job):
+    if db.dialect != "sqlite":
+        raise RuntimeError("backups use the SQLite backup API, use pg_dump for PostgreSQL")
+    backup_dir = payload.get("dir", backup_db.BACKUP_DIR)
+    summary = backup_db.backup_database(db, backup_dir)
+    summary["pruned_snapshots"], summary["pruned_chunks"] = backup_db.prune(backup_dir)
+    return summary
+
+
+@jobs.handler("thumbnail")
+def thumbnail(db, payload, job):
+    upload = db.execute("SELECT path, thumbnail_path FROM uploads WHERE sha256=?", (payload["sha256"],)).fetchone()
+    if upload is None or upload['thumbnail_path']:
+        return {"thumbnail": upload['thumbnail_path'] if upload else None}
+    if uploads.Image is None:
+        return {"thumbnail": None, "reason": "Pillow is not installed"}
+    upload_dir = os.path.dirname(os.path.dirname(upload['path']))  # <upload_dir>/ab/<sha256>.<ext>
+    destination = uploads.thumbnail_path(upload_dir, payload["sha256"])
+    if not uploads.make_thumbnail(upload['path'], destination):
+        # Not decodable: retrying will not help, the review page shows the original
+        return {"thumbnail": None, "reason": "not a decodable image"}
+    db.execute("UPDATE uploads SET thumbnail_path=? WHERE sha256=?", (destination, payload["sha256"]))
+    return {"thumbnail": destination, "bytes": os.path.getsize(destination)}
+
+
+@jobs.handler("journal_snapshots")
+def journal_snapshots(db, payload, job):
+    return {"taken": journal.take_snapshots(db)}
+
+
+@jobs.handler("sheet_sync")
+def sheet_sync(db, payload, job):
+    return sync_manager.sync(db, payload.get("target"))
+
+
+@jobs.handler("bulk_import")
+def import_upload(db, payload, job):
+    path = payload["path"]
+    report, tags = bulk_import.import_file(db, path, payload.get("kind"))
+    job["on_commit"].append(lambda: cache.for_db(db).invalidate(*tags))
+    # Imported, so the upload is not needed any more (a failed import keeps it for the retry)
+    job["on_commit"].append(lambda: os.path.exists(path) and os.remove(path))
+    return report
@@ -0,0 +1,178 @@
+"""
+Payment proof screenshots, stored by content.
+
+save_upload() streams the upload to disk in chunks while hashing it and names
+the file after its SHA-256, so a screenshot uploaded twice is stored once:
+
+    static/uploads/payment_proofs/3f/3fa2...e1.jpg          original
+    static/uploads/payment_proofs/thumbs/3fa2...e1.jpg      thumbnail (JPEG, max 320 px)
+
+Each stored file has one row in `uploads`; payment_proofs.screenshot_path
+points at the original. Thumbnails are made off the request path by the
+`thumbnail` background job (tasks.py) and need Pillow. Without it the review
+page shows the originals.
+
+    python uploads.py dedupe [DATABASE_URL]   move existing screenshots into this layout
+"""
+import hashlib
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Only needed for thumbnails
+    Image = None
+
+UPLOAD_FOLDER = os.path.join("static", "uploads", "payment_proofs")
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 70
+
+# (magic bytes, extension, content type)
+_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+]
+_EXTENSIONS = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "gif": "image/gif"}
+
+
+def sniff(head, filename):
+    """(extension, content type) from the file's first bytes, else from its name."""
+    for magic, extension, content_type in _SIGNATURES:
+        if head.startswith(magic):
+            return extension, content_type
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else "bin"
+    extension = "jpg" if extension == "jpeg" else extension
+    return extension, _EXTENSIONS.get(extension, "application/octet-stream")
+
+
+def content_path(upload_dir, sha256, extension):
+    return os.path.join(upload_dir, sha256[:2], f"{sha256}.{extension}")
+
+
+def thumbnail_path(upload_dir, sha256):
+    return os.path.join(upload_dir, "thumbs", f"{sha256}.jpg")
+
+
+def _store(db, stream, filename, upload_dir):
+    os.makedirs(upload_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size, head = 0, b""
+    fd, partial = tempfile.mkstemp(dir=upload_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(head) < 16:
+                    head += chunk[:16]
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+        sha256 = digest.hexdigest()
+        extension, content_type = sniff(head, filename)
+        path = content_path(upload_dir, sha256, extension)
+        created = not os.path.exists(path)
+        if created:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    db.execute("""INSERT INTO uploads (sha256, path, size_bytes, content_type, created_at) VALUES (?, ?, ?, ?, ?)
+                  ON CONFLICT (sha256) DO NOTHING""",
+               (sha256, path, size, content_type, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    return {"sha256": sha256, "path": path, "size_bytes": size, "created": created}
+
+
+def save_upload(db, file, upload_dir=UPLOAD_FOLDER):
+    """
+    Stores a werkzeug FileStorage by content (does not commit). Returns
+    {"sha256", "path", "size_bytes", "created"}; created is False for a duplicate.
+    """
+    return _store(db, file.stream, file.filename or "", upload_dir)
+
+
+def make_thumbnail(source, destination):
+    """Writes a small JPEG of `source`. Returns False if it cannot be decoded as an image."""
+    try:
+        with Image.open(source) as img:
+            img.draft("RGB", THUMBNAIL_SIZE)  # JPEG: decode at a reduced scale straight away
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail(THUMBNAIL_SIZE)
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            partial = destination + ".part"
+            img.save(partial, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+            os.replace(partial, destination)
+    except (OSError, SyntaxError, ValueError):  # PIL reports undecodable files as these
+        return False
+    return True
+
+
+def dedupe(db, upload_dir=UPLOAD_FOLDER):
+    """Moves screenshots saved under their upload names into the content-addressed layout."""
+    moved, removed, old_bytes, stored_bytes = 0, 0, 0, 0
+    old_paths = set()
+    rows = db.execute("""SELECT p.proof_id, p.screenshot_path FROM payment_proofs p
+                         LEFT JOIN uploads u ON u.path = p.screenshot_path
+                         WHERE u.sha256 IS NULL""").fetchall()
+    for row in rows:
+        old = row['screenshot_path']
+        if not old or not os.path.exists(old):
+            continue
+        with open(old, "rb") as f:
+            upload = _store(db, f, old, upload_dir)
+        if upload['created']:
+            stored_bytes += upload['size_bytes']
+        db.execute("UPDATE payment_proofs SET screenshot_path=? WHERE proof_id=?", (upload['path'], row['proof_id']))
+        moved += 1
+        old_paths.add(old)
+    db.commit()
+
+    for old in old_paths:
+        old_bytes += os.path.getsize(old)
+        os.remove(old)
+        removed += 1
+    return {"proofs_moved": moved, "files_removed": removed, "bytes_freed": old_bytes - stored_bytes}
+
+
+if __name__ == "__main__":
+    import migrate
+    import storage
+
+    if len(sys.argv) < 2 or sys.argv[1] != "dedupe":
+        print("Usage: python uploads.py dedupe [DATABASE_URL]")
+        raise SystemExit(2)
+
+    url = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("DATABASE_URL", "database.db")
+    conn = storage.connect(url)
+    migrate.apply_migrations(conn)
+    report = dedupe(conn)
+    print(f"✅ {report['proofs_moved']} proofs moved, {report['files_removed']} files removed, "
+          f"{report['bytes_freed'] / 1024 / 1024:.1f} MB freed")
+
+    made = 0
+    if Image is not None:
+        for row in conn.execute("SELECT sha256, path FROM uploads WHERE thumbnail_path IS NULL").fetchall():
+            destination = thumbnail_path(UPLOAD_FOLDER, row['sha256'])
+            if make_thumbnail(row['path'], destination):
+                conn.execute("UPDATE uploads SET thumbnail_path=? WHERE sha256=?", (destination, row['sha256']))
+                made += 1
+        conn.commit()
+        print(f"🖼️ {made} thumbnails created")
+    else:
+        print("⚠️ Pillow is not installed, thumbnails skipped")
+    conn.close()
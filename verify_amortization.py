@@ -0,0 +1,82 @@
+"""
+Parity check: the vectorized engine in amortization.py must match the scalar
+calculate_dynamic_emi() in app.py to the paisa for every loan/month.
+"""
+import random
+
+import numpy as np
+
+from amortization import amortize, schedules
+from app import calculate_dynamic_emi
+
+PAISA = 0.005
+FIELDS = ("principal_component", "interest_component", "total_emi", "remaining_principal_start")
+
+
+def random_loans(count, seed=42):
+    rnd = random.Random(seed)
+    loans = []
+    for _ in range(count):
+        amount = rnd.choice([1000, 2500, 5000, 10000, 15000, 20000, 50000, 99999])
+        months = rnd.randint(1, 36)
+        rate = rnd.choice([0, 1, 1.5, 2, 3])
+        loans.append((amount, months, rate))
+    return loans
+
+
+def check_amortize(loans):
+    # Include months past the end of the term, where the scalar returns None
+    rows = [(a, n, r, m) for a, n, r in loans for m in range(1, n + 3)]
+    amount, months, rate, month_no = (list(col) for col in zip(*rows))
+    result = amortize(amount, months, rate, month_no)
+
+    failures = 0
+    for i, (a, n, r, m) in enumerate(rows):
+        expected = calculate_dynamic_emi(a, n, r, m)
+        if expected is None:
+            if result["active"][i] or result["total_emi"][i] != 0:
+                failures += 1
+                print(f"❌ {a}/{n}@{r}% month {m}: expected closed loan, got {result['total_emi'][i]}")
+            continue
+        for field in FIELDS:
+            if abs(expected[field] - result[field][i]) > PAISA:
+                failures += 1
+                print(f"❌ {a}/{n}@{r}% month {m} {field}: scalar={expected[field]} vector={result[field][i]}")
+    return len(rows), failures
+
+
+def check_schedules(loans):
+    amount, months, rate = (list(col) for col in zip(*loans))
+    result = schedules(amount, months, rate)
+
+    failures = 0
+    if result["loan_index"].size != sum(months):
+        print(f"❌ schedule has {result['loan_index'].size} rows, expected {sum(months)}")
+        return 0, 1
+    for i, loan_index in enumerate(result["loan_index"]):
+        a, n, r = loans[loan_index]
+        expected = calculate_dynamic_emi(a, n, r, int(result["month"][i]))
+        for field in FIELDS:
+            if abs(expected[field] - result[field][i]) > PAISA:
+                failures += 1
+                print(f"❌ schedule {a}/{n}@{r}% month {result['month'][i]} {field}")
+    # Every loan must be fully repaid at the end of its schedule
+    last_rows = np.cumsum(months) - 1
+    if np.any(result["remaining_principal_end"][last_rows] > PAISA):
+        failures += 1
+        print("❌ schedules do not end at zero principal")
+    return len(result["loan_index"]), failures
+
+
+if __name__ == "__main__":
+    loans = random_loans(2000)
+
+    checked, failures = check_amortize(loans)
+    print(f"amortize(): {checked} loan-months checked, {failures} mismatches")
+
+    checked_s, failures_s = check_schedules(loans)
+    print(f"schedules(): {checked_s} schedule rows checked, {failures_s} mismatches")
+
+    if failures or failures_s:
+        raise SystemExit(1)
+    print("✅ Vectorized engine matches calculate_dynamic_emi to the paisa.")
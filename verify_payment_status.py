@@ -16,6 +16,14 @@ def login_admin():
         print("❌ Admin Login Failed")
         return None
 
+def paid_months(session, member_id, year):
+    # JSON contribution matrix instead of scraping the tracking page
+    data = session.get(f"{BASE_URL}/api/v1/contributions/{year}").json()
+    for member in data["members"]:
+        if member["member_id"] == member_id:
+            return member["paid_months"]
+    return []
+
 def test_status_update(session):
     # 1. Test Pay
     print("\nTesting Payment Status Update (Pay)...")
@@ -27,10 +35,10 @@ def test_status_update(session):
     }
     
     # We expect a redirect to contribution_tracking
-    response = session.post(f"{BASE_URL}/update_contribution_status", data=pay_data, allow_redirects=True)
+    response = session.post(f"{BASE_URL}/update_contribution_status", data=pay_data, allow_redirects=False)
     
-    if response.status_code == 200 and "Yearly Matrix" in response.text:
-         print("✅ Payment Request Processed (Redirected to Tracking)")
+    if response.status_code == 302 and 12 in paid_months(session, 1, 2024):
+         print("✅ Payment Request Processed (month shows as paid)")
     else:
          print(f"❌ Payment Request Failed: Status {response.status_code}")
 
@@ -43,10 +51,10 @@ def test_status_update(session):
         "action": "unpay"
     }
     
-    response = session.post(f"{BASE_URL}/update_contribution_status", data=unpay_data, allow_redirects=True)
+    response = session.post(f"{BASE_URL}/update_contribution_status", data=unpay_data, allow_redirects=False)
     
-    if response.status_code == 200 and "Yearly Matrix" in response.text:
-         print("✅ Unpayment Request Processed (Redirected to Tracking)")
+    if response.status_code == 302 and 12 not in paid_months(session, 1, 2024):
+         print("✅ Unpayment Request Processed (month shows as pending)")
     else:
          print(f"❌ Unpayment Request Failed: Status {response.status_code}")
 
@@ -0,0 +1,183 @@
+"""
+EXPLAIN QUERY PLAN regression check.
+
+Builds a throwaway database from schema.sql + migrations, drives every route
+through app.test_client(), records each SQL statement the routes execute and
+fails if SQLite plans any of them as a full table scan. It also requests
+every route without logging in and fails if one outside PUBLIC_ROUTES answers.
+
+    python verify_query_plans.py
+"""
+import io
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+# Aliases of derived tables (subqueries), scanning those is expected
+DERIVED_TABLES = {"pc", "ranked", "CONSTANT ROW"}
+
+# Routes that answer without a login; every other one must redirect to it or refuse
+PUBLIC_ROUTES = {"/", "/init", "/login", "/logout", "/static/<path:filename>"}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def capture_connections():
+    """Patches sqlite3.connect so every statement the app runs is recorded."""
+    statements = []
+    real_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        conn = real_connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    sqlite3.connect = connect
+    return statements
+
+
+def drive_routes(client):
+    def login(username, password):
+        client.get("/logout")
+        client.post("/login", data={"username": username, "password": password})
+
+    login("admin", "admin123")
+    client.post("/add_member", data={"name": "Member One", "username": "one", "password": "pw"})
+    client.post("/add_member", data={"name": "Member Two", "username": "two", "password": "pw"})
+    client.post("/update_contribution_status", data={"member_id": 2, "month": 1, "year": 2025, "action": "pay"})
+    client.post("/update_contribution_status", data={"member_id": 3, "month": 1, "year": 2025, "action": "pay"})
+    client.post("/update_contribution_status", data={"member_id": 3, "month": 1, "year": 2025, "action": "unpay"})
+
+    login("one", "pw")
+    client.post("/request_loan", data={"amount": 10000, "months": 5})
+    client.post("/request_loan", data={"amount": 5000, "months": 5})
+    login("admin", "admin123")
+    client.get("/approve_loan/1")
+    client.get("/reject_loan/2")
+    client.post("/update_interest", data={"loan_id": 1, "month_no": 1, "amount": 2100})
+
+    login("one", "pw")
+    image = b"\x89PNG\r\n\x1a\n" + b"0" * 64
+    client.post("/submit_payment_proof", content_type="multipart/form-data",
+                data={"proof_type": "emi", "loan_id": 1, "month_no": 2, "amount_emi": 2080,
+                      "screenshot": (io.BytesIO(image), "emi.png")})
+    client.post("/submit_payment_proof", content_type="multipart/form-data",
+                data={"proof_type": "contribution", "month": 2, "year": 2025,
+                      "screenshot": (io.BytesIO(image), "contribution.png")})
+    client.post("/send_message", data={"content": "hello"})
+    client.post("/send_message", data={"content": "second"})
+    for url in ("/dashboard", "/loan_tracking", "/loan_tracking/1/schedule", "/submit_payment_proof", "/chat"):
+        client.get(url)
+
+    login("admin", "admin123")
+    for url in ("/dashboard", "/admin/loans", "/loan_tracking", "/loan_tracking/1/schedule",
+                "/contribution_tracking?year=2025",
+                "/admin/payment_proofs", "/admin/manage_payments", "/admin/export_transactions", "/chat",
+                "/admin/cache", "/admin/contributions/history?from=2024&to=2025",
+                "/admin/contributions/arrears?min_unpaid=1&from=2024", "/admin/loans/due",
+                "/admin/loans/due?month=2099-12", "/admin/loans?default_rate=50&shortfall=20&months=24"):
+        client.get(url)
+    # JSON API: repeating a request with its ETag is answered 304 from the version counters alone
+    for url in ("/api/v1/fund", "/api/v1/loans?status=approved", "/api/v1/loans/1",
+                "/api/v1/contributions/2025", "/api/v1/proofs/pending"):
+        etag = client.get(url).headers["ETag"]
+        if client.get(url, headers={"If-None-Match": etag}).status_code != 304:
+            raise AssertionError(f"{url}: unchanged data was not answered 304")
+    client.get("/admin/approve_payment_proof/1")
+    client.post("/admin/reject_payment_proof/2", data={"admin_notes": "blurry"})
+    client.post("/admin/payment_proofs/bulk", json={"proof_ids": [1, 2, 3], "action": "approve"})
+    # Keyset pages: a first slice, then the slice after its cursor
+    for url in ("/dashboard/contributions", "/admin/manage_payments/contributions",
+                "/admin/manage_payments/interest_payments", "/chat/messages"):
+        first = client.get(url, query_string={"limit": 1})
+        client.get(url, query_string={"limit": 1, "cursor": first.headers.get("X-Next-Cursor", "")})
+    # Live chat: the stream replays the messages after ?after= before it starts waiting
+    client.get("/chat/stream", query_string={"after": 1}, buffered=False).close()
+    client.post("/send_message", data={"content": "live"}, headers={"Accept": "application/json"})
+    export = client.post("/admin/jobs/export", data={"format": "zip", "start": "2025-01-01"}).get_json()
+    for url in (export["url"], export["url"] + "/download", "/admin/jobs", "/admin/jobs/metrics"):
+        client.get(url)
+    client.post("/admin/jobs/backup")
+    client.post("/admin/jobs/sheet_sync", headers={"Idempotency-Key": "verify-sheet-sync"})
+    # Instrumentation: Prometheus text, slowest statements, a short sampled profile
+    for url in ("/admin/metrics", "/admin/metrics/queries", "/admin/profile?seconds=0.05"):
+        client.get(url)
+    client.post("/admin/delete_interest/1")
+    client.post("/admin/delete_contribution/1")
+
+
+def open_routes(app):
+    """['METHOD url -> status'] of the routes outside PUBLIC_ROUTES that served an anonymous request."""
+    client = app.test_client()
+    served = []
+    for rule in app.url_map.iter_rules():
+        if rule.rule in PUBLIC_ROUTES:
+            continue
+        method = "GET" if "GET" in rule.methods else sorted(rule.methods - {"HEAD", "OPTIONS"})[0]
+        url = re.sub(r"<[^>]+>", "1", rule.rule)
+        try:
+            status = client.open(url, method=method).status_code
+        except Exception as e:  # the view itself ran (TESTING propagates its errors)
+            status = type(e).__name__
+        if not (isinstance(status, int) and (300 <= status < 400 or status in (401, 403))):
+            served.append(f"{method} {url} -> {status}")
+    return served
+
+
+def full_scans(conn, statement):
+    """Returns the plan lines of `statement` that scan a whole table."""
+    keyword = statement.lstrip().split(None, 1)[0].upper()
+    if keyword not in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+        return []
+    scans = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + statement):
+        detail = row[-1]
+        if not detail.startswith("SCAN ") or "INDEX" in detail or "PRIMARY KEY" in detail:
+            continue
+        target = detail[len("SCAN "):].split(" (")[0]
+        if target.endswith(" LEFT-JOIN"):  # newer SQLite marks the outer side of a LEFT JOIN
+            target = target[:-len(" LEFT-JOIN")]
+        if target.startswith("(subquery") or target in DERIVED_TABLES:
+            continue
+        scans.append(detail)
+    return scans
+
+
+if __name__ == "__main__":
+    work = tempfile.mkdtemp()
+    shutil.copy(os.path.join(HERE, "schema.sql"), work)
+    os.chdir(work)
+    sys.path.insert(0, HERE)
+
+    statements = capture_connections()
+    from app import app
+    app.config["TESTING"] = True
+    app.config["JOBS_INLINE"] = True  # background jobs run before each request returns
+    client = app.test_client()
+    client.get("/init")
+    unguarded = open_routes(app)
+    for route in unguarded:
+        print(f"❌ served without a login: {route}")
+    client.post("/login", data={"username": "admin", "password": "admin123"})
+    client.get("/dashboard")  # materialize fund_summary, its rebuild scans by design
+    client.post("/admin/jobs/sheet_sync")  # the first sync copies every row, later ones only the changes
+
+    del statements[:]
+    drive_routes(client)
+
+    conn = sqlite3.connect(os.path.join(work, "database.db"))
+    failures = 0
+    for statement in dict.fromkeys(statements):
+        for detail in full_scans(conn, statement):
+            failures += 1
+            print(f"❌ {detail}\n   {' '.join(statement.split())[:200]}")
+    conn.close()
+    shutil.rmtree(work, ignore_errors=True)
+
+    print(f"{len(set(statements))} distinct statements checked, {failures} full table scans")
+    if failures or unguarded:
+        raise SystemExit(1)
+    print("✅ No route query scans a full table, and no private route answers without a login.")